@@ -1,5 +1,3 @@
-raise RuntimeError("this module is deprecated. Anti-racing is neither complete, nor necessary (using django-concurrency instead, for optimistic locking)")
-
 from candb import *
 from candb.models import Profile, Product, Order, OrderLine
 from django.db import models  # Needs to be EXPLICITLY imported after candb.models because weird Python bullsh*t
@@ -48,6 +46,10 @@ OrderLine
 This module is designed to intelligently lock database rows to prevent race conditions from occuring.
 To ensure both security and performance, the module will predetermine the relationships between models and use a forward
 and backwards map to determine which rows to lock when a row is locked.
+
+Rows are always locked in the same global order (LOCK_ORDER, then primary key), so two transactions locking overlapping
+sets of rows cannot deadlock. Use it for multi-row work on hot rows (e.g. checkout), where optimistic locking
+(django-concurrency) would retry over and over; single-row edits are better served by candb.retry.
 """
 del __forwardsMapExample, __backwardsMapExample
 
@@ -85,7 +87,7 @@ def generateBackwards(model: models.Model, onlyInclude: Iterable[models.Model],
     Generate the backwards map for a model
     :param model: The model to generate the backwards map for
     :param onlyInclude: Only look for references to model in these models
-    :return: The backwards map
+    :return: The backwards map. remoteFieldName is the name of the foreign key on the referencing model.
     """
     fields = model._meta.get_fields()
     backwards = []
@@ -97,6 +99,7 @@ def generateBackwards(model: models.Model, onlyInclude: Iterable[models.Model],
                 continue
             backwards.append({
                 "fieldName": field.name,
+                "remoteFieldName": field.field.name,
                 "primaryKey": field.related_model._meta.pk.name,
                 "model": field.related_model,
             })
@@ -119,18 +122,133 @@ if __name__ == "__main__":
 generateMaps([Profile, Product, Order, OrderLine])
 
 
+LOCK_ORDER: tuple[type[models.Model], ...] = (Profile, Product, Order, OrderLine)  # Global order rows are locked in. Every model in the maps must be listed.
+
+
+class _PlanChanged(Exception):
+    pass
+
+
+@dataclass
+class LockSet:
+    """
+    Rows locked by lockRows or kidnapSelfAndBestie
+    """
+    root: models.Model | None  # The locked root row. None if it was skipped (skipLocked).
+    rows: dict[type[models.Model], dict[Any, models.Model]]  # {model: {primary key: locked instance}}
+    skipped: dict[type[models.Model], set[Any]]  # {model: primary keys that were already locked}. Only with skipLocked.
+
+    def __getitem__(self, model: type[models.Model]) -> dict[Any, models.Model]:
+        return self.rows.get(model, dict())
+
+    @property
+    def complete(self) -> bool:
+        """
+        If every planned row was locked
+        """
+        return not any(self.skipped.values())
+
+
+def planLocks(model: type[models.Model], pk: Any, backwards: Iterable[type[models.Model]] = None) -> dict[type[models.Model], set[Any]]:
+    """
+    Find the rows related to a root row that must be locked with it. Backward edges (rows referencing the root) are
+    followed from the root only; forward edges (rows referenced) are followed transitively from every planned row.
+    E.g. for an Order: its OrderLines, the Products of those lines and the Profile of the Order.
+    The rows are read without locking; lockRows checks the plan again once they are locked.
+    :param model: Model of the root row. Must be in FORWARD_MAP and BACKWARD_MAP.
+    :param pk: Primary key of the root row
+    :param backwards: Only follow backward edges to these models. If None, all of them. Following them from a Product or
+                        a Profile plans every OrderLine or Order that references it, so restrict them there.
+    :return: {model: primary keys}
+    """
+    if model not in FORWARD_MAP or model not in BACKWARD_MAP:
+        raise ValueError(f"{model.__name__} is not in the lock maps")
+    if backwards is not None:
+        backwards = set(backwards)
+    plan: dict[type[models.Model], set[Any]] = {model: {pk}}
+    pending: dict[type[models.Model], set[Any]] = {model: {pk}}
+    for edge in BACKWARD_MAP[model]:
+        if backwards is not None and edge["model"] not in backwards:
+            continue
+        referencing = set(edge["model"].objects.filter(**{edge["remoteFieldName"]: pk}).values_list("pk", flat=True))
+        pending.setdefault(edge["model"], set()).update(referencing - plan.setdefault(edge["model"], set()))
+        plan[edge["model"]].update(referencing)
+    while pending:
+        current, pks = pending.popitem()
+        edges = FORWARD_MAP[current]
+        if not pks or not edges:
+            continue
+        attnames = [current._meta.get_field(edge["fieldName"]).attname for edge in edges]
+        for referenced in current.objects.filter(pk__in=pks).values_list(*attnames):
+            for edge, value in zip(edges, referenced):
+                if value is not None and value not in plan.setdefault(edge["model"], set()):
+                    plan[edge["model"]].add(value)
+                    pending.setdefault(edge["model"], set()).add(value)
+    return plan
+
+
+def lockRows(plan: dict[type[models.Model], set[Any]], nowait: bool = False, skipLocked: bool = False) -> tuple[dict[type[models.Model], dict[Any, models.Model]], dict[type[models.Model], set[Any]]]:
+    """
+    Lock rows (SELECT ... FOR UPDATE) in the global order: by model in LOCK_ORDER, then by primary key. Must be called
+    in a transaction.
+    :param plan: {model: primary keys}, as from planLocks
+    :param nowait: Raise (django.db.OperationalError) instead of waiting for rows locked by another transaction
+    :param skipLocked: Skip rows locked by another transaction instead of waiting for them
+    :return: ({model: {primary key: locked instance}}, {model: skipped primary keys}). Rows deleted since they were
+                planned are neither locked nor skipped.
+    """
+    if nowait and skipLocked:
+        raise ValueError("nowait and skipLocked cannot both be used")
+    unordered = set(plan) - set(LOCK_ORDER)
+    if unordered:
+        raise ValueError(f"no lock order for {', '.join(sorted(model.__name__ for model in unordered))}")
+    locked, skipped = dict(), dict()
+    for model in LOCK_ORDER:
+        pks = plan.get(model)
+        if not pks:
+            continue
+        rows = model.objects.filter(pk__in=pks).order_by("pk").select_for_update(nowait=nowait, skip_locked=skipLocked, of=("self",))
+        locked[model] = {row.pk: row for row in rows}
+        if skipLocked:
+            existing = set(model.objects.filter(pk__in=pks - locked[model].keys()).values_list("pk", flat=True))
+            if existing:
+                skipped[model] = existing
+    return locked, skipped
+
+
 @contextmanager
-def kidnapSelfAndBestie[T: Any](model: models.Model, *args: T, **kwargs: T) -> models.QuerySet:
+def kidnapSelfAndBestie[T: Any](model: type[models.Model], *args: T, nowait: bool = False, skipLocked: bool = False,
+                                backwards: Iterable[type[models.Model]] = None, **kwargs: T) -> Iterable[LockSet]:
     """
     'Kidnap' a row from the database and its related rows
     (i.e. lock the row and its related rows.) :D (please don't call the AFP)
+    The rows are locked in the global order (see lockRows) for the whole of the with block, which runs in a transaction.
+    Nothing is saved automatically.
     :param model: root model. Must be in FORWARD_MAP AND BACKWARD_MAP.
     :param args: args to pass to model.objects.get
+    :param nowait: As in lockRows
+    :param skipLocked: As in lockRows. Check LockSet.complete (or LockSet.skipped) before using the rows.
+    :param backwards: As in planLocks
     :param kwargs: kwargs to pass to model.objects.get
-    :return: QuerySet of what model.objects.get(*args, **kwargs) returns.
+    :return: LockSet of the locked rows. LockSet.root is the locked row model.objects.get(*args, **kwargs) returns.
     """
+    backwards = None if backwards is None else tuple(backwards)
     with transaction.atomic():
-        modelInstance = models.objects.get(*args, **kwargs)
-        yield modelInstance
-        modelInstance.save()
-
+        pk = model.objects.values_list("pk", flat=True).get(*args, **kwargs)
+        plan = planLocks(model, pk, backwards)
+        while True:
+            try:
+                with transaction.atomic():
+                    locked, skipped = lockRows(plan, nowait, skipLocked)
+                    # Rows referencing the root may have been added or moved while planning. Once the planned rows are
+                    # locked, such changes need locks we hold, so the plan is stable if it is unchanged now.
+                    replanned = planLocks(model, pk, backwards)
+                    if not all(pks <= plan.get(m, set()) for m, pks in replanned.items()):
+                        raise _PlanChanged
+            except _PlanChanged:
+                # Locking the new rows now could break the global order: release every lock (savepoint) and start again
+                for m, pks in replanned.items():
+                    plan.setdefault(m, set()).update(pks)
+                continue
+            break
+        yield LockSet(locked.get(model, dict()).get(pk), locked, skipped)
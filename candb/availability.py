@@ -0,0 +1,333 @@
+"""
+Compiled availability index for Product.availability.
+
+Product.checkProductStock used to walk the whole availability configuration for every check, re-testing the type of each
+timerange. The index compiles the configuration once into:
+    - sorted interval tables for datetime and date timeranges (looked up with a binary search),
+    - a lookup table for weekday timeranges (one entry per weekday),
+    - the "default" configurations, which apply at any time,
+    - pre-resolved "reference" chains, so evaluating a configuration never follows references.
+Each lookup returns the applicable configurations in the same priority order as the availability configuration itself,
+so first-match and attemptUntilStockFound behave exactly as before.
+
+Indexes are cached in-process, keyed on (Product.id, Product._saveVersion). Since every save bumps the save version, a
+saved change to availability always compiles a new index. Unsaved, in-memory changes to availability are NOT seen by a
+cached index; save the product first (or call invalidate on the cache).
+"""
+
+from candb import *
+from candb import config as cfg
+from candb import common as _common
+from bisect import bisect_left
+from collections import OrderedDict
+from heapq import merge
+from typing import NamedTuple
+from django.db.backends.postgresql.psycopg_any import DateRange, DateTimeTZRange, NumericRange
+import threading
+
+
+class _Deferred:
+    """
+    Holds an exception raised while compiling a configuration, so it is only raised once that configuration is actually
+    evaluated (as checkProductStock would have done).
+    """
+    __slots__ = ("exception",)
+
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+    def throw(self) -> NoReturn:
+        raise self.exception
+
+
+class IndexedWindow(NamedTuple):
+    position: int  # Position in the availability configuration. Lower is higher priority.
+    availabilityID: int  # ID of the availability configuration
+    resolved: tuple[int, _common.StockConfiguration] | bool | _Deferred  # (terminal availability ID, stock configuration), False if unavailable
+
+    def evaluate(self, product: "candb.models.Product") -> _common.AvailabilityIndicator:
+        """
+        Get the stock available for this window
+        :param product: The product the window belongs to (used for model stock)
+        :return: stock available. If False, then stock is not available. If True, then stock is infinite. Otherwise,
+                    the stock available is returned.
+        """
+        if self.resolved is False:
+            return False
+        if isinstance(self.resolved, _Deferred):
+            self.resolved.throw()
+        return product._stockAvailableForStockConfig(self.resolved[1], self.resolved[0])
+
+
+def resolveReference(availability: _common.AvailabilityConfiguration, _id: int) -> tuple[int, _common.StockConfiguration] | bool | _Deferred:
+    """
+    Follow the "reference" chain of an availability configuration
+    :param availability: The full availability configuration
+    :param _id: ID of the availability configuration to resolve
+    :return: (terminal availability ID, terminal stock configuration), False if any configuration in the chain is
+                unavailable, or a deferred exception if the chain is invalid.
+    """
+    seen = set()
+    try:
+        config = availability[_id][1]
+        while True:
+            if not config["available"]:
+                return False
+            if "reference" not in config:
+                return _id, config
+            if _id in seen:
+                return _Deferred(ValueError(f"circular reference in availability configuration {_id}"))
+            seen.add(_id)
+            _id = config["reference"]
+            try:
+                config = availability[_id][1]
+            except KeyError as _e:
+                raise IndexError(f"availability ID {_id} not found") from _e
+    except Exception as _e:
+        return _Deferred(_e)
+
+
+class WindowKind:
+    Datetime = 0  # (datetime, datetime)
+    Date = 1  # (date, date)
+    Weekday = 2  # (int, int), 0 = Monday
+    Always = 3  # "default", and bad timeranges (which raise when reached)
+
+
+def compileWindows(availability: _common.AvailabilityConfiguration) -> list[tuple[int, Any, Any, IndexedWindow]]:
+    """
+    Classify and resolve each availability configuration, in priority order
+    :param availability: The availability configuration
+    :return: [(WindowKind, start, end, window)]. start and end are None for WindowKind.Always.
+    """
+    windows = list()
+    for position, (_id, (timerange, _config)) in enumerate(availability.items()):
+        if timerange == "default":
+            windows.append((WindowKind.Always, None, None, IndexedWindow(position, _id, resolveReference(availability, _id))))
+            continue
+        try:
+            start, end = timerange[0], timerange[1]
+        except (TypeError, IndexError, KeyError) as _e:
+            # Bad timeranges only raise once they are reached, as with checkProductStock
+            windows.append((WindowKind.Always, None, None, IndexedWindow(position, _id, _Deferred(_e))))
+            continue
+        if isinstance(start, datetime):
+            kind = WindowKind.Datetime
+        elif isinstance(start, date):
+            kind = WindowKind.Date
+        elif isinstance(start, int):
+            kind = WindowKind.Weekday
+        else:
+            windows.append((WindowKind.Always, None, None, IndexedWindow(position, _id, _Deferred(TypeError("bad type for timerange")))))
+            continue
+        windows.append((kind, start, end, IndexedWindow(position, _id, resolveReference(availability, _id))))
+    return windows
+
+
+_STOCK_CONFIGURATION_TYPES: dict[str, type] = {"available": bool, "reference": int, "useModelStock": bool, "infinite": bool,
+                                                "windowStock": bool, "physicalStock": int, "reservedStock": int}
+
+
+def validateAvailability(availability: _common.AvailabilityConfiguration) -> _common.AvailabilityConfiguration:
+    """
+    Validate an availability configuration and return its normalised form: sorted by availability ID (the order it is
+    loaded from the database in), with tuples for every timerange and window.
+    :param availability: The availability configuration
+    :return: The normalised availability configuration
+    """
+    if not isinstance(availability, dict):
+        raise TypeError("bad type for availability")
+    for _id in availability.keys():
+        if not isinstance(_id, int) or isinstance(_id, bool):
+            raise TypeError(f"bad type for availability ID {_id!r}")
+    normalised = dict()
+    for _id in sorted(availability.keys()):
+        try:
+            timerange, _config = availability[_id]
+        except (TypeError, ValueError) as _e:
+            raise TypeError(f"availability ID {_id} must be a (timerange, stockConfig) pair") from _e
+        if timerange != "default":
+            try:
+                start, end = timerange
+            except (TypeError, ValueError) as _e:
+                raise TypeError(f"bad timerange for availability ID {_id}") from _e
+            if isinstance(start, datetime) and isinstance(end, datetime):
+                if start.tzinfo is None or end.tzinfo is None:
+                    raise ValueError(f"timerange of availability ID {_id} must be timezone-aware")
+            elif isinstance(start, date) and isinstance(end, date) and not isinstance(start, datetime) and not isinstance(end, datetime):
+                pass
+            elif type(start) is int and type(end) is int:
+                if not (0 <= start <= 6 and 0 <= end <= 6):
+                    raise ValueError(f"weekdays of availability ID {_id} must be between 0 and 6")
+            else:
+                raise TypeError(f"bad type for timerange of availability ID {_id}")
+            if start > end:
+                raise ValueError(f"timerange of availability ID {_id} ends before it starts")
+            timerange = (start, end)
+        if not isinstance(_config, dict):
+            raise TypeError(f"bad type for stockConfig of availability ID {_id}")
+        if "available" not in _config:
+            raise ValueError(f"stockConfig of availability ID {_id} must specify available")
+        for key, value in _config.items():
+            if key not in _STOCK_CONFIGURATION_TYPES:
+                raise ValueError(f"unknown stockConfig key {key!r} in availability ID {_id}")
+            if not isinstance(value, _STOCK_CONFIGURATION_TYPES[key]) or (_STOCK_CONFIGURATION_TYPES[key] is int and isinstance(value, bool)):
+                raise TypeError(f"bad type for {key} in availability ID {_id}")
+        if _config.get("physicalStock", 0) < 0 or _config.get("reservedStock", 0) < 0:
+            raise ValueError(f"stock of availability ID {_id} must be non-negative")
+        if "physicalStock" in _config and _config.get("reservedStock", 0) > _config["physicalStock"]:
+            raise ValueError(f"reservedStock must be smaller or equal to physicalStock in availability ID {_id}")
+        normalised[_id] = (timerange, _config)
+    for _id in normalised:
+        resolved = resolveReference(normalised, _id)
+        if isinstance(resolved, _Deferred):
+            raise ValueError(f"bad reference in availability ID {_id}: {resolved.exception}")
+    return normalised
+
+
+def windowRows(availability: _common.AvailabilityConfiguration) -> list[dict[str, Any]]:
+    """
+    Normalise an availability configuration into ProductAvailabilityWindow field values (without linkedProduct).
+    Timeranges become inclusive ranges; a timerange that ends before it starts becomes an empty range, as it never applies.
+    "available" is whether the configuration (following references) is available at all; bad configurations are never available.
+    :param availability: The availability configuration
+    :return: [{field name: value}], in priority order
+    """
+    rows = list()
+    for kind, start, end, window in compileWindows(availability):
+        row = {"availabilityID": window.availabilityID, "priority": window.position, "available": isinstance(window.resolved, tuple),
+               "timeRange": None, "dateRange": None, "weekdayRange": None, "alwaysApplies": kind == WindowKind.Always}
+        try:
+            if kind == WindowKind.Datetime:
+                row["timeRange"] = DateTimeTZRange(start, end, "[]") if start <= end else DateTimeTZRange(empty=True)
+            elif kind == WindowKind.Date:
+                row["dateRange"] = DateRange(start, end, "[]") if start <= end else DateRange(empty=True)
+            elif kind == WindowKind.Weekday:
+                row["weekdayRange"] = NumericRange(start, end, "[]") if start <= end else NumericRange(empty=True)
+        except TypeError:
+            # Incomparable bounds: checkProductStock raises once this configuration is reached
+            row.update({"timeRange": None, "dateRange": None, "weekdayRange": None, "alwaysApplies": True, "available": False})
+        rows.append(row)
+    return rows
+
+
+class _IntervalTable:
+    """
+    Sorted interval table for inclusive timeranges of comparable values (datetimes or dates).
+    The boundaries of all timeranges split the value space into regions: each boundary point itself, and the open
+    intervals between boundaries. The applicable windows are precomputed for each region, so a lookup is one binary search.
+    """
+    __slots__ = ("boundaries", "regions")
+
+    def __init__(self, windows: list[tuple[Any, Any, IndexedWindow]]):
+        self.boundaries = sorted({point for start, end, _ in windows for point in (start, end)})
+        regions = list()
+        lower = None
+        for point in self.boundaries:
+            # Open interval between the previous boundary and this boundary
+            regions.append(tuple(w for start, end, w in windows if lower is not None and start <= lower and point <= end))
+            # This boundary
+            regions.append(tuple(w for start, end, w in windows if start <= point <= end))
+            lower = point
+        regions.append(tuple())  # Beyond the last boundary
+        self.regions = tuple(regions)
+
+    def lookup(self, value: Any) -> tuple[IndexedWindow, ...]:
+        """
+        Get the windows applicable to a value
+        :param value: Value to look up
+        :return: The applicable windows, in priority order
+        """
+        i = bisect_left(self.boundaries, value)
+        if i < len(self.boundaries) and self.boundaries[i] == value:
+            return self.regions[2 * i + 1]
+        return self.regions[2 * i]
+
+
+class AvailabilityIndex:
+    """
+    Compiled form of an availability configuration. See module documentation.
+    """
+    __slots__ = ("datetimes", "dates", "weekdays", "always", "windowStock")
+
+    def __init__(self, availability: _common.AvailabilityConfiguration):
+        windows = compileWindows(availability)
+        datetimes = [(start, end, w) for kind, start, end, w in windows if kind == WindowKind.Datetime]
+        dates = [(start, end, w) for kind, start, end, w in windows if kind == WindowKind.Date]
+        weekdays = [(start, end, w) for kind, start, end, w in windows if kind == WindowKind.Weekday]
+        self.datetimes = _IntervalTable(datetimes) if datetimes else None
+        self.dates = _IntervalTable(dates) if dates else None
+        self.weekdays = tuple(tuple(w for start, end, w in weekdays if start <= weekday <= end) for weekday in range(7)) if weekdays else None
+        self.always = tuple(w for kind, _, _, w in windows if kind == WindowKind.Always)
+        # If any configuration keeps its stock in per-window counters (ProductWindowStock)
+        self.windowStock = any(isinstance(_config, dict) and _config.get("windowStock") for _, _config in availability.values())
+
+    def applicable(self, time: datetime) -> Iterable[IndexedWindow]:
+        """
+        Get the windows applicable at a time
+        :param time: Time to check
+        :return: The applicable windows, in priority order
+        """
+        groups = list()
+        if self.datetimes is not None:
+            groups.append(self.datetimes.lookup(time))
+        if self.dates is not None:
+            groups.append(self.dates.lookup(time.date()))
+        if self.weekdays is not None:
+            groups.append(self.weekdays[time.weekday()])
+        groups.append(self.always)
+        groups = [group for group in groups if group]
+        if groups.__len__() <= 1:
+            return groups[0] if groups else tuple()
+        return merge(*groups)
+
+
+class AvailabilityIndexCache:
+    """
+    Thread-safe, in-process LRU cache of compiled availability indexes
+    """
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, int], AvailabilityIndex] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple[str, int], availability: _common.AvailabilityConfiguration | Callable[[], _common.AvailabilityConfiguration]) -> AvailabilityIndex:
+        """
+        Get the compiled index for a key, compiling it from availability if not cached
+        :param key: (Product.id, Product._saveVersion)
+        :param availability: The availability configuration to compile on a cache miss, or a function returning it
+        :return: The compiled index
+        """
+        with self._lock:
+            index = self._entries.get(key)
+            if index is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return index
+            self.misses += 1
+        if callable(availability):
+            availability = availability()
+        index = AvailabilityIndex(availability)  # Compiled outside the lock; a concurrent compile of the same key is harmless
+        with self._lock:
+            self._entries[key] = index
+            self._entries.move_to_end(key)
+            while self._entries.__len__() > self.maxsize:
+                self._entries.popitem(last=False)
+        return index
+
+    def invalidate(self, productID: str = None) -> None:
+        """
+        Remove cached indexes
+        :param productID: Only remove indexes of this product. If None, remove all indexes.
+        """
+        with self._lock:
+            if productID is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] == productID]:
+                del self._entries[key]
+
+
+AVAILABILITY_INDEX_CACHE = AvailabilityIndexCache(maxsize=cfg.Product.AVAILABILITY_INDEX_CACHE_SIZE)
@@ -0,0 +1,197 @@
+"""
+Availability calendar: which products are sellable in each slot of a time horizon (e.g., every 15 minutes for 14 days).
+
+Rather than calling Product.checkProductStock once per product per slot, every availability configuration of the whole
+catalog is turned into a boolean row over the slot grid, and the first applicable configuration of each product in each
+slot is found with one reduction. The result for each slot is the same as checkProductStock(quantityRequired,
+attemptUntilStockFound, overrideTime=<slot start>).
+"""
+
+from candb import *
+from candb import config as cfg
+from candb import common as _common
+from candb.availability import compileWindows, WindowKind
+from candb.models import Product
+import numpy as np
+
+
+_EPOCH: datetime = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND: timedelta = timedelta(microseconds=1)
+
+
+def _epochMicroseconds(time: datetime) -> int:
+    return (time - _EPOCH) // _MICROSECOND
+
+
+class SlotGrid:
+    """
+    Slot start times of a horizon, as the coordinates each kind of timerange is compared against
+    """
+    def __init__(self, start: datetime, horizon: timedelta, slotLength: timedelta):
+        if start.tzinfo is None:
+            raise ValueError("start must be timezone-aware")
+        if slotLength <= timedelta(0) or horizon <= timedelta(0):
+            raise ValueError("horizon and slotLength must be positive")
+        size = horizon // slotLength
+        if size > cfg.AvailabilityCalendar.MAXIMUM_SLOTS:
+            raise ValueError(f"too many slots ({size}); maximum is {cfg.AvailabilityCalendar.MAXIMUM_SLOTS}")
+        self.start = start
+        self.slotLength = slotLength
+        self.size = size
+        # Step in UTC so slots stay evenly spaced over daylight saving transitions, then read dates in the local timezone
+        startUTC = start.astimezone(timezone.utc)
+        epoch = _epochMicroseconds(startUTC) + np.arange(size, dtype=np.int64) * (slotLength // _MICROSECOND)
+        ordinals = np.fromiter(((startUTC + slotLength * i).astimezone(start.tzinfo).toordinal() for i in range(size)), dtype=np.int64, count=size)
+        self.coordinates: dict[int, np.ndarray] = {
+            WindowKind.Datetime: epoch,
+            WindowKind.Date: ordinals,
+            WindowKind.Weekday: (ordinals - 1) % 7,  # date.fromordinal(1) is a Monday
+            WindowKind.Always: np.zeros(size, dtype=np.int64),
+        }
+
+    @staticmethod
+    def bounds(kind: int, start: Any, end: Any) -> tuple[int, int]:
+        """
+        Convert a timerange to inclusive bounds in the coordinates of its kind
+        """
+        if kind == WindowKind.Datetime:
+            return _epochMicroseconds(start), _epochMicroseconds(end)
+        if kind == WindowKind.Date:
+            return start.toordinal(), end.toordinal()
+        if kind == WindowKind.Weekday:
+            return int(start), int(end)
+        return 0, 0
+
+    def slotTimes(self) -> list[datetime]:
+        return [(self.start.astimezone(timezone.utc) + self.slotLength * i).astimezone(self.start.tzinfo) for i in range(self.size)]
+
+
+@dataclass
+class AvailabilityCalendar:
+    productIDs: list[str]  # Product.publicID of each row
+    start: datetime
+    slotLength: timedelta
+    quantityRequired: int
+    sellable: np.ndarray  # bool (products, slots)
+    stock: np.ndarray  # int64 (products, slots). INFINITE_STOCK for infinite stock
+    availabilityID: np.ndarray  # int32 (products, slots). MODEL_STOCK_ID for model stock, NO_AVAILABILITY_ID if no configuration applies
+    errors: dict[str, str]  # {product ID: message} for configurations that raise when evaluated. Those slots are not sellable.
+
+    INFINITE_STOCK = -1
+    MODEL_STOCK_ID = -2
+    NO_AVAILABILITY_ID = -1
+
+    def asDict(self) -> dict:
+        """
+        Compact, JSON-serialisable form for the API and admin. Sellable slots are given as inclusive [first, last] runs
+        of slot numbers, where slot n starts at start + n * slotLength.
+        """
+        runs = dict()
+        for row, productID in enumerate(self.productIDs):
+            edges = np.flatnonzero(np.diff(np.concatenate(([False], self.sellable[row], [False])).astype(np.int8)))
+            runs[productID] = [[int(first), int(last) - 1] for first, last in zip(edges[::2], edges[1::2])]
+        return {
+            "start": self.start.isoformat(),
+            "slotMinutes": self.slotLength / timedelta(minutes=1),
+            "slots": int(self.sellable.shape[1]),
+            "quantityRequired": self.quantityRequired,
+            "sellable": runs,
+            "errors": self.errors,
+        }
+
+
+def _encodeStock(available: _common.AvailabilityIndicator) -> int:
+    if available is True:
+        return AvailabilityCalendar.INFINITE_STOCK
+    if available is False:
+        return 0
+    return available
+
+
+def buildAvailabilityCalendar(products: Iterable[Product] = None, start: datetime = None, horizon: timedelta = None,
+                              slotLength: timedelta = None, quantityRequired: int = 1,
+                              attemptUntilStockFound: bool = False) -> AvailabilityCalendar:
+    """
+    Build the availability calendar of a catalog
+    :param products: Products to include. If None, all products.
+    :param start: Start of the first slot. If None, now, rounded down to the slot length.
+    :param horizon: Length of the calendar. If None, cfg.AvailabilityCalendar.DEFAULT_HORIZON.
+    :param slotLength: Length of each slot. If None, cfg.AvailabilityCalendar.DEFAULT_SLOT_LENGTH.
+    :param quantityRequired: Quantity that must be sellable
+    :param attemptUntilStockFound: As in Product.checkProductStock
+    :return: The calendar
+    """
+    if horizon is None: horizon = cfg.AvailabilityCalendar.DEFAULT_HORIZON
+    if slotLength is None: slotLength = cfg.AvailabilityCalendar.DEFAULT_SLOT_LENGTH
+    if start is None:
+        now = datetime.now(tz=TZ_INFO)
+        start = now - (now - now.replace(hour=0, minute=0, second=0, microsecond=0)) % slotLength
+    products = list(Product.objects.all() if products is None else products)
+    Product._prefetchWindowStock(products)
+    grid = SlotGrid(start, horizon, slotLength)
+
+    shape = (products.__len__(), grid.size)
+    sellable = np.zeros(shape, dtype=bool)
+    stock = np.zeros(shape, dtype=np.int64)
+    availabilityID = np.full(shape, AvailabilityCalendar.NO_AVAILABILITY_ID, dtype=np.int32)
+    errors = dict()
+
+    # Flatten the windows of every product into one table, grouped by product in priority order
+    kinds, lows, highs, ids, stocks, sufficient = list(), list(), list(), list(), list(), list()
+    groupStarts, groupRows = list(), list()
+    for row, product in enumerate(products):
+        if product.availability is None:
+            available = product._modelStockAvailable()
+            sellable[row] = Product._compareStockQuantity(quantityRequired, available)
+            stock[row] = _encodeStock(available)
+            availabilityID[row] = AvailabilityCalendar.MODEL_STOCK_ID
+            continue
+        windows = compileWindows(product.availability)
+        if not windows:
+            continue
+        groupStarts.append(ids.__len__())
+        groupRows.append(row)
+        for kind, windowStart, windowEnd, window in windows:
+            try:
+                low, high = grid.bounds(kind, windowStart, windowEnd)
+                available = window.evaluate(product)
+            except Exception as _e:
+                # checkProductStock would raise once this configuration is reached: never sellable from there on
+                errors.setdefault(product.publicID, f"availability ID {window.availabilityID}: {_e}")
+                kind, (low, high), available = WindowKind.Always, (0, 0), False
+            kinds.append(kind)
+            lows.append(low)
+            highs.append(high)
+            ids.append(window.availabilityID)
+            stocks.append(_encodeStock(available))
+            sufficient.append(Product._compareStockQuantity(quantityRequired, available))
+    if not groupRows:
+        return AvailabilityCalendar([p.publicID for p in products], start, slotLength, quantityRequired, sellable, stock, availabilityID, errors)
+
+    count = ids.__len__()
+    kinds, lows, highs = np.array(kinds), np.array(lows, dtype=np.int64), np.array(highs, dtype=np.int64)
+    ids, stocks, sufficient = np.array(ids, dtype=np.int32), np.array(stocks, dtype=np.int64), np.array(sufficient, dtype=bool)
+
+    # applies[w, s]: window w applies at slot s
+    applies = np.empty((count, grid.size), dtype=bool)
+    for kind, coordinates in grid.coordinates.items():
+        rows = np.flatnonzero(kinds == kind)
+        if rows.size:
+            applies[rows] = (coordinates >= lows[rows, None]) & (coordinates <= highs[rows, None])
+
+    # First applicable window of each product in each slot: the lowest window number, or count if none applies
+    order = np.arange(count, dtype=np.int32)[:, None]
+    firstApplicable = np.minimum.reduceat(np.where(applies, order, count), groupStarts, axis=0)
+    if attemptUntilStockFound:
+        firstSufficient = np.minimum.reduceat(np.where(applies & sufficient[:, None], order, count), groupStarts, axis=0)
+        decided = np.where(firstSufficient < count, firstSufficient, firstApplicable)
+    else:
+        decided = firstApplicable
+    found = decided < count
+    decided = np.minimum(decided, count - 1)
+
+    groupRows = np.array(groupRows)
+    sellable[groupRows] = found & sufficient[decided]
+    stock[groupRows] = np.where(found, stocks[decided], 0)
+    availabilityID[groupRows] = np.where(found, ids[decided], AvailabilityCalendar.NO_AVAILABILITY_ID)
+    return AvailabilityCalendar([p.publicID for p in products], start, slotLength, quantityRequired, sellable, stock, availabilityID, errors)
@@ -2,6 +2,10 @@
 from json import JSONEncoder, JSONDecoder
 from datetime import datetime, date
 from typing import Union
+from dataclasses import dataclass
+from uuid import UUID
+import os
+import time
 
 
 class OrderLineStatus:
@@ -20,6 +24,14 @@ class OrderLineStatus:
 ORDERLINE_STATUS_AS_DICT = dict({k: v for k, v in OrderLineStatus.__dict__.items() if not k.startswith("__")})
 
 
+class BalanceEntryKind:
+    TopUp = "T"  # Balance added
+    Debit = "D"  # Balance spent (e.g., a payment)
+
+
+BALANCE_ENTRY_KIND_AS_DICT = dict({k: v for k, v in BalanceEntryKind.__dict__.items() if not k.startswith("__")})
+
+
 class DateTimeEncoder(JSONEncoder):
     def default(self, obj):
         if isinstance(obj, datetime):
@@ -39,10 +51,12 @@ class DateTimeDecoder(JSONDecoder):
             k: str  # JSON keys are always strings
             if k.isdigit():
                 # So, k: v
-                # where v = [[start, end], stockConfig] or v = ['__default__', stockConfig]
-                if isinstance(v[0][0], int):
+                # where v = [[start, end], stockConfig] or v = ['default', stockConfig]
+                if v[0] in ("default", "__default__"):
+                    v[0] = "default"
+                elif isinstance(v[0][0], int):
                     v[0] = tuple(v[0])
-                elif v[0] != "__default__":
+                else:
                     start, end = v[0]
                     if start[0] == "__datetime__":
                         start = datetime.fromisoformat(start[1])
@@ -59,14 +73,121 @@ class DateTimeDecoder(JSONDecoder):
         return new_obj
 
 
+class AvailabilityEncoder(JSONEncoder):
+    """
+    Encodes an availability configuration in its normalised, stored form: a list of windows sorted by availability ID,
+        [[id, kind, start, end, stockConfig], ...]
+    where kind is "T" (datetimes, as ISO strings), "D" (dates, as ordinals), "W" (weekdays) or "*" ("default", with
+    start and end null). This decodes with a single pass over the windows, instead of an object_hook on every object.
+    """
+    def encode(self, o):
+        if isinstance(o, dict):
+            o = encodeAvailability(o)
+        return super().encode(o)
+
+
+class AvailabilityDecoder(JSONDecoder):
+    """
+    Decodes an availability configuration stored by AvailabilityEncoder. The legacy DateTimeEncoder form is also accepted.
+    """
+    def decode(self, s, *args, **kwargs):
+        obj = super().decode(s, *args, **kwargs)
+        if isinstance(obj, list):
+            return decodeAvailability(obj)
+        if isinstance(obj, dict):
+            return DateTimeDecoder.object_hook(None, obj)
+        return obj
+
+
+def encodeAvailability(availability: dict) -> list[list]:
+    rows = list()
+    for _id, (timerange, _config) in sorted(availability.items(), key=lambda _: _[0]):
+        if timerange == "default":
+            rows.append([_id, "*", None, None, _config])
+            continue
+        start, end = timerange
+        if isinstance(start, datetime):
+            rows.append([_id, "T", start.isoformat(), end.isoformat(), _config])
+        elif isinstance(start, date):
+            rows.append([_id, "D", start.toordinal(), end.toordinal(), _config])
+        elif isinstance(start, int):
+            rows.append([_id, "W", start, end, _config])
+        else:
+            raise TypeError("bad type for timerange")
+    return rows
+
+
+def decodeAvailability(rows: list[list]) -> dict:
+    availability = dict()
+    for _id, kind, start, end, _config in rows:
+        if kind == "T":
+            availability[_id] = ((datetime.fromisoformat(start), datetime.fromisoformat(end)), _config)
+        elif kind == "D":
+            availability[_id] = ((date.fromordinal(start), date.fromordinal(end)), _config)
+        elif kind == "W":
+            availability[_id] = ((start, end), _config)
+        else:
+            availability[_id] = ("default", _config)
+    return availability
+
+
+def uuid7() -> UUID:
+    """
+    Time-ordered UUID (version 7, RFC 9562): 48 bits of Unix time in milliseconds, then 74 random bits.
+    IDs created later sort after earlier ones, so B-tree inserts land on the rightmost pages instead of random ones.
+    """
+    milliseconds = time.time_ns() // 1_000_000
+    randomBits = int.from_bytes(os.urandom(10))
+    return UUID(int=((milliseconds & 0xFFFF_FFFF_FFFF) << 80) | (0x7 << 76) | ((randomBits >> 68) << 64) | (0b10 << 62) | (randomBits & ((1 << 62) - 1)))
+
+
+def formatPrefixedID(prefix: str, value: UUID) -> str:
+    """
+    Format a primary key for the API boundary, e.g. ORDER-<uuid>
+    """
+    return f"{prefix}{value}"
+
+
+def parsePrefixedID(prefix: str, value: str | UUID) -> UUID:
+    """
+    Parse a primary key from the API boundary. Accepts the prefixed form, a bare UUID string, or a UUID.
+    """
+    if isinstance(value, UUID):
+        return value
+    if not isinstance(value, str):
+        raise TypeError("bad type for ID")
+    if value.startswith(prefix):
+        value = value[prefix.__len__():]
+    try:
+        return UUID(value)
+    except ValueError as _e:
+        raise ValueError(f"bad ID {prefix}{value}") from _e
+
+
 type StockConfiguration = dict[str: bool | int]
 type TimeRange = tuple[datetime, datetime] | tuple[date, date] | tuple[int, int]
 type AvailabilityConfiguration = dict[int: TimeRange | str, StockConfiguration]
 type AvailabilityIndicator = int | bool
 
 
+@dataclass
+class StockCheckResult:
+    productID: str  # ID of the product checked
+    quantityRequired: int  # Quantity that was checked for
+    available: bool  # If the product has enough stock
+    availabilityID: int | None  # ID of the availability configuration used. None means model stock, -1 means not set (e.g., product not found)
+    reason: str | None = None  # Why the check failed, when it could not be evaluated
+
+
 class NoTimerangeApplicable(Exception):
     pass
 
 class InsufficientFunds(Exception):
-    pass
+    def __init__(self, message: str, failed: set = None):
+        super().__init__(message)
+        self.failed = failed if failed else set()  # IDs of the profiles that could not be debited
+
+class InsufficientStock(Exception):
+    def __init__(self, message: str, failed: set = None):
+        super().__init__(message)
+        self.failed = failed if failed else set()  # Keys of the lines that could not be reserved
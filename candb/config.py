@@ -11,6 +11,7 @@ DEFAULT_PRICE_DECIMAL_DIGITS: int = 2  # Default decimal digits for cost
 DEFAULT_MAXIMUM_PRODUCT_TAGS: int = 64  # Default maximum number of tags for a product
 DEFAULT_MAXIMUM_PRODUCT_TAG_LENGTH: int = 64  # Default maximum length for each tags on a product
 DEFAULT_MAXIMUM_DESCRIPTION_LENGTH: int = 1024  # Default maximum length for description
+TIME_ORDERED_PRIMARY_KEYS: bool = True  # Create Order, OrderLine and Product IDs as time-ordered UUIDs (version 7). If False, random UUIDs (version 4).
 
 class Order:
     MAXIMUM_NOTES_LENGTH: int = DEFAULT_MAXIMUM_NOTES_LENGTH
@@ -26,9 +27,20 @@ class Product:
     MAXIMUM_PRODUCT_TAGS: int = DEFAULT_MAXIMUM_PRODUCT_TAGS
     MAXIMUM_PRODUCT_TAG_LENGTH: int = DEFAULT_MAXIMUM_PRODUCT_TAG_LENGTH
     MAXIMUM_DESCRIPTION_LENGTH: int = DEFAULT_MAXIMUM_DESCRIPTION_LENGTH
+    AVAILABILITY_INDEX_CACHE_SIZE: int = 4096  # Maximum number of compiled availability indexes kept in-process (LRU)
+
+class AvailabilityCalendar:
+    DEFAULT_HORIZON: timedelta = timedelta(days=14)  # Default length of an availability calendar
+    DEFAULT_SLOT_LENGTH: timedelta = timedelta(minutes=15)  # Default length of each calendar slot
+    MAXIMUM_SLOTS: int = 16384  # Maximum number of slots in one calendar (about 170 days of 15 minute slots)
 
 class OrderLine:
     DEFAULT_STATUS: str = _common.OrderLineStatus.Pending
+    # Statuses of order lines still being worked on: covered by a partial index (changing this needs a migration)
+    OPEN_STATUSES: tuple[str, ...] = (_common.OrderLineStatus.Pending, _common.OrderLineStatus.Open,
+                                      _common.OrderLineStatus.Waiting_for_Balance, _common.OrderLineStatus.Confirmed,
+                                      _common.OrderLineStatus.In_Production, _common.OrderLineStatus.Locked,
+                                      _common.OrderLineStatus.Standing_by_for_Stock)
     MAXIMUM_NOTES_LENGTH: int = DEFAULT_MAXIMUM_NOTES_LENGTH
     MAXIMUM_COST_DIGITS: int = DEFAULT_MAXIMUM_PRICE_DIGITS
     COST_DECIMAL_DIGITS: int = DEFAULT_PRICE_DECIMAL_DIGITS
@@ -50,3 +62,13 @@ class Profile:
     BALANCE_DECIMAL_DIGITS: int = DEFAULT_PRICE_DECIMAL_DIGITS  # Decimal digits for balance
     MAXIMUM_ADMIN_NOTES_LENGTH: int = DEFAULT_MAXIMUM_NOTES_LENGTH  # Maximum length for admin notes
 
+
+class BalanceLedger:
+    MAXIMUM_REFERENCE_LENGTH: int = DEFAULT_MAXIMUM_NAME_LENGTH  # Maximum length of a ledger entry reference
+
+
+class Retry:
+    MAXIMUM_ATTEMPTS: int = 5  # Attempts of a conflicting save before RecordModifiedError is re-raised
+    BASE_DELAY: float = 0.01  # Backoff before the first retry, in seconds. Doubled for each retry, with full jitter.
+    MAXIMUM_DELAY: float = 0.5  # Maximum backoff between retries, in seconds
+    LATENCY_BUCKETS: tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)  # Upper bounds, in seconds, of the retry latency histogram
@@ -0,0 +1,100 @@
+"""
+Custom model fields for CanDB
+"""
+
+from candb import *
+from django.db.models.functions import Cast
+from django.db.models.query_utils import DeferredAttribute
+import json
+
+
+class RawJSON(str):
+    """
+    JSON text loaded from the database that has not been decoded yet
+    """
+    __slots__ = ()
+
+
+class LazyJSONDescriptor(DeferredAttribute):
+    """
+    Attribute descriptor of LazyJSONField: decodes the raw JSON text on first access and caches the result on the instance
+    """
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = self.peek(instance)
+        if isinstance(value, RawJSON):
+            instance.__dict__[self._loadedKey] = value
+            value = self.field.decode(value)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        if isinstance(value, RawJSON):
+            instance.__dict__.pop(self._loadedKey, None)
+        instance.__dict__[self.field.attname] = value
+
+    @property
+    def _loadedKey(self) -> str:
+        return f"_{self.field.attname}_loaded"
+
+    def peek(self, instance) -> Any:
+        """
+        Get the value without decoding it: the decoded value, or RawJSON if it has not been accessed yet
+        :param instance: Model instance
+        """
+        if self.field.attname not in instance.__dict__:
+            super().__get__(instance, type(instance))  # Deferred: load it
+        return instance.__dict__[self.field.attname]
+
+    def isDecoded(self, instance) -> bool:
+        """
+        Check if the value of an instance has been decoded (or set) since it was loaded. A value that was never decoded
+        is unchanged from the database.
+        :param instance: Model instance
+        """
+        return self.field.attname in instance.__dict__ and not isinstance(instance.__dict__[self.field.attname], RawJSON)
+
+    def isChanged(self, instance) -> bool:
+        """
+        Check if the value of an instance differs from the value loaded from the database, whether it was set or changed
+        in place. A value that was not loaded from the database (e.g. of a new instance) is always changed.
+        :param instance: Model instance
+        """
+        if not self.isDecoded(instance):
+            return False
+        loaded = instance.__dict__.get(self._loadedKey)
+        return loaded is None or self.field.decode(loaded) != instance.__dict__[self.field.attname]
+
+
+class LazyJSONField(models.JSONField):
+    """
+    JSONField that keeps the raw JSON text loaded from the database and only decodes it (with the field's decoder) when
+    the attribute is first accessed. Rows whose value is never read cost no decoding. Saving a value that was never
+    accessed writes the raw text back as-is.
+    values() and values_list() of the field itself return the RawJSON text, which can be passed straight through to a
+    JSON response or decoded with decode(). Key transforms and annotations are decoded as with JSONField.
+    SQL NULL and JSON null both load as None.
+    """
+    descriptor_class = LazyJSONDescriptor
+
+    def decode(self, value: str) -> Any:
+        return json.loads(value, cls=self.decoder)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or value == "null":
+            return None
+        if not isinstance(value, str) or getattr(expression, "target", None) is not self:
+            return super().from_db_value(value, expression, connection)  # Key transforms, annotations and others
+        return RawJSON(value)
+
+    def pre_save(self, model_instance, add):
+        value = getattr(type(model_instance), self.attname).peek(model_instance)
+        if isinstance(value, RawJSON):
+            return Cast(models.Value(str(value)), output_field=models.JSONField())
+        return value
+
+    def get_prep_value(self, value):
+        if isinstance(value, RawJSON):
+            value = self.decode(value)
+        return super().get_prep_value(value)
@@ -0,0 +1,80 @@
+from candb import *
+from candb import common as _common
+from candb.models import Product
+from candb.availabilityCalendar import buildAvailabilityCalendar, SlotGrid
+from django.core.management.base import BaseCommand
+from time import perf_counter
+import random
+
+
+class Command(BaseCommand):
+    help = "Benchmark the vectorised availability calendar against calling Product.checkProductStock for every slot"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=200, help="Number of synthetic products (ignored with --catalog)")
+        parser.add_argument("--windows", type=int, default=6, help="Availability configurations per synthetic product")
+        parser.add_argument("--days", type=int, default=14, help="Calendar horizon in days")
+        parser.add_argument("--slot-minutes", type=int, default=15, help="Slot length in minutes")
+        parser.add_argument("--catalog", action="store_true", help="Use the products in the database instead of synthetic products")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for synthetic products")
+
+    @staticmethod
+    def _syntheticProduct(rng: random.Random, start: datetime, windows: int, n: int) -> Product:
+        availability = dict()
+        for _id in range(1, windows + 1):
+            match rng.randrange(4):
+                case 0:
+                    first = start + timedelta(hours=rng.randrange(24 * 14))
+                    timerange = (first, first + timedelta(hours=rng.randrange(1, 48)))
+                case 1:
+                    first = start.date() + timedelta(days=rng.randrange(14))
+                    timerange = (first, first + timedelta(days=rng.randrange(3)))
+                case 2:
+                    first = rng.randrange(7)
+                    timerange = (first, first + rng.randrange(3))
+                case _:
+                    timerange = "default"
+            physicalStock = rng.randrange(5)
+            availability[_id] = (timerange, {"available": rng.random() > 0.1, "physicalStock": physicalStock, "reservedStock": rng.randrange(physicalStock + 1)})
+        product = Product(id=uuid.UUID(int=n), name=f"Benchmark Product {n}", price=1, physicalStock=10, reservedStock=0, availability=availability, tags=[])
+        product._state.adding = False  # Treat as loaded from the database, so the availability index cache is used
+        product._saveVersion = 1
+        return product
+
+    def handle(self, *args, **options):
+        slotLength = timedelta(minutes=options["slot_minutes"])
+        horizon = timedelta(days=options["days"])
+        now = datetime.now(tz=TZ_INFO)
+        start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        if options["catalog"]:
+            products = list(Product.objects.all())
+        else:
+            rng = random.Random(options["seed"])
+            windowStart = start.astimezone(timezone(start.utcoffset()))  # Fixed offset, as decoded from the database
+            products = [self._syntheticProduct(rng, windowStart, options["windows"], n) for n in range(options["products"])]
+        slots = SlotGrid(start, horizon, slotLength).slotTimes()
+        self.stdout.write(f"{products.__len__()} products x {slots.__len__()} slots = {products.__len__() * slots.__len__():_} checks")
+
+        began = perf_counter()
+        scalar = list()
+        for product in products:
+            row = list()
+            for slot in slots:
+                try:
+                    row.append(product.checkProductStock(1, overrideTime=slot))
+                except _common.NoTimerangeApplicable:
+                    row.append(False)
+            scalar.append(row)
+        scalarTime = perf_counter() - began
+
+        began = perf_counter()
+        calendar = buildAvailabilityCalendar(products, start=start, horizon=horizon, slotLength=slotLength)
+        vectorTime = perf_counter() - began
+
+        mismatches = sum(int(calendar.sellable[r, s]) != int(scalar[r][s]) for r in range(products.__len__()) for s in range(slots.__len__()) if products[r].publicID not in calendar.errors)
+        self.stdout.write(f"Scalar checkProductStock loop: {scalarTime:.4f}s")
+        self.stdout.write(f"Vectorised calendar:           {vectorTime:.4f}s ({scalarTime / vectorTime if vectorTime else float('inf'):.1f}x)")
+        if mismatches:
+            self.stderr.write(f"{mismatches} slots differ between the scalar loop and the calendar")
+        else:
+            self.stdout.write("Results are identical.")
@@ -0,0 +1,73 @@
+from candb import *
+from candb import common as _common
+from candb.availability import validateAvailability
+from candb.models import Product
+from django.core.management.base import BaseCommand
+from django.db import connection
+from time import perf_counter
+import json
+import random
+
+
+class Command(BaseCommand):
+    help = "Benchmark decoding availability in the legacy (DateTimeDecoder) and normalised (AvailabilityDecoder) stored forms"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=10000, help="Number of synthetic products (ignored with --catalog)")
+        parser.add_argument("--windows", type=int, default=6, help="Availability configurations per synthetic product")
+        parser.add_argument("--catalog", action="store_true", help="Use the availability configurations in the database instead of synthetic ones")
+        parser.add_argument("--repeat", type=int, default=3, help="Best of this many runs is reported")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for synthetic products")
+
+    @staticmethod
+    def _syntheticAvailability(rng: random.Random, start: datetime, windows: int) -> _common.AvailabilityConfiguration:
+        availability = dict()
+        for _id in range(1, windows + 1):
+            match rng.randrange(4):
+                case 0:
+                    first = start + timedelta(hours=rng.randrange(24 * 14))
+                    timerange = (first, first + timedelta(hours=rng.randrange(1, 48)))
+                case 1:
+                    first = start.date() + timedelta(days=rng.randrange(14))
+                    timerange = (first, first + timedelta(days=rng.randrange(3)))
+                case 2:
+                    first = rng.randrange(5)
+                    timerange = (first, first + rng.randrange(3))
+                case _:
+                    timerange = "default"
+            physicalStock = rng.randrange(5)
+            availability[_id] = (timerange, {"available": rng.random() > 0.1, "physicalStock": physicalStock, "reservedStock": rng.randrange(physicalStock + 1)})
+        return validateAvailability(availability)
+
+    @staticmethod
+    def _time(documents: list[str], decoder: type, repeat: int) -> tuple[float, list]:
+        best, decoded = float("inf"), None
+        for _ in range(repeat):
+            began = perf_counter()
+            decoded = [json.loads(document, cls=decoder) for document in documents]
+            best = min(best, perf_counter() - began)
+        return best, decoded
+
+    def handle(self, *args, **options):
+        if options["catalog"]:
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT "availability"::text FROM {connection.ops.quote_name(Product._meta.db_table)} WHERE "availability" IS NOT NULL')
+                configurations = [json.loads(row[0], cls=_common.AvailabilityDecoder) for row in cursor.fetchall()]
+        else:
+            rng = random.Random(options["seed"])
+            start = datetime.now(tz=TZ_INFO)
+            start = start.astimezone(timezone(start.utcoffset()))  # Fixed offset, as decoded from the database
+            configurations = [self._syntheticAvailability(rng, start, options["windows"]) for _ in range(options["products"])]
+        legacy = [json.dumps(configuration, cls=_common.DateTimeEncoder) for configuration in configurations]
+        normalised = [json.dumps(configuration, cls=_common.AvailabilityEncoder) for configuration in configurations]
+        self.stdout.write(f"{configurations.__len__()} availability configurations "
+                          f"({sum(map(len, legacy)):_} bytes legacy, {sum(map(len, normalised)):_} bytes normalised)")
+
+        legacyTime, legacyDecoded = self._time(legacy, _common.DateTimeDecoder, options["repeat"])
+        normalisedTime, normalisedDecoded = self._time(normalised, _common.AvailabilityDecoder, options["repeat"])
+        self.stdout.write(f"Legacy (DateTimeDecoder object_hook): {legacyTime:.4f}s")
+        self.stdout.write(f"Normalised (AvailabilityDecoder):     {normalisedTime:.4f}s ({legacyTime / normalisedTime if normalisedTime else float('inf'):.1f}x)")
+        if legacyDecoded != normalisedDecoded:
+            self.stderr.write("Decoded configurations differ between the legacy and normalised forms")
+        else:
+            self.stdout.write("Decoded configurations are identical.")
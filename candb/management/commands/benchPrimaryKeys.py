@@ -0,0 +1,51 @@
+from candb import *
+from candb import common as _common
+from django.core.management.base import BaseCommand
+from django.db import connection
+from time import perf_counter
+
+
+class Command(BaseCommand):
+    help = ("Benchmark insert throughput and index size of prefixed varchar (ORDER-<uuid4>), random uuid (version 4) and "
+            "time-ordered uuid (version 7) primary keys, on scratch tables shaped like candb_order")
+
+    VARIANTS: dict[str, tuple[str, Callable[[], str]]] = {
+        "varchar, ORDER-<uuid4>": ("varchar(42)", lambda: f"ORDER-{uuid.uuid4()}"),
+        "uuid, version 4": ("uuid", lambda: str(uuid.uuid4())),
+        "uuid, version 7": ("uuid", lambda: str(_common.uuid7())),
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10_000_000, help="Rows to insert per variant")
+        parser.add_argument("--batch", type=int, default=10_000, help="Rows per INSERT")
+
+    def _run(self, table: str, sqlType: str, generate: Callable[[], str], rows: int, batch: int) -> tuple[float, int, int]:
+        """
+        :return: (seconds spent in INSERTs, table size in bytes, primary key index size in bytes)
+        """
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {qn(table)}")
+            cursor.execute(f"CREATE TABLE {qn(table)} (id {sqlType} PRIMARY KEY, user_id integer NOT NULL, order_time timestamptz NOT NULL)")
+            try:
+                elapsed = 0.0
+                for start in range(0, rows, batch):
+                    ids = [generate() for _ in range(min(batch, rows - start))]  # Generated outside the timed section
+                    began = perf_counter()
+                    with transaction.atomic():
+                        cursor.execute(f"INSERT INTO {qn(table)} (id, user_id, order_time) SELECT id, 1, now() FROM unnest(%s::{sqlType}[]) AS id", [ids])
+                    elapsed += perf_counter() - began
+                cursor.execute("SELECT pg_relation_size(%s::regclass), pg_relation_size(%s::regclass)", [table, f"{table}_pkey"])
+                tableSize, indexSize = cursor.fetchone()
+            finally:
+                cursor.execute(f"DROP TABLE IF EXISTS {qn(table)}")
+        return elapsed, tableSize, indexSize
+
+    def handle(self, *args, **options):
+        rows, batch = options["rows"], options["batch"]
+        if rows <= 0 or batch <= 0:
+            raise ValueError("rows and batch must be positive")
+        self.stdout.write(f"Inserting {rows:_} rows per variant, {batch:_} per INSERT")
+        for n, (name, (sqlType, generate)) in enumerate(self.VARIANTS.items()):
+            elapsed, tableSize, indexSize = self._run(f"candb_bench_pk_{n}", sqlType, generate, rows, batch)
+            self.stdout.write(f"{name:<24} {rows / elapsed:>12,.0f} rows/s   table {tableSize / 2 ** 20:>9,.1f} MiB   primary key index {indexSize / 2 ** 20:>9,.1f} MiB")
@@ -0,0 +1,47 @@
+from candb import *
+from candb.models import Order, OrderLine
+from django.core.management.base import BaseCommand
+from django.db import models  # Explicitly: the star import above makes models the candb.models module
+
+
+class Command(BaseCommand):
+    help = "Recalculate OrderLine.itemCost and then Order.totalCost with set-based UPDATEs, in chunks of primary keys"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Rows per UPDATE (and per transaction)")
+        parser.add_argument("--product", action="append", default=list(), help="Only lines of this product, and their orders (repeatable)")
+        parser.add_argument("--skip-lines", action="store_true", help="Do not recalculate item costs")
+        parser.add_argument("--skip-orders", action="store_true", help="Do not recalculate order totals")
+
+    def _chunked(self, queryset: models.QuerySet, chunkSize: int, recalculate: Callable[[models.QuerySet], int]) -> int:
+        """
+        Walk the queryset in primary key order (keyset pagination) and recalculate one chunk per transaction
+        :return: Number of rows updated
+        """
+        updated, last = 0, None
+        while True:
+            chunk = queryset.order_by("pk")
+            if last is not None:
+                chunk = chunk.filter(pk__gt=last)
+            keys = list(chunk.values_list("pk", flat=True)[:chunkSize])
+            if not keys:
+                return updated
+            with transaction.atomic():
+                updated += recalculate(queryset.model.objects.filter(pk__in=keys))
+            last = keys[-1]
+            self.stdout.write(f"  {queryset.model.__name__}: {updated} updated (up to {last})")
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] <= 0:
+            raise ValueError("chunk size must be positive")
+        lines = OrderLine.objects.all()
+        orders = Order.objects.all()
+        if options["product"]:
+            lines = lines.filter(linkedProduct__in=options["product"])
+            orders = orders.filter(pk__in=lines.values("linkedOrder"))
+        if not options["skip_lines"]:
+            updated = self._chunked(lines, options["chunk_size"], lambda chunk: chunk.recalculateItemCost())
+            self.stdout.write(f"Recalculated the item cost of {updated} order lines")
+        if not options["skip_orders"]:
+            updated = self._chunked(orders, options["chunk_size"], lambda chunk: chunk.recalculateTotalCost())
+            self.stdout.write(f"Recalculated the total cost of {updated} orders")
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:12
+
+import concurrency.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candb', '0006_order__saveversion_orderline__saveversion_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductWindowStock',
+            fields=[
+                ('id', models.BigAutoField(help_text='Unique Window Stock ID', primary_key=True, serialize=False)),
+                ('availabilityID', models.IntegerField(help_text='ID of Stock Configuration in linked Product')),
+                ('physicalStock', models.PositiveIntegerField(default=0, help_text='Window Physical Stock')),
+                ('reservedStock', models.PositiveIntegerField(default=0, help_text='Window Reserved Stock')),
+                ('_saveVersion', concurrency.fields.IntegerVersionField(default=0, help_text='Save Version for Concurrency Control')),
+                ('linkedProduct', models.ForeignKey(help_text='Product ID', on_delete=django.db.models.deletion.CASCADE, to='candb.product')),
+            ],
+            options={
+                'verbose_name': 'Product Window Stock',
+                'verbose_name_plural': 'Product Window Stock',
+                'db_table_comment': 'Product Window Stock',
+                'constraints': [models.UniqueConstraint(fields=('linkedProduct', 'availabilityID'), name='CanDB_ProductWindowStock_Window_Unique'), models.CheckConstraint(condition=models.Q(('reservedStock__lte', models.F('physicalStock'))), name='CanDB_ProductWindowStock_Stock_Reserve', violation_error_code='PRODUCTWINDOWSTOCK-STOCK-1', violation_error_message='Reserved stock must be smaller or equal to physical stock')],
+            },
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:02
+
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from datetime import date, datetime
+from django.db import migrations, models
+from django.db.backends.postgresql.psycopg_any import DateRange, DateTimeTZRange, NumericRange
+
+
+# Frozen copy of candb.availability.windowRows (and the reference resolution it uses) as of this migration, so the
+# backfill does not change when the live code does
+def _resolves(availability, _id) -> bool:
+    """
+    If the configuration, following its "reference" chain, is available. Bad chains are never available.
+    """
+    seen = set()
+    try:
+        config = availability[_id][1]
+        while True:
+            if not config["available"]:
+                return False
+            if "reference" not in config:
+                return True
+            if _id in seen:
+                return False
+            seen.add(_id)
+            _id = config["reference"]
+            config = availability[_id][1]
+    except Exception:
+        return False
+
+
+def windowRows(availability) -> list[dict]:
+    rows = list()
+    for position, (_id, (timerange, _config)) in enumerate(availability.items()):
+        row = {"availabilityID": _id, "priority": position, "available": False,
+               "timeRange": None, "dateRange": None, "weekdayRange": None, "alwaysApplies": False}
+        rows.append(row)
+        if timerange == "default":
+            row.update(alwaysApplies=True, available=_resolves(availability, _id))
+            continue
+        try:
+            start, end = timerange[0], timerange[1]
+        except (TypeError, IndexError, KeyError):
+            row["alwaysApplies"] = True
+            continue
+        if isinstance(start, datetime):
+            field, rangeType = "timeRange", DateTimeTZRange
+        elif isinstance(start, date):
+            field, rangeType = "dateRange", DateRange
+        elif isinstance(start, int):
+            field, rangeType = "weekdayRange", NumericRange
+        else:
+            row["alwaysApplies"] = True
+            continue
+        try:
+            row[field] = rangeType(start, end, "[]") if start <= end else rangeType(empty=True)
+        except TypeError:
+            row["alwaysApplies"] = True
+            continue
+        row["available"] = _resolves(availability, _id)
+    return rows
+
+
+def backfillWindows(apps, schema_editor):
+    Product = apps.get_model('candb', 'Product')
+    ProductAvailabilityWindow = apps.get_model('candb', 'ProductAvailabilityWindow')
+    db = schema_editor.connection.alias
+    windows = list()
+    for product in Product.objects.using(db).filter(availability__isnull=False).only('id', 'availability').iterator(chunk_size=500):
+        windows.extend(ProductAvailabilityWindow(linkedProduct_id=product.id, **row) for row in windowRows(product.availability))
+        if windows.__len__() >= 5000:
+            ProductAvailabilityWindow.objects.using(db).bulk_create(windows)
+            windows = list()
+    ProductAvailabilityWindow.objects.using(db).bulk_create(windows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candb', '0007_productwindowstock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductAvailabilityWindow',
+            fields=[
+                ('id', models.BigAutoField(help_text='Unique Availability Window ID', primary_key=True, serialize=False)),
+                ('availabilityID', models.IntegerField(help_text='ID of Stock Configuration in linked Product')),
+                ('priority', models.PositiveIntegerField(help_text='Position in the availability configuration. Lower is higher priority.')),
+                ('available', models.BooleanField(help_text='Whether the configuration (following references) is available')),
+                ('timeRange', django.contrib.postgres.fields.ranges.DateTimeRangeField(blank=True, default=None, help_text='Inclusive datetime timerange', null=True)),
+                ('dateRange', django.contrib.postgres.fields.ranges.DateRangeField(blank=True, default=None, help_text='Inclusive date timerange', null=True)),
+                ('weekdayRange', django.contrib.postgres.fields.ranges.IntegerRangeField(blank=True, default=None, help_text='Inclusive weekday timerange, 0 = Monday', null=True)),
+                ('alwaysApplies', models.BooleanField(default=False, help_text='Applies at any time ("default", or a bad timerange)')),
+                ('linkedProduct', models.ForeignKey(help_text='Product ID', on_delete=django.db.models.deletion.CASCADE, to='candb.product')),
+            ],
+            options={
+                'verbose_name': 'Product Availability Window',
+                'verbose_name_plural': 'Product Availability Windows',
+                'db_table_comment': 'Product Availability Window',
+                'ordering': ['linkedProduct', 'priority'],
+                'indexes': [django.contrib.postgres.indexes.GistIndex(condition=models.Q(('timeRange__isnull', False)), fields=['timeRange'], name='CanDB_PAW_TimeRange_Index'), django.contrib.postgres.indexes.GistIndex(condition=models.Q(('dateRange__isnull', False)), fields=['dateRange'], name='CanDB_PAW_DateRange_Index'), django.contrib.postgres.indexes.GistIndex(condition=models.Q(('weekdayRange__isnull', False)), fields=['weekdayRange'], name='CanDB_PAW_WeekdayRange_Index'), models.Index(condition=models.Q(('alwaysApplies', True)), fields=['linkedProduct'], name='CanDB_PAW_Always_Index')],
+                'constraints': [models.UniqueConstraint(fields=('linkedProduct', 'availabilityID'), name='CanDB_PAW_Window_Unique')],
+            },
+        ),
+        migrations.RunPython(backfillWindows, migrations.RunPython.noop),
+    ]
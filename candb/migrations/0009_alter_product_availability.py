@@ -0,0 +1,53 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:41
+
+import candb.common
+import json
+from django.db import migrations, models
+
+
+def normaliseAvailability(apps, schema_editor):
+    """
+    Rewrite every availability configuration in the normalised, sorted form of candb.common.AvailabilityEncoder.
+    Configurations that cannot be encoded are left in the legacy form, which AvailabilityDecoder still reads.
+    """
+    Product = apps.get_model('candb', 'Product')
+    db = schema_editor.connection.alias
+    batch = list()
+    for product in Product.objects.using(db).filter(availability__isnull=False).only('id', 'availability').iterator(chunk_size=500):
+        try:
+            candb.common.encodeAvailability(product.availability)
+        except (TypeError, ValueError):
+            continue
+        batch.append(product)
+        if batch.__len__() >= 500:
+            Product.objects.using(db).bulk_update(batch, ['availability'])
+            batch = list()
+    Product.objects.using(db).bulk_update(batch, ['availability'])
+
+
+def restoreLegacyAvailability(apps, schema_editor):
+    """
+    Rewrite every availability configuration in the legacy candb.common.DateTimeEncoder form
+    """
+    Product = apps.get_model('candb', 'Product')
+    db = schema_editor.connection.alias
+    table = schema_editor.quote_name(Product._meta.db_table)
+    for product in Product.objects.using(db).filter(availability__isnull=False).only('id', 'availability').iterator(chunk_size=500):
+        schema_editor.execute(f'UPDATE {table} SET "availability" = %s::jsonb WHERE "id" = %s',
+                              (json.dumps(product.availability, cls=candb.common.DateTimeEncoder), product.id))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candb', '0008_productavailabilitywindow'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='availability',
+            field=models.JSONField(decoder=candb.common.AvailabilityDecoder, default=None, encoder=candb.common.AvailabilityEncoder, help_text='Product Availability Configuration', null=True),
+        ),
+        migrations.RunPython(normaliseAvailability, restoreLegacyAvailability),
+    ]
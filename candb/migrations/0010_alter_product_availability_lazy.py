@@ -0,0 +1,20 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:20
+
+import candb.common
+import candb.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candb', '0009_alter_product_availability'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='availability',
+            field=candb.fields.LazyJSONField(decoder=candb.common.AvailabilityDecoder, default=None, encoder=candb.common.AvailabilityEncoder, help_text='Product Availability Configuration', null=True),
+        ),
+    ]
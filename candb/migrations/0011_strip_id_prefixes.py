@@ -0,0 +1,67 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:05
+
+from django.db import migrations
+
+
+ID_PREFIXES = {'Order': 'ORDER-', 'OrderLine': 'ORDERLINE-', 'Product': 'PRODUCT-'}
+
+
+def _idColumns(apps, modelName: str) -> list[tuple[str, str]]:
+    """
+    (table, column) of the primary key of a model and of every foreign key to it
+    """
+    model = apps.get_model('candb', modelName)
+    columns = [(model._meta.db_table, model._meta.pk.column)]
+    columns.extend((rel.related_model._meta.db_table, rel.field.column) for rel in model._meta.related_objects)
+    return columns
+
+
+def stripPrefixes(apps, schema_editor):
+    """
+    ORDER-<uuid> becomes <uuid>, in primary keys and foreign keys alike. Foreign keys are deferred, so they are only
+    checked once every column has been rewritten.
+    """
+    qn = schema_editor.quote_name
+    for modelName, prefix in ID_PREFIXES.items():
+        for table, column in _idColumns(apps, modelName):
+            schema_editor.execute(f'UPDATE {qn(table)} SET {qn(column)} = substr({qn(column)}, %s) WHERE {qn(column)} LIKE %s',
+                                  (prefix.__len__() + 1, prefix + '%'))
+
+
+def restorePrefixes(apps, schema_editor):
+    qn = schema_editor.quote_name
+    for modelName, prefix in ID_PREFIXES.items():
+        for table, column in _idColumns(apps, modelName):
+            schema_editor.execute(f'UPDATE {qn(table)} SET {qn(column)} = %s || {qn(column)} WHERE {qn(column)} NOT LIKE %s',
+                                  (prefix, prefix + '%'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candb', '0010_alter_product_availability_lazy'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='order',
+            name='CanDB_Order_ID_Prefix',
+        ),
+        migrations.RemoveConstraint(
+            model_name='order',
+            name='CanDB_Order_ID_Len',
+        ),
+        migrations.RemoveConstraint(
+            model_name='orderline',
+            name='CanDB_OrderLine_ID_Len',
+        ),
+        migrations.RemoveConstraint(
+            model_name='product',
+            name='CanDB_Product_ID_Prefix',
+        ),
+        migrations.RemoveConstraint(
+            model_name='product',
+            name='CanDB_Product_ID_Len',
+        ),
+        migrations.RunPython(stripPrefixes, restorePrefixes),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candb', '0011_strip_id_prefixes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='id',
+            field=models.UUIDField(editable=False, help_text='Unique Order ID, same across databases', primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='orderline',
+            name='id',
+            field=models.UUIDField(help_text='Unique OrderLine ID, same across databases', primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='id',
+            field=models.UUIDField(help_text='Unique Product ID, same across databases', primary_key=True, serialize=False, unique=True),
+        ),
+    ]
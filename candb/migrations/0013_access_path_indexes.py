@@ -0,0 +1,70 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:48
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candb', '0012_alter_order_id_alter_orderline_id_alter_product_id'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='CanDB_Order_ID_Index',
+        ),
+        migrations.RemoveConstraint(
+            model_name='order',
+            name='CanDB_Order_ID_User_Unique',
+        ),
+        migrations.RemoveIndex(
+            model_name='orderline',
+            name='CanDB_OrderLine_ID_Index',
+        ),
+        migrations.RemoveConstraint(
+            model_name='orderline',
+            name='CanDB_OrderLines_ID_User_Unique',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='CanDB_Product_OLD_ID_Index',
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='user',
+            field=models.ForeignKey(db_index=False, help_text='User ID', on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='orderline',
+            name='linkedOrder',
+            field=models.ForeignKey(db_index=False, default=-1, help_text='Order ID', on_delete=django.db.models.deletion.CASCADE, to='candb.order'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['-date_joined'], name='CanDB_Profile_Joined_Index'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-orderTime'], name='CanDB_Order_User_Time_Index'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['orderTime'], name='CanDB_Order_Time_BRIN'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['tags'], name='CanDB_Product_Tags_GIN', opclasses=['jsonb_path_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='orderline',
+            index=models.Index(fields=['linkedOrder', 'status'], name='CanDB_OrderLine_Order_Index'),
+        ),
+        migrations.AddIndex(
+            model_name='orderline',
+            index=models.Index(condition=models.Q(('status__in', ('P', 'O', 'W', 'C', 'I', 'L', 'S'))), fields=['status'], name='CanDB_OrderLine_Open_Index'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candb', '0013_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceLedger',
+            fields=[
+                ('id', models.BigAutoField(help_text='Unique Ledger Entry ID', primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('T', 'TopUp'), ('D', 'Debit')], help_text='Kind of Entry', max_length=1)),
+                ('amount', models.DecimalField(decimal_places=2, help_text='Change in Balance (negative for debits)', max_digits=10)),
+                ('balanceAfter', models.DecimalField(decimal_places=2, help_text='Balance after the Entry', max_digits=10)),
+                ('reference', models.CharField(default=None, help_text='Reference (e.g., Order ID)', max_length=100, null=True)),
+                ('entryTime', models.DateTimeField(help_text='Entry Time')),
+                ('profile', models.ForeignKey(db_index=False, help_text='User ID', on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Balance Ledger Entry',
+                'verbose_name_plural': 'Balance Ledger',
+                'db_table_comment': 'Balance Ledger',
+                'ordering': ['-entryTime', '-id'],
+                'indexes': [models.Index(fields=['profile', '-entryTime'], name='CanDB_Ledger_Profile_Index')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candb', '0014_balanceledger'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='orderline',
+            name='linkedOrder',
+            field=models.ForeignKey(db_index=False, help_text='Order ID', on_delete=django.db.models.deletion.CASCADE, to='candb.order'),
+        ),
+        migrations.AlterField(
+            model_name='orderline',
+            name='linkedProduct',
+            field=models.ForeignKey(help_text='Product ID', on_delete=django.db.models.deletion.CASCADE, to='candb.product'),
+        ),
+    ]
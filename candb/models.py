@@ -1,10 +1,101 @@
 from candb import *
 from candb import config as cfg
 from candb import common as _common
+from candb.availability import AvailabilityIndex, AVAILABILITY_INDEX_CACHE, windowRows, validateAvailability, resolveReference
+from candb.fields import LazyJSONField
+from django.contrib.postgres.fields import DateTimeRangeField, DateRangeField, IntegerRangeField
+from django.contrib.postgres.indexes import BrinIndex, GinIndex, GistIndex
 from django.contrib.auth.models import AbstractUser
 from concurrency.fields import IntegerVersionField
+from django.db import connection
+from django.db.models.functions import Coalesce
 
 
+def _adjustReservedStock(model: type[models.Model], items: dict[Any, int], release: bool = False, keyFields: tuple[str, ...] = None) -> dict[Any, tuple[int | None, int]]:
+    """
+    Reserve (or release) stock for many rows with one conditional UPDATE, so concurrent reservations never read-modify-write.
+    Rows with infinite stock (physicalStock is None) always succeed and are not written.
+    :param model: Model with physicalStock, reservedStock and _saveVersion fields
+    :param items: {key: quantity}. The key is the primary key, or a tuple of the values of keyFields. The keys returned are the keys given.
+    :param release: Release reserved stock instead of reserving it
+    :param keyFields: Fields identifying a row, if not the primary key
+    :return: {key: (reservedStock, _saveVersion)} for the rows that succeeded
+    """
+    for quantity in items.values():
+        if not isinstance(quantity, int):
+            raise TypeError("bad type for quantity")
+        if quantity <= 0:
+            raise ValueError("quantity must be positive")
+    if not items:
+        return dict()
+    qn = connection.ops.quote_name
+    keys = [model._meta.get_field(name) for name in keyFields] if keyFields else [model._meta.pk]
+    composite = keyFields is not None
+    table = qn(model._meta.db_table)
+    keyColumns = ", ".join(f"t.{qn(key.column)}" for key in keys)
+    join = " AND ".join(f"t.{qn(key.column)} = v.key{i}" for i, key in enumerate(keys))
+    physical, reserved = qn(model._meta.get_field("physicalStock").column), qn(model._meta.get_field("reservedStock").column)
+    version = qn(model._meta.get_field("_saveVersion").column)
+    if release:
+        assignment, condition = f"{reserved} = t.{reserved} - v.quantity", f"t.{reserved} >= v.quantity"
+    else:
+        assignment, condition = f"{reserved} = t.{reserved} + v.quantity", f"t.{physical} - t.{reserved} >= v.quantity"
+    row = "(" + "".join(f"%s::{key.db_type(connection)}, " for key in keys) + "%s::integer)"
+    values = ", ".join([row] * items.__len__())
+    def normalise(key: models.Field, value: Any) -> Any:
+        # Prefixed IDs (e.g., PRODUCT-<uuid>) are accepted wherever the key is, or refers to, a PrefixedIDModel
+        target = key.related_model if key.is_relation else key.model
+        return target.parseID(value) if issubclass(target, PrefixedIDModel) else key.to_python(value)
+
+    # Keys as the database returns them (e.g., UUID rather than str), mapped back to the caller's keys
+    callerKeys = {tuple(normalise(key, value) for key, value in zip(keys, k if composite else (k,))): k for k in items}
+    # Sorted by key, so concurrent multi-row reservations tend to lock rows in the same order
+    params = list()
+    for normalised in sorted(callerKeys):
+        params.extend(key.get_db_prep_value(value, connection) for key, value in zip(keys, normalised))
+        params.append(items[callerKeys[normalised]])
+    # The save version is bumped so instances loaded before the reservation cannot save a stale reservedStock over it
+    sql = f"""
+        WITH v ({"".join(f"key{i}, " for i in range(keys.__len__()))}quantity) AS (VALUES {values}),
+        updated AS (
+            UPDATE {table} AS t SET {assignment}, {version} = t.{version} + 1
+            FROM v WHERE {join} AND t.{physical} IS NOT NULL AND {condition}
+            RETURNING {keyColumns}, t.{reserved}, t.{version}
+        )
+        SELECT * FROM updated
+        UNION ALL
+        SELECT {keyColumns}, t.{reserved}, t.{version} FROM {table} AS t JOIN v ON {join} WHERE t.{physical} IS NULL
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {callerKeys[tuple(r[:-2])]: (r[-2], r[-1]) for r in cursor.fetchall()}
+
+
+def _newID() -> uuid.UUID:
+    """
+    New primary key for Order, OrderLine and Product (see cfg.TIME_ORDERED_PRIMARY_KEYS)
+    """
+    return _common.uuid7() if cfg.TIME_ORDERED_PRIMARY_KEYS else uuid.uuid4()
+
+
+class PrefixedIDModel:
+    """
+    Mixin for models with UUID primary keys that are shown with a prefix at the API boundary (e.g., ORDER-<uuid>).
+    The prefix is not stored.
+    """
+    ID_PREFIX: str = ""
+
+    @property
+    def publicID(self) -> str:
+        return _common.formatPrefixedID(self.ID_PREFIX, self.pk)
+
+    @classmethod
+    def parseID(cls: Union[Self, Callable], value: str | uuid.UUID) -> uuid.UUID:
+        """
+        Parse an ID from the API boundary: the prefixed form, a bare UUID string, or a UUID
+        """
+        return _common.parsePrefixedID(cls.ID_PREFIX, value)
+
 
 # Create your models here.
 class Profile(AbstractUser):
@@ -17,6 +108,11 @@ class Profile(AbstractUser):
     adminNotes = models.TextField(help_text="Admin Notes", null=True, blank=False, default=None, max_length=cfg.Profile.MAXIMUM_ADMIN_NOTES_LENGTH)
     _saveVersion = IntegerVersionField(help_text="Save Version for Concurrency Control")
 
+
+    class Meta(AbstractUser.Meta):
+        indexes = [models.Index(fields=["-date_joined"], name="CanDB_Profile_Joined_Index")]  # ProfileViewSet pages
+
+
     @classmethod
     def create(cls: Union[Self, Callable], username: str, first_name: str = None, last_name: str = None, *_, email: str = None,
                phoneNCountryCode: str = None, pNumber: str = None, password: str = None, is_staff: bool = False,
@@ -107,26 +203,45 @@ class Profile(AbstractUser):
             raise ValueError("amount must be non-negative")
         return self.balance >= amount
 
-    def subtractBalance(self, amount: float, autosave: bool = True, raiseWhenInsufficientFunds: bool = True) -> bool | NoReturn:
+    def subtractBalance(self, amount: float, autosave: bool = True, raiseWhenInsufficientFunds: bool = True, reference: str = None) -> bool | NoReturn:
         """
         Subtract balance from the user
+        With autosave, the balance is debited in the database with one conditional UPDATE and recorded in the
+        BalanceLedger (see BalanceLedger.debitBulk); no other column is written and no version conflict can occur.
+        :param reference: Ledger reference (e.g., an order ID), with autosave
         """
-        if not self._checkBalance(amount):
+        if amount == 0:
+            return True
+        if autosave:
+            if amount < 0:
+                raise ValueError("amount must be non-negative")
+            result = BalanceLedger.debitBulk({self.id: amount}, reference=reference)
+        else:
+            result = {self.id: (self.balance - amount, self._saveVersion)} if self._checkBalance(amount) else dict()
+        if self.id not in result:
             if raiseWhenInsufficientFunds:
-                raise _common.InsufficientFunds(f"insufficient funds to subtract {amount} from {self.__repr__()}")
+                raise _common.InsufficientFunds(f"insufficient funds to subtract {amount} from {self.__repr__()}", {self.id})
             return False
-        self.balance -= amount
-        if autosave: self.save()
+        self.balance, self._saveVersion = result[self.id]
         return True
 
-    def addBalance(self, amount: float, autosave: bool = True) -> NoReturn:
+    def addBalance(self, amount: float, autosave: bool = True, reference: str = None) -> NoReturn:
         """
         Add balance to the user
+        With autosave, the balance is topped up in the database with one UPDATE and recorded in the BalanceLedger.
+        :param reference: Ledger reference, with autosave
         """
         if amount < 0:
             raise ValueError("amount must be non-negative")
-        self.balance += amount
-        if autosave: self.save()
+        if amount == 0:
+            return
+        if autosave:
+            result = BalanceLedger.topUpBulk({self.id: amount}, reference=reference)
+            if self.id not in result:
+                raise self.DoesNotExist(f"profile {self.id} not found")
+            self.balance, self._saveVersion = result[self.id]
+        else:
+            self.balance += amount
 
     def __str__(self):
         return f'<User {self.last_name.upper()}, {self.first_name}: {self.username} with ID {self.id}>'
@@ -135,34 +250,170 @@ class Profile(AbstractUser):
         return f'<{self.__class__.__qualname__} \'{self.last_name.upper()}, {self.first_name}\': {self.username}; ID {self.id}>'
 
 
-class Order(models.Model):
+class BalanceLedger(models.Model):
+    """
+    Append-only record of every change to Profile.balance made through debitBulk and topUpBulk (and so through
+    Profile.subtractBalance and Profile.addBalance).
+    """
+    id = models.BigAutoField(primary_key=True, help_text="Unique Ledger Entry ID")
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, help_text="User ID", null=False, blank=False, db_index=False)  # Indexed by CanDB_Ledger_Profile_Index
+    kind = models.CharField(max_length=1, choices=[(v, k) for k, v in _common.BALANCE_ENTRY_KIND_AS_DICT.items()], help_text="Kind of Entry", null=False, blank=False)
+    amount = models.DecimalField(max_digits=cfg.Profile.MAXIMUM_BALANCE_DIGITS, decimal_places=cfg.Profile.BALANCE_DECIMAL_DIGITS, help_text="Change in Balance (negative for debits)", null=False, blank=False)
+    balanceAfter = models.DecimalField(max_digits=cfg.Profile.MAXIMUM_BALANCE_DIGITS, decimal_places=cfg.Profile.BALANCE_DECIMAL_DIGITS, help_text="Balance after the Entry", null=False, blank=False)
+    reference = models.CharField(max_length=cfg.BalanceLedger.MAXIMUM_REFERENCE_LENGTH, help_text="Reference (e.g., Order ID)", null=True, blank=False, default=None)
+    entryTime = models.DateTimeField(help_text="Entry Time", null=False, blank=False)
+
+
+    class Meta:
+        ordering = ['-entryTime', '-id']
+        db_table_comment = "Balance Ledger"
+        verbose_name = "Balance Ledger Entry"
+        verbose_name_plural = "Balance Ledger"
+        indexes = [models.Index(fields=["profile", "-entryTime"], name="CanDB_Ledger_Profile_Index")]
+
+
+    @classmethod
+    def _apply(cls: Union[Self, Callable], items: dict[int, float | Decimal], kind: str, reference: str = None) -> dict[int, tuple[Decimal, int]]:
+        """
+        Change the balance of many profiles and append their ledger entries, in one statement. Debits only apply where
+        the balance covers them (balance >= amount), so concurrent payments never overdraw and never read-modify-write.
+        The profile save version is bumped, so instances loaded before the change cannot save a stale balance over it.
+        :param items: {profile ID: amount}. Amounts are rounded to the decimal places of Profile.balance, and must then
+                        be positive.
+        :param kind: BalanceEntryKind
+        :param reference: Reference recorded on every entry
+        :return: {profile ID: (new balance, new _saveVersion)} for the profiles changed
+        """
+        exponent = Decimal(1).scaleb(-Profile._meta.get_field("balance").decimal_places)
+        rounded = dict()
+        for profileID, amount in items.items():
+            if not isinstance(amount, (int, float, Decimal)) or isinstance(amount, bool):
+                raise TypeError("bad type for amount")
+            rounded[profileID] = Decimal(str(amount)).quantize(exponent)
+            if rounded[profileID] <= 0:
+                raise ValueError("amount must be positive")
+        items = rounded
+        if reference is not None and not isinstance(reference, str):
+            raise TypeError("bad type for reference")
+        if not items:
+            return dict()
+        qn = connection.ops.quote_name
+        profile, ledger = qn(Profile._meta.db_table), qn(cls._meta.db_table)
+        pk, balance, version = qn(Profile._meta.pk.column), qn(Profile._meta.get_field("balance").column), qn(Profile._meta.get_field("_saveVersion").column)
+        if kind == _common.BalanceEntryKind.Debit:
+            assignment, condition, sign = f"{balance} = t.{balance} - v.amount", f"AND t.{balance} >= v.amount", "-"
+        else:
+            assignment, condition, sign = f"{balance} = t.{balance} + v.amount", "", ""
+        columns = ", ".join(qn(cls._meta.get_field(name).column) for name in ("profile", "kind", "amount", "balanceAfter", "reference", "entryTime"))
+        values = ", ".join([f"(%s::{Profile._meta.pk.db_type(connection)}, %s::numeric)"] * items.__len__())
+        params = list()
+        # Sorted by ID, so concurrent multi-row changes tend to lock rows in the same order
+        for profileID, amount in sorted(items.items()):
+            params.extend((profileID, amount))
+        sql = f"""
+            WITH v (profile, amount) AS (VALUES {values}),
+            updated AS (
+                UPDATE {profile} AS t SET {assignment}, {version} = t.{version} + 1
+                FROM v WHERE t.{pk} = v.profile {condition}
+                RETURNING t.{pk}, t.{balance}, t.{version}, v.amount
+            ),
+            entries AS (
+                INSERT INTO {ledger} ({columns})
+                SELECT {pk}, %s, {sign}amount, {balance}, %s, now() FROM updated
+            )
+            SELECT {pk}, {balance}, {version} FROM updated
+        """
+        params.extend((kind, reference))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return {r[0]: (r[1], r[2]) for r in cursor.fetchall()}
+
+    @classmethod
+    def debitBulk(cls: Union[Self, Callable], items: dict[int, float | Decimal], reference: str = None, allOrNothing: bool = False) -> dict[int, tuple[Decimal, int]]:
+        """
+        Debit many profiles, each only if its balance covers the amount
+        :param items: {profile ID: amount to debit}
+        :param reference: Reference recorded on every entry (e.g., an order ID)
+        :param allOrNothing: If True, debit nothing and raise InsufficientFunds when any profile cannot be debited
+        :return: {profile ID: (new balance, new _saveVersion)} for the profiles debited. Profiles missing from the result
+                    had insufficient funds (or do not exist).
+        """
+        with transaction.atomic():
+            debited = cls._apply(items, _common.BalanceEntryKind.Debit, reference)
+            failed = set(items.keys()) - set(debited.keys())
+            if failed and allOrNothing:
+                raise _common.InsufficientFunds(f"insufficient funds to debit {failed.__len__()} of {items.__len__()} profiles", failed)
+        return debited
+
+    @classmethod
+    def topUpBulk(cls: Union[Self, Callable], items: dict[int, float | Decimal], reference: str = None) -> dict[int, tuple[Decimal, int]]:
+        """
+        Top up many profiles
+        :param items: {profile ID: amount to add}
+        :param reference: Reference recorded on every entry
+        :return: {profile ID: (new balance, new _saveVersion)} for the profiles topped up (all that exist)
+        """
+        return cls._apply(items, _common.BalanceEntryKind.TopUp, reference)
+
+
+    def __str__(self):
+        return f'<BalanceLedger {self.id}: {self.amount} for User {self.profile_id}>'
+
+    def __repr__(self):
+        return f'<{self.__class__.__qualname__} {self.id}: {self.amount} for User {self.profile_id}>'
+
+
+class OrderQuerySet(models.QuerySet):
+    def recalculateTotalCost(self) -> int:
+        """
+        Recalculate totalCost of every order in the queryset from the item costs of its lines, with one UPDATE.
+        As with Order.rollUpTotalCost: overrideCost wins, and the total is None if any line has no item cost yet.
+        :return: Number of orders updated
+        """
+        lines = OrderLine.objects.filter(linkedOrder=models.OuterRef("pk")).order_by()
+        lineTotal = lines.values("linkedOrder").annotate(total=models.Sum("itemCost")).values("total")
+        return self.update(
+            totalCost=models.Case(
+                models.When(overrideCost__isnull=False, then=models.F("overrideCost")),
+                models.When(models.Exists(lines.filter(itemCost__isnull=True)), then=models.Value(None)),
+                default=Coalesce(models.Subquery(lineTotal), models.Value(Decimal(0))),
+                output_field=Order._meta.get_field("totalCost"),
+            ),
+            _saveVersion=models.F("_saveVersion") + 1,
+        )
+
+
+class Order(PrefixedIDModel, models.Model):
     """
     The model for a user order. Linked to multiple orderLines.
     """
-    id = models.CharField(primary_key=True, editable=False, help_text="Unique Order ID, same across databases", null=False, blank=False, unique=True, max_length=42)  # ORDER-UUID4 (len 42)
+    ID_PREFIX = "ORDER-"
+    id = models.UUIDField(primary_key=True, editable=False, help_text="Unique Order ID, same across databases", null=False, blank=False, unique=True)  # Shown as ORDER-<uuid> at the API boundary
     orderTime = models.DateTimeField(help_text="Order Time", null=False, blank=False)
     overrideCost = models.DecimalField(max_digits=cfg.Order.MAXIMUM_COST_DIGITS, decimal_places=cfg.Order.COST_DECIMAL_DIGITS, help_text="Override Cost", null=True, blank=False, default=None)  # If None, means not overridden.
     totalCost = models.DecimalField(max_digits=cfg.Order.MAXIMUM_COST_DIGITS, decimal_places=cfg.Order.COST_DECIMAL_DIGITS, help_text="Order Total", null=True)  # If None, means not calculated yet.
     notes = models.TextField(help_text="Order Notes", null=True, blank=False, default=None, max_length=cfg.Order.MAXIMUM_NOTES_LENGTH)
-    user = models.ForeignKey(help_text="User ID", blank=False, null=False, on_delete=models.CASCADE, to=Profile)
+    user = models.ForeignKey(help_text="User ID", blank=False, null=False, on_delete=models.CASCADE, to=Profile, db_index=False)  # Indexed by CanDB_Order_User_Time_Index
     _saveVersion = IntegerVersionField(help_text="Save Version for Concurrency Control")
 
+    objects = OrderQuerySet.as_manager()
+
 
     class Meta:
         ordering = ['-orderTime', 'id']
         db_table_comment = "Orders"
         permissions = [("view_all_orders", "Can view orders regardless of its owner"), ("change_any_order", "Can change any orders regardless of its owner"), ("delete_any_order", "Can delete orders regardless of its owner"), ("add_any_order", "Can add any order regardless of its owner"), ("change_any_order_but_overridecost", "Can change orders regardless of its owner, but cannot override the cost")]
-        indexes = [models.Index(fields=["id",], name="CanDB_Order_ID_Index")]
+        indexes = [
+            models.Index(fields=["user", "-orderTime"], name="CanDB_Order_User_Time_Index"),  # Orders of a user, newest first
+            BrinIndex(fields=["orderTime"], name="CanDB_Order_Time_BRIN"),  # Time range reports; orders are inserted in time order
+        ]
         verbose_name = "Order"
         verbose_name_plural = "Orders"
         constraints = [
-            models.UniqueConstraint(fields=["id",], name="CanDB_Order_ID_User_Unique"),
             models.CheckConstraint(check=models.Q(totalCost__gte=0), name="CanDB_Order_TotalCost_NonNegative", violation_error_code="ORDER-TOTALCOST-1", violation_error_message="Total cost of an order cannot negative"),
             models.CheckConstraint(check=models.Q(overrideCost__gte=0), name="CanDB_Order_OverrideCost_NonNegative",
                                    violation_error_code="ORDER-OVERRIDE-1",
                                    violation_error_message="Total cost of an order cannot negative"),
-            models.CheckConstraint(check=models.Q(id__startswith="ORDER-"), name="CanDB_Order_ID_Prefix", violation_error_code="ORDER-ID-1", violation_error_message="Order ID must start with 'ORDER-'"),
-            models.CheckConstraint(check=models.Q(id__len=42), name="CanDB_Order_ID_Len", violation_error_code="ORDER-ID-2", violation_error_message="Order ID must be 42 characters long"),
         ]
 
 
@@ -173,7 +424,7 @@ class Order(models.Model):
         """
         if overwriteTime is None:
             overwriteTime = datetime.now(tz=TZ_INFO)
-        uid = f'ORDER-{uuid.uuid4()}'
+        uid = _newID()
         od = cls(
             id=uid,
             user=profile,
@@ -183,6 +434,80 @@ class Order(models.Model):
         if autosave: od.save()
         return od
 
+    @classmethod
+    def createWithLines(cls: Union[Self, Callable], profile: Profile, lines: Iterable[dict[str, Any]], notes: str = None,
+                        overwriteTime: datetime = None, overrideCost: float = None, reserveStock: bool = False) -> tuple[Self, list["OrderLine"]]:
+        """
+        Create an order with all its order lines in one transaction. Everything is validated in Python first; then the
+        order and its lines are inserted with one statement each, and totalCost is computed in memory.
+        :param profile: The user placing the order
+        :param lines: [{"linkedProduct": Product or product ID (see Product.parseID), "quantity": int, ...}]. Other keys are passed to OrderLine.create.
+                        Where neither persistentCost nor itemCost is given, itemCost is forcePrice if set, and otherwise
+                        persistentCost defaults to the product's price.
+        :param notes: Order notes
+        :param overwriteTime: Order time. If None, now.
+        :param overrideCost: Override cost of the order
+        :param reserveStock: Reserve the stock of the lines (see OrderLine.reserveLines). If any line cannot be reserved,
+                                InsufficientStock is raised and nothing is created.
+        :return: (order, order lines)
+        """
+        if not isinstance(profile, Profile):
+            raise TypeError("bad type for profile")
+        if overrideCost is not None:
+            if not isinstance(overrideCost, (int, float, Decimal)):
+                raise TypeError("bad type for overrideCost")
+            if overrideCost < 0:
+                raise ValueError("overrideCost must not be negative")
+        lines = [dict(line) for line in lines]
+        if not lines:
+            raise ValueError("an order must have at least one line")
+        productIDs = {Product.parseID(line["linkedProduct"]) for line in lines if isinstance(line.get("linkedProduct"), (str, uuid.UUID))}
+        products = Product.objects.in_bulk(productIDs) if productIDs else dict()
+
+        order = cls.create(profile, notes=notes, overwriteTime=overwriteTime, autosave=False)
+        order.overrideCost = overrideCost
+        orderLines = list()
+        for line in lines:
+            if "linkedOrder" in line or "autosave" in line:
+                raise ValueError("lines must not specify linkedOrder or autosave")
+            product = line.pop("linkedProduct", None)
+            if isinstance(product, (str, uuid.UUID)):
+                if Product.parseID(product) not in products:
+                    raise ValueError(f"product {product} not found")
+                product = products[Product.parseID(product)]
+            if not isinstance(product, Product):
+                raise TypeError("bad type for linkedProduct")
+            # Costs are settled at creation, as calculateItemCost would: the product's price unless forcePrice is set
+            if line.get("persistentCost") is None and line.get("itemCost") is None:
+                if line.get("forcePrice") is not None:
+                    line["itemCost"] = line["forcePrice"]
+                else:
+                    line["persistentCost"] = product.price
+            orderLines.append(OrderLine.create(linkedOrder=order, linkedProduct=product, autosave=False, **line))
+        order.totalCost = cls.rollUpTotalCost([line.itemCost for line in orderLines], overrideCost)
+
+        with transaction.atomic():
+            if reserveStock:
+                OrderLine.reserveLines(orderLines)
+            order.save(force_insert=True)
+            OrderLine.objects.bulk_create(orderLines)
+        return order, orderLines
+
+    @staticmethod
+    def rollUpTotalCost(itemCosts: Iterable[float | Decimal | None], overrideCost: float | Decimal | None = None) -> Decimal | None:
+        """
+        Calculate the total cost of an order from the item costs of its lines
+        :param itemCosts: Item cost of each order line
+        :param overrideCost: Override cost of the order. If not None, it is the total cost.
+        :return: The total cost. None if any item cost has not been calculated yet.
+        """
+        if overrideCost is not None:
+            return Decimal(str(overrideCost))
+        itemCosts = list(itemCosts)
+        if any(itemCost is None for itemCost in itemCosts):
+            return None
+        return sum((Decimal(str(itemCost)) for itemCost in itemCosts), Decimal(0))
+
 
     def __str__(self):
         return f'<Order {self.id} by {self.user.username} at {self.orderTime}>'
@@ -191,11 +516,12 @@ class Order(models.Model):
         return f'<{self.__class__.__qualname__} {self.id} by {self.user.username} at {self.orderTime}>'
 
 
-class Product(models.Model):
+class Product(PrefixedIDModel, models.Model):
     """
     The model for a product
     """
-    id = models.CharField(max_length=44, primary_key=True, help_text="Unique Product ID, same across databases", null=False, blank=False, unique=True)  # PRODUCT-UUID4 (len 44)
+    ID_PREFIX = "PRODUCT-"
+    id = models.UUIDField(primary_key=True, help_text="Unique Product ID, same across databases", null=False, blank=False, unique=True)  # Shown as PRODUCT-<uuid> at the API boundary
     name = models.CharField(max_length=cfg.Product.MAXIMUM_NAME_LENGTH, help_text="Product Name", null=False, blank=False)
     price = models.DecimalField(max_digits=cfg.Product.MAXIMUM_COST_DIGITS, decimal_places=cfg.Product.COST_DECIMAL_DIGITS, help_text="Product Price", null=False, blank=False)
     description = models.TextField(max_length=cfg.Product.MAXIMUM_DESCRIPTION_LENGTH, help_text="Product Description", null=True, blank=False)
@@ -207,7 +533,7 @@ class Product(models.Model):
     physicalStock = models.PositiveIntegerField(help_text="Product Physical Stock", null=True, blank=False)  # Null is allowed, as some products may be virtual and not have a stock. Alternatively, stock may be specified in availability.
     reservedStock = models.PositiveIntegerField(help_text="Product Reserved Stock", null=True, blank=False, default=0)  # Physical stock is how much stock is available, reserved stock is how much stock is already ordered
     # Available stock is equal to physicalStock - reservedStock.
-    availability = models.JSONField(help_text="Product Availability Configuration", null=True, blank=False, default=None, encoder=_common.DateTimeEncoder, decoder=_common.DateTimeDecoder)  # Use None for no availability: always use model stock.
+    availability = LazyJSONField(help_text="Product Availability Configuration", null=True, blank=False, default=None, encoder=_common.AvailabilityEncoder, decoder=_common.AvailabilityDecoder)  # Use None for no availability: always use model stock.
     # New availability function as follows:
     """
     ```python
@@ -216,6 +542,7 @@ class Product(models.Model):
         "reference":        int,    # Specify if stock configuration should inherit from another stock configuration by ID. Ignores all other fields but available. Not required. MUST BE A VALID REFERENCE IF SPECIFIED.
         "useModelStock":    bool,   # Specify if stock is to be used from the Product model fields (physicalStock, reservedStock)
         "infinite":         bool,   # Specify if stock is infinite (ignores "stock"). E.g., something made to order may use this
+        "windowStock":      bool,   # Specify if stock is kept in a per-window counter row (ProductWindowStock) for this availability ID, instead of in this configuration
         "physicalStock":    int,    # Specify number of stock available during time period
         "reservedStock":    int,    # Specify number of stock reserved during time period
     }
@@ -237,6 +564,9 @@ class Product(models.Model):
     }
     ```
     Please note timestamps are inclusive.
+    Availability is validated and normalised when the product is saved: it is sorted by ID (which is therefore the priority
+        order once saved), and datetime timeranges must be timezone-aware. It is stored as a sorted list of windows (see
+        common.AvailabilityEncoder) that decodes without walking every nested object.
     It is recommended to use one type of availability for one product. For example, use only datetime, or only
         datetime.date, or only day[int], then use "default".
     [IMPORTANT]: When CanDB checks the availability of a product, it will use the first availability configuration that matches the current time by default.
@@ -250,7 +580,8 @@ class Product(models.Model):
                 2. "reference"
                 3. "useModelStock"
                 4. "infinite"
-                5. "physicalStock" and "reservedStock".
+                5. "windowStock"
+                6. "physicalStock" and "reservedStock".
             CanDB will IGNORE all other arguments if the higher priority arguments can determine the stock quantity.
             This means if there is a conflict between arguments, the higher priority arguments will be used and the conflict will NOT be detected.
             For example, if "available" is False, then the product is not available, regardless of the other arguments.
@@ -260,22 +591,17 @@ class Product(models.Model):
     notes = models.TextField(help_text="Product Notes", null=True, blank=False, default=None, max_length=cfg.Product.MAXIMUM_NOTES_LENGTH)
     tags = models.JSONField(max_length=cfg.Product.MAXIMUM_PRODUCT_TAGS, help_text="Product Tags", null=False, blank=True)
     _saveVersion = IntegerVersionField(help_text="Save Version for Concurrency Control")
+    _windowStock: dict[int, tuple[int, int]] | None = None  # Per-window stock counters, loaded on first use
 
 
     class Meta:
         ordering = ['name', 'id']
         db_table_comment = "Product"
         permissions = list()
-        indexes = [models.Index(fields=["id",], name="CanDB_Product_OLD_ID_Index")]
+        indexes = [GinIndex(fields=["tags"], opclasses=["jsonb_path_ops"], name="CanDB_Product_Tags_GIN")]  # tags__contains
         verbose_name = "Product"
         verbose_name_plural = "Products"
         constraints = [
-            models.CheckConstraint(check=models.Q(id__startswith="PRODUCT-"), name="CanDB_Product_ID_Prefix",
-                                   violation_error_code="PRODUCT-ID-1",
-                                   violation_error_message="Product ID must start with 'PRODUCT-'"),
-            models.CheckConstraint(check=models.Q(id__len=44), name="CanDB_Product_ID_Len",
-                                   violation_error_code="PRODUCT-ID-2",
-                                   violation_error_message="Product ID must be 44 characters long"),
             # Check that if physicalStock is None, reservedStock must be None
             models.CheckConstraint(check=models.Q(physicalStock__isnull=False) | (models.Q(physicalStock__isnull=True) & ~ models.Q(reservedStock__isnull=True)),
                                    name="CanDB_Product_Stock_Null",
@@ -296,7 +622,7 @@ class Product(models.Model):
         """
         Create a new product
         """
-        uid = f'PRODUCT-{uuid.uuid4()}'
+        uid = _newID()
         if physicalStock is None:
             if reservedStock is not None:
                 raise ValueError("reserved stock must be None when physical stock is None as None indicates infinite stock")
@@ -330,8 +656,27 @@ class Product(models.Model):
             notes=notes,
             tags=tags
         )
-        if autosave: prod.save()
+        if autosave:
+            prod.save()
         return prod
+
+    def save(self, *args, **kwargs):
+        """
+        Save the product, validating and normalising availability (see validateAvailability) if it changed, and keeping
+        its ProductAvailabilityWindow rows in sync with it. Window stock counters (ProductWindowStock) missing for its
+        configurations are created; existing counters are kept.
+        """
+        updateFields = kwargs.get("update_fields")
+        # Availability that is unchanged since it was loaded is not validated again, so saving a product whose stored
+        # configuration predates validateAvailability still works
+        availabilityChanged = (updateFields is None or "availability" in updateFields) and (self._state.adding or Product.availability.isChanged(self))
+        if availabilityChanged and self.availability is not None:
+            self.availability = validateAvailability(self.availability)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if availabilityChanged:
+                ProductAvailabilityWindow.syncForProduct(self)
+                ProductWindowStock.createForProduct(self)
     
     
     def _modelStockAvailable(self) -> int | bool:
@@ -349,10 +694,58 @@ class Product(models.Model):
         return self.physicalStock - self.reservedStock
     
 
-    def _stockAvailableForStockConfig(self, _config: _common.AvailabilityConfiguration) -> _common.AvailabilityIndicator:
+    @property
+    def windowStockCounters(self) -> dict[int, tuple[int, int]]:
+        """
+        Per-window stock counters of this product, {availability ID: (physicalStock, reservedStock)}.
+        Loaded with one query on first use; call refreshWindowStock to reload.
+        """
+        if self._windowStock is None:
+            self._windowStock = {_id: (physical, reserved) for _id, physical, reserved in ProductWindowStock.objects.filter(linkedProduct=self).values_list("availabilityID", "physicalStock", "reservedStock")}
+        return self._windowStock
+
+    def refreshWindowStock(self) -> None:
+        self._windowStock = None
+
+    @classmethod
+    def _prefetchWindowStock(cls: Union[Self, Callable], products: Iterable[Self]) -> None:
+        """
+        Load the per-window stock counters of many products with one query. Products are picked from their compiled
+        availability index, so the availability of a product whose index is cached is not decoded.
+        """
+        products = [p for p in products if Product.availability.peek(p) is not None and p.availabilityIndex.windowStock]
+        if not products:
+            return
+        counters = {p.id: dict() for p in products}
+        for productID, _id, physical, reserved in ProductWindowStock.objects.filter(linkedProduct__in=products).values_list("linkedProduct", "availabilityID", "physicalStock", "reservedStock"):
+            counters[productID][_id] = (physical, reserved)
+        for p in products:
+            p._windowStock = counters[p.id]
+
+    def _windowStockAvailable(self, availabilityID: int) -> int | bool:
+        """
+        Internal function used for checking stock availability for the per-window stock counter of an availability configuration
+        :param availabilityID: ID of the availability configuration
+        :return: stock available. If False, then stock is not available (including when there is no counter). Otherwise,
+                    the stock available is returned.
+        """
+        if availabilityID is None:
+            raise ValueError("availability ID is required to check window stock")
+        if availabilityID not in self.windowStockCounters:
+            return False
+        physicalStock, reservedStock = self.windowStockCounters[availabilityID]
+        if physicalStock - reservedStock == 0:
+            return False
+        if physicalStock - reservedStock < 0:  # Should never happen. Used to catch bugs or accidents
+            raise ValueError("reserved stock must be smaller or equal to physical stock")
+        return physicalStock - reservedStock
+
+
+    def _stockAvailableForStockConfig(self, _config: _common.AvailabilityConfiguration, availabilityID: int = None) -> _common.AvailabilityIndicator:
         """
         Internal function used for checking stock availability for a specific stock configuration
         :param _config: Stock configuration to check stock available for
+        :param availabilityID: ID of the availability configuration. Required when the configuration uses window stock.
         :return: stock available. If False, then stock is not available. If True, then stock is infinite. Otherwise,
                     the stock available is returned.
         """
@@ -364,6 +757,8 @@ class Product(models.Model):
             return self._modelStockAvailable()
         if "infinite" in _config and _config["infinite"]:
             return True
+        if "windowStock" in _config and _config["windowStock"]:
+            return self._windowStockAvailable(availabilityID)
         if _config["physicalStock"] - _config["reservedStock"] == 0:
             return False
         if _config["physicalStock"] - _config["reservedStock"] < 0:  # Should never happen. Used to catch bugs or accidents
@@ -380,7 +775,7 @@ class Product(models.Model):
         """
 
         try:
-            return self._stockAvailableForStockConfig(self.availability[refID][1])
+            return self._stockAvailableForStockConfig(self.availability[refID][1], refID)
         except KeyError as _e:
             raise IndexError(f"availability ID {refID} not found") from _e
 
@@ -416,33 +811,138 @@ class Product(models.Model):
             return False
         return quantityRequired <= availableQuantity
 
-    def checkProductStock(self, quantityRequired: int, attemptUntilStockFound: bool = False, overrideTime: datetime = None) -> bool:
+    @property
+    def availabilityIndex(self) -> AvailabilityIndex:
         """
-        Check if the product has enough stock to sell
+        The compiled availability index for this product. Cached in-process on (id, _saveVersion); unsaved products are
+        compiled on every access as they have no stable save version.
+        """
+        if self._state.adding:
+            return AvailabilityIndex(self.availability)
+        return AVAILABILITY_INDEX_CACHE.get((self.id, self._saveVersion), lambda: self.availability)  # Only decoded on a cache miss
+
+    def matchProductStock(self, quantityRequired: int, attemptUntilStockFound: bool = False, overrideTime: datetime = None) -> tuple[bool, int | None]:
+        """
+        Check if the product has enough stock to sell, and find the availability configuration used
+        :param quantityRequired: Quantity required
+        :param attemptUntilStockFound: Attempt all applicable availability configurations, not only the first
+        :param overrideTime: Time to check at. If None, now.
+        :return: (enough stock, availability ID). The availability ID is None when model stock is used. When there is
+                    not enough stock, the availability ID is of the first applicable availability configuration.
         """
         if overrideTime is None: overrideTime = datetime.now(tz=TZ_INFO)
 
         # No availability config, use model stock
-        if self.availability is None:
-            return self._compareStockQuantity(quantityRequired, self._modelStockAvailable())
-
-        atLeastOneConfigApplicable = False
-        # Check availability configurations
-        for _id, (timerange, _config) in self.availability.items():
-            # First, check if timestamp is in timerange
-            if timerange != "default":
-                if not self._checkIfTimeInRange(overrideTime, timerange):
-                    continue
-                atLeastOneConfigApplicable = True
-            else: atLeastOneConfigApplicable = True
-            if self._compareStockQuantity(quantityRequired, self._stockAvailableForStockConfig(_config)):
-                return True
+        if Product.availability.peek(self) is None:
+            return self._compareStockQuantity(quantityRequired, self._modelStockAvailable()), None
+
+        firstApplicableID = None
+        # Check availability configurations applicable to the timestamp, in order of priority
+        for window in self.availabilityIndex.applicable(overrideTime):
+            if firstApplicableID is None:
+                firstApplicableID = window.availabilityID
+            if self._compareStockQuantity(quantityRequired, window.evaluate(self)):
+                return True, window.availabilityID
             # If not found, attempt next configuration. But if only use the first configuration in timerange, then break.
             if not attemptUntilStockFound:
-                return False
-        if not atLeastOneConfigApplicable:
+                return False, window.availabilityID
+        if firstApplicableID is None:
             raise _common.NoTimerangeApplicable(f"no availability configuration applicable for {overrideTime} and {self.__repr__()}")
-        return False
+        return False, firstApplicableID
+
+    def checkProductStock(self, quantityRequired: int, attemptUntilStockFound: bool = False, overrideTime: datetime = None) -> bool:
+        """
+        Check if the product has enough stock to sell
+        """
+        return self.matchProductStock(quantityRequired, attemptUntilStockFound, overrideTime)[0]
+
+    @classmethod
+    def checkStockBulk(cls: Union[Self, Callable], items: dict[str, int], at: datetime = None, attemptUntilStockFound: bool = False) -> dict[str, _common.StockCheckResult]:
+        """
+        Check the stock of many products (e.g., a cart or a menu) with one query, against a single time snapshot
+        :param items: {product ID (UUID, or its prefixed or bare string form): quantity required}
+        :param at: Time to check at. If None, now.
+        :param attemptUntilStockFound: Attempt all applicable availability configurations, not only the first
+        :return: {product ID as given: result}. Products that do not exist, or have no applicable availability
+                    configuration, are reported as not available with a reason rather than raised.
+        """
+        if at is None: at = datetime.now(tz=TZ_INFO)
+        parsed = dict()
+        for productID in items.keys():
+            try:
+                parsed[productID] = cls.parseID(productID)
+            except (TypeError, ValueError):
+                parsed[productID] = None
+        products = cls.objects.in_bulk([pk for pk in parsed.values() if pk is not None])
+        cls._prefetchWindowStock(products.values())
+        results = dict()
+        for productID, quantityRequired in items.items():
+            product = products.get(parsed[productID])
+            if product is None:
+                results[productID] = _common.StockCheckResult(productID, quantityRequired, False, -1, "product not found")
+                continue
+            try:
+                available, availabilityID = product.matchProductStock(quantityRequired, attemptUntilStockFound, at)
+            except _common.NoTimerangeApplicable as _e:
+                results[productID] = _common.StockCheckResult(productID, quantityRequired, False, -1, _e.__str__())
+                continue
+            results[productID] = _common.StockCheckResult(productID, quantityRequired, available, availabilityID)
+        return results
+
+
+    @classmethod
+    def onMenuAt(cls: Union[Self, Callable], at: datetime = None) -> models.QuerySet:
+        """
+        Get the products on sale at a time, in one indexed query over ProductAvailabilityWindow: products without an
+        availability configuration, and products whose first applicable availability configuration is available.
+        Stock quantities are not checked; use checkStockBulk for that.
+        :param at: Time to check. If None, now.
+        :return: QuerySet of the products
+        """
+        if at is None: at = datetime.now(tz=TZ_INFO)
+        first = (ProductAvailabilityWindow.objects.applicableAt(at)
+                 .order_by("linkedProduct", "priority").distinct("linkedProduct").values("id"))
+        onSale = ProductAvailabilityWindow.objects.filter(id__in=first, available=True).values("linkedProduct")
+        return cls.objects.filter(models.Q(availability__isnull=True) | models.Q(id__in=onSale))
+
+    @classmethod
+    def reserveStockBulk(cls: Union[Self, Callable], items: dict[str, int], allOrNothing: bool = False) -> set[str]:
+        """
+        Reserve model stock (reservedStock) for many products in a single conditional UPDATE
+        (reservedStock = reservedStock + n WHERE physicalStock - reservedStock >= n)
+        :param items: {product ID: quantity to reserve}
+        :param allOrNothing: If True, reserve nothing and raise InsufficientStock when any line fails
+        :return: IDs of the products that could not be reserved (not enough stock, or not found)
+        """
+        with transaction.atomic():
+            reserved = _adjustReservedStock(cls, items)
+            failed = set(items.keys()) - set(reserved.keys())
+            if failed and allOrNothing:
+                raise _common.InsufficientStock(f"insufficient stock to reserve {failed.__len__()} of {items.__len__()} lines", failed)
+        return failed
+
+    @classmethod
+    def releaseStockBulk(cls: Union[Self, Callable], items: dict[str, int]) -> set[str]:
+        """
+        Release reserved model stock for many products in a single conditional UPDATE
+        :param items: {product ID: quantity to release}
+        :return: IDs of the products that could not be released (less stock reserved than requested, or not found)
+        """
+        released = _adjustReservedStock(cls, items, release=True)
+        return set(items.keys()) - set(released.keys())
+
+    def reserveStock(self, quantity: int, release: bool = False) -> bool:
+        """
+        Reserve (or release) model stock for this product atomically, without saving the rest of the row
+        :param quantity: Quantity to reserve or release
+        :param release: Release reserved stock instead of reserving it
+        :return: True if successful, False if there was not enough stock (or reserved stock, when releasing)
+        """
+        result = _adjustReservedStock(self.__class__, {self.id: quantity}, release=release)
+        if self.id not in result:
+            return False
+        self.reservedStock, self._saveVersion = result[self.id]
+        return True
 
 
     def __str__(self):
@@ -451,13 +951,176 @@ class Product(models.Model):
     def __repr__(self):
         return f'<{self.__class__.__qualname__} {self.id}: {self.name}>'
 
-class OrderLine(models.Model):
+class ProductWindowStock(models.Model):
+    """
+    Stock counters of one availability configuration of a product (see "windowStock" in Product.availability).
+    Kept in their own rows, keyed by (product, availability ID) as with OrderLine.availabilityID, so reserving stock in
+    one window is a small atomic UPDATE rather than a rewrite of the whole availability configuration, and different
+    windows do not contend with each other.
+    """
+    id = models.BigAutoField(primary_key=True, help_text="Unique Window Stock ID")
+    linkedProduct = models.ForeignKey(Product, on_delete=models.CASCADE, help_text="Product ID", null=False, blank=False)
+    availabilityID = models.IntegerField(help_text="ID of Stock Configuration in linked Product", null=False, blank=False)
+    physicalStock = models.PositiveIntegerField(help_text="Window Physical Stock", null=False, blank=False, default=0)
+    reservedStock = models.PositiveIntegerField(help_text="Window Reserved Stock", null=False, blank=False, default=0)
+    _saveVersion = IntegerVersionField(help_text="Save Version for Concurrency Control")
+
+
+    class Meta:
+        db_table_comment = "Product Window Stock"
+        verbose_name = "Product Window Stock"
+        verbose_name_plural = "Product Window Stock"
+        constraints = [
+            models.UniqueConstraint(fields=["linkedProduct", "availabilityID"], name="CanDB_ProductWindowStock_Window_Unique"),
+            # Reserve stock must be smaller or equal to physical stock
+            models.CheckConstraint(check=models.Q(reservedStock__lte=models.F("physicalStock")),
+                                   name="CanDB_ProductWindowStock_Stock_Reserve",
+                                   violation_error_code="PRODUCTWINDOWSTOCK-STOCK-1",
+                                   violation_error_message="Reserved stock must be smaller or equal to physical stock"),
+        ]
+
+
+    @classmethod
+    def createForProduct(cls: Union[Self, Callable], product: Product) -> list[Self]:
+        """
+        Create the counters for the availability configurations of a product that use window stock, initialised from
+        "physicalStock" and "reservedStock" in the configuration (0 if not given). Existing counters are kept.
+        :param product: The product
+        :return: The counters created
+        """
+        if product.availability is None:
+            return list()
+        counters = [cls(linkedProduct=product, availabilityID=_id, physicalStock=_config.get("physicalStock", 0), reservedStock=_config.get("reservedStock", 0))
+                    for _id, (_, _config) in product.availability.items() if _config.get("windowStock")]
+        if not counters:
+            return list()
+        product.refreshWindowStock()
+        return cls.objects.bulk_create(counters, ignore_conflicts=True)
+
+    @classmethod
+    def reserveBulk(cls: Union[Self, Callable], items: dict[tuple[str, int], int], allOrNothing: bool = False) -> set[tuple[str, int]]:
+        """
+        Reserve stock in many windows in a single conditional UPDATE
+        :param items: {(product ID, availability ID): quantity to reserve}
+        :param allOrNothing: If True, reserve nothing and raise InsufficientStock when any line fails
+        :return: (product ID, availability ID) of the windows that could not be reserved (not enough stock, or no counter)
+        """
+        with transaction.atomic():
+            reserved = _adjustReservedStock(cls, items, keyFields=("linkedProduct", "availabilityID"))
+            failed = set(items.keys()) - set(reserved.keys())
+            if failed and allOrNothing:
+                raise _common.InsufficientStock(f"insufficient window stock to reserve {failed.__len__()} of {items.__len__()} lines", failed)
+        return failed
+
+    @classmethod
+    def releaseBulk(cls: Union[Self, Callable], items: dict[tuple[str, int], int]) -> set[tuple[str, int]]:
+        """
+        Release reserved stock in many windows in a single conditional UPDATE
+        :param items: {(product ID, availability ID): quantity to release}
+        :return: (product ID, availability ID) of the windows that could not be released
+        """
+        released = _adjustReservedStock(cls, items, release=True, keyFields=("linkedProduct", "availabilityID"))
+        return set(items.keys()) - set(released.keys())
+
+
+    def __str__(self):
+        return f'<ProductWindowStock {self.linkedProduct_id}#{self.availabilityID}: {self.reservedStock}/{self.physicalStock}>'
+
+    def __repr__(self):
+        return f'<{self.__class__.__qualname__} {self.linkedProduct_id}#{self.availabilityID}: {self.reservedStock}/{self.physicalStock}>'
+
+
+class ProductAvailabilityWindowQuerySet(models.QuerySet):
+    def applicableAt(self, at: datetime) -> Self:
+        """
+        Filter to the windows whose timerange applies at a time (see Product.availability). Each kind of timerange has
+        its own GiST index, so this is a bitmap OR of index scans rather than a scan of every product's configuration.
+        :param at: Time to check
+        """
+        return self.filter(models.Q(timeRange__contains=at) | models.Q(dateRange__contains=at.date())
+                           | models.Q(weekdayRange__contains=at.weekday()) | models.Q(alwaysApplies=True))
+
+
+class ProductAvailabilityWindow(models.Model):
+    """
+    One availability configuration of a product, normalised from Product.availability into range columns so "what is
+    on sale at time T" can be answered by the database. Product.availability remains the source of truth: the rows of a
+    product are rebuilt whenever it is saved (QuerySet.update and bulk_update bypass this; call syncForProduct after).
+    """
+    id = models.BigAutoField(primary_key=True, help_text="Unique Availability Window ID")
+    linkedProduct = models.ForeignKey(Product, on_delete=models.CASCADE, help_text="Product ID", null=False, blank=False)
+    availabilityID = models.IntegerField(help_text="ID of Stock Configuration in linked Product", null=False, blank=False)
+    priority = models.PositiveIntegerField(help_text="Position in the availability configuration. Lower is higher priority.", null=False, blank=False)
+    available = models.BooleanField(help_text="Whether the configuration (following references) is available", null=False, blank=False)
+    timeRange = DateTimeRangeField(help_text="Inclusive datetime timerange", null=True, blank=True, default=None)
+    dateRange = DateRangeField(help_text="Inclusive date timerange", null=True, blank=True, default=None)
+    weekdayRange = IntegerRangeField(help_text="Inclusive weekday timerange, 0 = Monday", null=True, blank=True, default=None)
+    alwaysApplies = models.BooleanField(help_text="Applies at any time (\"default\", or a bad timerange)", null=False, blank=False, default=False)
+
+    objects = ProductAvailabilityWindowQuerySet.as_manager()
+
+
+    class Meta:
+        ordering = ["linkedProduct", "priority"]
+        db_table_comment = "Product Availability Window"
+        verbose_name = "Product Availability Window"
+        verbose_name_plural = "Product Availability Windows"
+        indexes = [
+            GistIndex(fields=["timeRange"], name="CanDB_PAW_TimeRange_Index", condition=models.Q(timeRange__isnull=False)),
+            GistIndex(fields=["dateRange"], name="CanDB_PAW_DateRange_Index", condition=models.Q(dateRange__isnull=False)),
+            GistIndex(fields=["weekdayRange"], name="CanDB_PAW_WeekdayRange_Index", condition=models.Q(weekdayRange__isnull=False)),
+            models.Index(fields=["linkedProduct"], name="CanDB_PAW_Always_Index", condition=models.Q(alwaysApplies=True)),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["linkedProduct", "availabilityID"], name="CanDB_PAW_Window_Unique"),
+        ]
+
+
+    @classmethod
+    def syncForProduct(cls: Union[Self, Callable], product: Product) -> list[Self]:
+        """
+        Rebuild the windows of a product from its availability configuration
+        :param product: The product
+        :return: The windows created
+        """
+        cls.objects.filter(linkedProduct=product).delete()
+        if product.availability is None:
+            return list()
+        return cls.objects.bulk_create([cls(linkedProduct=product, **row) for row in windowRows(product.availability)])
+
+
+    def __str__(self):
+        return f'<ProductAvailabilityWindow {self.linkedProduct_id}#{self.availabilityID}>'
+
+    def __repr__(self):
+        return f'<{self.__class__.__qualname__} {self.linkedProduct_id}#{self.availabilityID}>'
+
+
+class OrderLineQuerySet(models.QuerySet):
+    def recalculateItemCost(self) -> int:
+        """
+        Recalculate itemCost of every order line in the queryset with one UPDATE, as OrderLine.calculateItemCost does:
+        quantity * persistentCost, or forcePrice when persistentCost is not set. Lines with neither are left unchanged.
+        :return: Number of order lines updated
+        """
+        return self.filter(models.Q(persistentCost__isnull=False) | models.Q(forcePrice__isnull=False)).update(
+            itemCost=models.Case(
+                models.When(persistentCost__isnull=False, then=models.F("quantity") * models.F("persistentCost")),
+                default=models.F("forcePrice"),
+                output_field=OrderLine._meta.get_field("itemCost"),
+            ),
+            _saveVersion=models.F("_saveVersion") + 1,
+        )
+
+
+class OrderLine(PrefixedIDModel, models.Model):
     """
     Interchange layer between Order and Product
     """
-    id = models.CharField(primary_key=True, help_text="Unique OrderLine ID, same across databases", null=False, blank=False, unique=True, max_length=46)  # ORDERLINE-UUID4 (len 46)
-    linkedOrder = models.ForeignKey(Order, on_delete=models.CASCADE, help_text="Order ID", default=-1, null=False, blank=False)
-    linkedProduct = models.ForeignKey(Product, on_delete=models.CASCADE, help_text="Product ID", default=-1, null=False, blank=False)
+    ID_PREFIX = "ORDERLINE-"
+    id = models.UUIDField(primary_key=True, help_text="Unique OrderLine ID, same across databases", null=False, blank=False, unique=True)  # Shown as ORDERLINE-<uuid> at the API boundary
+    linkedOrder = models.ForeignKey(Order, on_delete=models.CASCADE, help_text="Order ID", null=False, blank=False, db_index=False)  # Indexed by CanDB_OrderLine_Order_Index
+    linkedProduct = models.ForeignKey(Product, on_delete=models.CASCADE, help_text="Product ID", null=False, blank=False)
     quantity = models.PositiveIntegerField(help_text="Quantity", null=False, blank=False, default=1)
     quantityReserved = models.PositiveIntegerField(help_text="Quantity Reserved", null=False, blank=False, default=0)
     persistentCost = models.DecimalField(max_digits=cfg.OrderLine.MAXIMUM_COST_DIGITS, decimal_places=cfg.OrderLine.COST_DECIMAL_DIGITS, help_text="Persistent Cost", null=True, blank=False)  # When None, use linkedProduct.price. Means transaction has not been calculated yet; the customer is still shopping. Price of EACH product object.
@@ -470,20 +1133,20 @@ class OrderLine(models.Model):
     # Similar to the ID system used in stock configs in Product model, None means use model stock, -1 means not set
     _saveVersion = IntegerVersionField(help_text="Save Version for Concurrency Control")
 
+    objects = OrderLineQuerySet.as_manager()
+
 
     class Meta:
         ordering = ['id',]
         db_table_comment = "Order Lines"
         permissions = [("view_any_orderline", "Can view any orderline regardless of its owner"), ("change_any_orderline", "Can change any orderlines regardless of its owner"), ("change_any_orderline_but_forceprice", "Can change any orderlines regardless of its owner, but cannot force a price"), ("delete_any_orderline", "Can delete any orderlines regardless of its owner"), ("add_any_orderline", "Can add orderlines regardless of its owner")]
-        indexes = [models.Index(fields=["id", "linkedOrder"], name="CanDB_OrderLine_ID_Index")]
+        indexes = [
+            models.Index(fields=["linkedOrder", "status"], name="CanDB_OrderLine_Order_Index"),  # Lines of an order, optionally by status
+            models.Index(fields=["status"], name="CanDB_OrderLine_Open_Index", condition=models.Q(status__in=cfg.OrderLine.OPEN_STATUSES)),  # Work queues
+        ]
         verbose_name = "OrderLine"
         verbose_name_plural = "OrderLines"
         constraints = [
-            models.UniqueConstraint(fields=["id",], name="CanDB_OrderLines_ID_User_Unique"),
-            models.CheckConstraint(check=models.Q(id__len=46),
-                                   name="CanDB_OrderLine_ID_Len",
-                                   violation_error_code="ORDERLINE-ID-1",
-                                   violation_error_message="OrderLine ID must be 46 characters long"),
             # Check quantity reserved is not higher than quantity
             models.CheckConstraint(check=models.Q(quantityReserved__lte=models.F("quantity")),
                                    name="CanDB_OrderLine_Quantity_Reserve",
@@ -520,11 +1183,11 @@ class OrderLine(models.Model):
         Create a new order line
         Where itemCost is None, it is NOT auto-calculated
         """
-        uid = f"ORDERLINE-{uuid.uuid4()}"
+        uid = _newID()
 
-        if (not (isinstance(quantity, int) and (isinstance(persistentCost, (int, float)) or persistentCost is None) and
-                (isinstance(itemCost, (int, float)) or persistentCost is None) and
-                isinstance(forcePrice, (int, float)) or forcePrice is None)):
+        if (not (isinstance(quantity, int) and (isinstance(persistentCost, (int, float, Decimal)) or persistentCost is None) and
+                (isinstance(itemCost, (int, float, Decimal)) or persistentCost is None) and
+                isinstance(forcePrice, (int, float, Decimal)) or forcePrice is None)):
             raise TypeError("bad type for quantity, persistentCost, itemCost or forcePrice")
         if ((persistentCost is not None and persistentCost < 0) or (itemCost is not None and itemCost < 0) or
                 (forcePrice is not None and forcePrice < 0)):
@@ -559,6 +1222,36 @@ class OrderLine(models.Model):
         if autosave: ol.save()
         return ol
 
+    @classmethod
+    def reserveLines(cls: Union[Self, Callable], lines: Iterable[Self]) -> None:
+        """
+        Reserve the stock of order lines, all or nothing, and set their quantityReserved (not saved).
+        Model stock is reserved for lines with availabilityID None, and window stock for lines whose availability
+        configuration (following references) uses windowStock. Other lines have no stock to reserve and are left as is.
+        Lines of the same product (or window) are reserved together, with one UPDATE for model stock and one for window stock.
+        """
+        modelItems, windowItems, reserving = dict(), dict(), list()
+        for line in lines:
+            product = line.linkedProduct
+            if line.availabilityID is None:
+                modelItems[product.id] = modelItems.get(product.id, 0) + line.quantity
+            elif line.availabilityID != -1 and product.availability is not None:
+                resolved = resolveReference(product.availability, line.availabilityID)
+                if not (isinstance(resolved, tuple) and resolved[1].get("windowStock")):
+                    continue
+                key = (product.id, resolved[0])
+                windowItems[key] = windowItems.get(key, 0) + line.quantity
+            else:
+                continue
+            reserving.append(line)
+        with transaction.atomic():
+            if modelItems:
+                Product.reserveStockBulk(modelItems, allOrNothing=True)
+            if windowItems:
+                ProductWindowStock.reserveBulk(windowItems, allOrNothing=True)
+        for line in reserving:
+            line.quantityReserved = line.quantity
+
     def calculateItemCost(self, autosave: bool = True) -> float:
         """
         Calculates the item cost.
@@ -621,7 +1314,7 @@ def __devEnvCreator() -> bool:
                                         {"available": True, "infinite": True},
                                   ),
                                   3: (
-                                      (datetime.now(tz=TZ_INFO).now().weekday(), datetime.now(tz=TZ_INFO).weekday()+2),
+                                      (datetime.now(tz=TZ_INFO).weekday(), min(datetime.now(tz=TZ_INFO).weekday() + 2, 6)),
                                       {"available": True, "physicalStock": 3, "reservedStock": 3},
                                   ),
                                   4: (
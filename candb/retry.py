@@ -0,0 +1,216 @@
+"""
+Conflict-aware retries for saves guarded by IntegerVersionField (django-concurrency).
+
+A save of a row that was changed since it was loaded raises RecordModifiedError. ConflictRetry re-runs the work (which
+must re-fetch the row), with jittered exponential backoff, and records per-model metrics so contention hot spots can be
+seen (RETRY_METRICS, also served to admins by capi).
+
+Three ways to use it:
+    ConflictRetry().run(Product, productID, lambda product: setattr(product, "notes", notes))   # fetch, mutate, save
+
+    @ConflictRetry()
+    def rename(productID, name):                          # the whole function is re-run on a conflict
+        product = Product.objects.get(pk=productID)
+        product.name = name
+        product.save()
+
+    for attempt in ConflictRetry().attempts(Product):     # context manager for each attempt
+        with attempt:
+            product = Product.objects.get(pk=productID)
+            product.name = name
+            product.save()
+
+Retrying inside an outer transaction keeps its locks held while backing off; retry outside transactions where possible.
+"""
+
+from candb import *
+from candb import config as cfg
+from bisect import bisect_left
+from concurrency.exceptions import RecordModifiedError
+from django.db import models  # Explicitly: the star import above makes models the candb.models module
+from functools import wraps
+from typing import Iterator
+from time import perf_counter, sleep
+import random
+import threading
+
+
+class RetryMetrics:
+    """
+    Thread-safe, in-process counters and latency histograms of conflict retries, per model
+    """
+    def __init__(self, latencyBuckets: tuple[float, ...]):
+        self.latencyBuckets = tuple(sorted(latencyBuckets))
+        self._models: dict[str, dict[str, Any]] = dict()
+        self._lock = threading.Lock()
+
+    def _entry(self, label: str) -> dict[str, Any]:
+        entry = self._models.get(label)
+        if entry is None:
+            entry = self._models[label] = {"calls": 0, "conflicts": 0, "retries": 0, "exhausted": 0,
+                                           "latency": [0] * (self.latencyBuckets.__len__() + 1)}
+        return entry
+
+    def conflict(self, label: str, retried: bool) -> None:
+        """
+        Record a conflict, and whether it is retried
+        """
+        with self._lock:
+            entry = self._entry(label)
+            entry["conflicts"] += 1
+            if retried:
+                entry["retries"] += 1
+            else:
+                entry["exhausted"] += 1
+
+    def finished(self, label: str, seconds: float) -> None:
+        """
+        Record a finished call (successful or not) and its latency, including retries
+        """
+        with self._lock:
+            entry = self._entry(label)
+            entry["calls"] += 1
+            entry["latency"][bisect_left(self.latencyBuckets, seconds)] += 1
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        """
+        :return: {model label: {"calls", "conflicts", "retries", "exhausted", "latency": {upper bound in seconds: count}}}.
+                    The last latency bucket ("+Inf") counts calls slower than every bound.
+        """
+        bounds = [str(bound) for bound in self.latencyBuckets] + ["+Inf"]
+        with self._lock:
+            return {label: {**{k: v for k, v in entry.items() if k != "latency"}, "latency": dict(zip(bounds, entry["latency"]))}
+                    for label, entry in self._models.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+
+RETRY_METRICS = RetryMetrics(cfg.Retry.LATENCY_BUCKETS)
+
+
+def _label(model: type[models.Model] | models.Model | None) -> str:
+    if model is None:
+        return "unknown"
+    return model._meta.label
+
+
+class _Run:
+    """
+    State of one retried call, shared by its attempts
+    """
+    def __init__(self, metrics: RetryMetrics, label: str | None):
+        self.metrics = metrics
+        self.label = label
+        self.began = perf_counter()
+        self.finished = False
+
+    def finish(self) -> None:
+        if not self.finished:
+            self.finished = True
+            self.metrics.finished(self.label if self.label is not None else "unknown", perf_counter() - self.began)
+
+
+class Attempt:
+    """
+    One attempt of a ConflictRetry. As a context manager, it swallows RecordModifiedError (after backing off) while
+    attempts remain, and re-raises it once they are exhausted.
+    """
+    def __init__(self, retry: "ConflictRetry", run: _Run, number: int):
+        self.retry = retry
+        self.run = run
+        self.number = number  # 0 for the first attempt
+        self.succeeded = False
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, excType, excValue, traceback) -> bool:
+        if excType is None:
+            self.succeeded = True
+            self.run.finish()
+            return False
+        if not issubclass(excType, RecordModifiedError):
+            self.run.finish()
+            return False
+        if self.run.label is None and getattr(excValue, "target", None) is not None:
+            self.run.label = _label(excValue.target)
+        retried = self.number + 1 < self.retry.maximumAttempts
+        self.retry.metrics.conflict(self.run.label if self.run.label is not None else "unknown", retried)
+        if not retried:
+            self.run.finish()
+            return False
+        sleep(self.retry.backoff(self.number))
+        return True
+
+
+class ConflictRetry:
+    """
+    Retry work that fails with RecordModifiedError. See module documentation.
+    """
+    def __init__(self, maximumAttempts: int = None, baseDelay: float = None, maximumDelay: float = None, metrics: RetryMetrics = None):
+        """
+        :param maximumAttempts: Attempts before RecordModifiedError is re-raised. If None, cfg.Retry.MAXIMUM_ATTEMPTS.
+        :param baseDelay: Backoff before the first retry, in seconds (doubled for each retry). If None, cfg.Retry.BASE_DELAY.
+        :param maximumDelay: Maximum backoff, in seconds. If None, cfg.Retry.MAXIMUM_DELAY.
+        :param metrics: Where to record metrics. If None, RETRY_METRICS.
+        """
+        self.maximumAttempts = cfg.Retry.MAXIMUM_ATTEMPTS if maximumAttempts is None else maximumAttempts
+        self.baseDelay = cfg.Retry.BASE_DELAY if baseDelay is None else baseDelay
+        self.maximumDelay = cfg.Retry.MAXIMUM_DELAY if maximumDelay is None else maximumDelay
+        self.metrics = RETRY_METRICS if metrics is None else metrics
+        if self.maximumAttempts < 1:
+            raise ValueError("maximumAttempts must be at least 1")
+        if self.baseDelay < 0 or self.maximumDelay < 0:
+            raise ValueError("delays must be non-negative")
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Backoff after a failed attempt, with full jitter: uniform in [0, min(maximumDelay, baseDelay * 2 ** attempt)]
+        """
+        return random.uniform(0, min(self.maximumDelay, self.baseDelay * 2 ** attempt))
+
+    def attempts(self, model: type[models.Model] = None) -> Iterator[Attempt]:
+        """
+        Iterate over attempts until one succeeds. Use each attempt as a context manager around the work.
+        :param model: Model the metrics are recorded for. If None, the model of the conflicting instance.
+        """
+        run = _Run(self.metrics, _label(model) if model is not None else None)
+        try:
+            for number in range(self.maximumAttempts):
+                attempt = Attempt(self, run, number)
+                yield attempt
+                if attempt.succeeded:
+                    return
+        finally:
+            run.finish()
+
+    def run[T](self, model: type[models.Model], pk: Any, mutate: Callable[[models.Model], T]) -> T:
+        """
+        Fetch a row, apply a mutation to it and save it, re-fetching and re-applying the mutation on a conflict
+        :param model: The model
+        :param pk: Primary key of the row
+        :param mutate: Function applied to the fetched instance before it is saved. It may be called more than once.
+        :return: What mutate returned on the successful attempt
+        """
+        for attempt in self.attempts(model):
+            with attempt:
+                instance = model.objects.get(pk=pk)
+                result = mutate(instance)
+                instance.save()
+            if attempt.succeeded:
+                return result
+
+    def __call__[**P, T](self, function: Callable[P, T]) -> Callable[P, T]:
+        """
+        Decorate a function to be re-run on a conflict. The function must re-fetch the rows it changes.
+        """
+        @wraps(function)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            for attempt in self.attempts():
+                with attempt:
+                    result = function(*args, **kwargs)
+                if attempt.succeeded:
+                    return result
+        return wrapper
@@ -1,3 +1,199 @@
 from django.test import TestCase
 
 # Create your tests here.
+from candb import *
+from candb import antiRacing
+from candb import common as _common
+from candb.availability import AVAILABILITY_INDEX_CACHE
+from candb.models import Profile, Order, OrderLine, Product
+from candb.retry import ConflictRetry, RetryMetrics
+from django.db import connection, models  # models explicitly: the star import above makes it the candb.models module
+from django.test.utils import CaptureQueriesContext
+from unittest import mock
+import json
+import random
+
+
+class AccessPathTests(TestCase):
+    """
+    EXPLAIN the ORM queries used by capi.apis, and the main access paths of candb, against large fixtures, with
+    sequential scans disabled. A query that still plans a sequential scan of one of the large tables has no usable index,
+    and fails the test.
+    """
+    PROFILES = 2_000
+    PRODUCTS = 2_000
+    ORDERS = 20_000
+    LINES_PER_ORDER = 3
+    TAGS = 50
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        Profile.objects.bulk_create([Profile(username=f"access-path-{n}", password="", date_joined=start + timedelta(minutes=n)) for n in range(cls.PROFILES)])
+        profiles = list(Profile.objects.values_list("id", flat=True))
+        Product.objects.bulk_create([Product(id=_common.uuid7(), name=f"Product {n}", price=1, physicalStock=10, reservedStock=0,
+                                             tags=[f"tag-{rng.randrange(cls.TAGS)}", f"tag-{rng.randrange(cls.TAGS)}"]) for n in range(cls.PRODUCTS)])
+        products = list(Product.objects.values_list("id", flat=True))
+        orders = [Order(id=_common.uuid7(), user_id=rng.choice(profiles), orderTime=start + timedelta(minutes=15 * n)) for n in range(cls.ORDERS)]
+        Order.objects.bulk_create(orders)
+        closed = (_common.OrderLineStatus.Delivered, _common.OrderLineStatus.Cancelled, _common.OrderLineStatus.Returned)
+        lines = [OrderLine(id=_common.uuid7(), linkedOrder=order, linkedProduct_id=rng.choice(products), quantity=1,
+                           status=rng.choice(cfg.OrderLine.OPEN_STATUSES) if rng.random() < 0.02 else rng.choice(closed))
+                 for order in orders for _ in range(cls.LINES_PER_ORDER)]
+        OrderLine.objects.bulk_create(lines, batch_size=10_000)
+        with connection.cursor() as cursor:
+            for model in (Profile, Product, Order, OrderLine):
+                cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+        cls.profile = Profile.objects.get(username="access-path-0")
+        cls.order = orders[cls.ORDERS // 2]
+        cls.start = start
+
+    @classmethod
+    def _sequentialScans(cls, plan: dict) -> list[str]:
+        tables = {model._meta.db_table for model in (Profile, Product, Order, OrderLine)}
+        scans = [plan["Relation Name"]] if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in tables else list()
+        for child in plan.get("Plans", list()):
+            scans.extend(cls._sequentialScans(child))
+        return scans
+
+    def assertIndexed(self, queryset: models.QuerySet) -> None:
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            # Sequential scans are only chosen when no index can serve the query, whatever the planner's cost estimates
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        scans = self._sequentialScans(plan[0]["Plan"])
+        self.assertFalse(scans, f"sequential scan of {', '.join(scans)} for: {sql}")
+
+    # capi.apis
+    def test_profile_list_page(self):
+        self.assertIndexed(Profile.objects.all().order_by('-date_joined')[:20])
+
+    def test_order_retrieve(self):
+        self.assertIndexed(Order.objects.all().order_by('-orderTime').filter(pk=self.order.pk))
+
+    # Access paths
+    def test_orders_of_user(self):
+        self.assertIndexed(Order.objects.filter(user=self.profile).order_by('-orderTime')[:20])
+
+    def test_lines_of_order(self):
+        self.assertIndexed(OrderLine.objects.filter(linkedOrder=self.order))
+
+    def test_open_lines_by_status(self):
+        self.assertIndexed(OrderLine.objects.filter(status=_common.OrderLineStatus.In_Production))
+
+    def test_products_by_tag(self):
+        self.assertIndexed(Product.objects.filter(tags__contains=["tag-7"]))
+
+    def test_orders_in_time_range(self):
+        self.assertIndexed(Order.objects.filter(orderTime__gte=self.start + timedelta(days=10), orderTime__lt=self.start + timedelta(days=11)))
+
+
+class ConflictRetryTests(TestCase):
+    def test_run(self):
+        product = Product.create("Retried", 1, "Retried product")
+        metrics = RetryMetrics(cfg.Retry.LATENCY_BUCKETS)
+        result = ConflictRetry(metrics=metrics).run(Product, product.id, lambda instance: setattr(instance, "notes", "retried") or "done")
+        self.assertEqual(result, "done")
+        product.refresh_from_db()
+        self.assertEqual(product.notes, "retried")
+        (entry,) = metrics.snapshot().values()
+        self.assertEqual((entry["calls"], entry["conflicts"]), (1, 0))
+
+
+class LockPlannerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob = (Profile.objects.create(username=f"lock-{name}", password="") for name in ("alice", "bob"))
+        cls.p1, cls.p2, cls.p3 = (Product.objects.create(id=_common.uuid7(), name=f"Lock product {n}", price=1, physicalStock=10, reservedStock=0)
+                                  for n in range(3))
+        start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        cls.a, cls.b, cls.c = (Order.objects.create(id=_common.uuid7(), user=user, orderTime=start + timedelta(hours=n))
+                               for n, user in enumerate((cls.alice, cls.alice, cls.bob)))
+        line = lambda order, product: OrderLine.objects.create(id=_common.uuid7(), linkedOrder=order, linkedProduct=product, quantity=1,
+                                                               status=cfg.OrderLine.OPEN_STATUSES[0])
+        cls.a1, cls.a2, cls.b1, cls.c1 = line(cls.a, cls.p1), line(cls.a, cls.p2), line(cls.b, cls.p2), line(cls.c, cls.p3)
+
+    def test_plan_order(self):
+        # The lines of the order, and forward from there; not the other orders of the profile or lines of the products
+        self.assertEqual(antiRacing.planLocks(Order, self.a.pk), {
+            Order: {self.a.pk}, OrderLine: {self.a1.pk, self.a2.pk}, Product: {self.p1.pk, self.p2.pk}, Profile: {self.alice.pk},
+        })
+
+    def test_plan_profile(self):
+        # Backward edges only from the root: the orders of the profile, but not their lines
+        self.assertEqual(antiRacing.planLocks(Profile, self.alice.pk), {Profile: {self.alice.pk}, Order: {self.a.pk, self.b.pk}})
+        self.assertEqual(antiRacing.planLocks(Profile, self.alice.pk, backwards=()), {Profile: {self.alice.pk}})
+
+    def test_plan_product(self):
+        self.assertEqual(antiRacing.planLocks(Product, self.p2.pk, backwards=(OrderLine,)), {
+            Product: {self.p2.pk}, OrderLine: {self.a2.pk, self.b1.pk}, Order: {self.a.pk, self.b.pk}, Profile: {self.alice.pk},
+        })
+        with self.assertRaises(ValueError):
+            antiRacing.planLocks(models.Model, 1)
+
+    def test_lock_order(self):
+        plan = antiRacing.planLocks(Order, self.a.pk)
+        with transaction.atomic(), CaptureQueriesContext(connection) as queries:
+            locked, skipped = antiRacing.lockRows(plan)
+        tables = {model._meta.db_table: model for model in antiRacing.LOCK_ORDER}
+        lockedModels = [model for query in queries.captured_queries if "FOR UPDATE" in query["sql"]
+                        for table, model in tables.items() if f'FROM "{table}"' in query["sql"]]
+        self.assertEqual(lockedModels, [model for model in antiRacing.LOCK_ORDER if model in plan])
+        self.assertEqual({model: set(rows) for model, rows in locked.items()}, plan)
+        for model, rows in locked.items():
+            self.assertEqual(list(rows), sorted(rows), model.__name__)
+        self.assertEqual(skipped, dict())
+        with self.assertRaises(ValueError):
+            antiRacing.lockRows(plan, nowait=True, skipLocked=True)
+
+    def test_kidnap(self):
+        with antiRacing.kidnapSelfAndBestie(Order, pk=self.a.pk) as locks:
+            self.assertEqual(locks.root, self.a)
+            self.assertTrue(locks.complete)
+            self.assertEqual(set(locks[OrderLine]), {self.a1.pk, self.a2.pk})
+            self.assertEqual(locks[models.Model], dict())
+
+    def test_kidnap_replans(self):
+        # A line was added to the order while its rows were planned: the locks are released and taken again with it
+        small = lambda: {Order: {self.a.pk}, OrderLine: {self.a1.pk}}
+        large = lambda: {Order: {self.a.pk}, OrderLine: {self.a1.pk, self.a2.pk}, Product: {self.p2.pk}}
+        plans = list()
+        lockRows = antiRacing.lockRows
+        with mock.patch.object(antiRacing, "planLocks", side_effect=[small(), large(), large()]) as planLocks, \
+                mock.patch.object(antiRacing, "lockRows", side_effect=lambda plan, *args: plans.append({m: set(pks) for m, pks in plan.items()}) or lockRows(plan, *args)):
+            with antiRacing.kidnapSelfAndBestie(Order, pk=self.a.pk) as locks:
+                self.assertEqual(set(locks[OrderLine]), {self.a1.pk, self.a2.pk})
+                self.assertEqual(set(locks[Product]), {self.p2.pk})
+        self.assertEqual(planLocks.call_count, 3)
+        self.assertEqual(plans, [small(), large()])
+
+
+class WindowStockPrefetchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.window = Product.create("Window stock", 1, "Window stock", availability={1: ("default", {"available": True, "windowStock": True, "physicalStock": 5})})
+        cls.infinite = Product.create("Infinite", 1, "Infinite", availability={1: ("default", {"available": True, "infinite": True})})
+        cls.model = Product.create("Model stock", 1, "Model stock", physicalStock=3)
+
+    def setUp(self):
+        AVAILABILITY_INDEX_CACHE.invalidate()
+
+    def test_prefetch(self):
+        for product in Product.objects.all():
+            product.availabilityIndex  # Compile and cache the indexes
+        products = Product.objects.in_bulk([self.window.pk, self.infinite.pk, self.model.pk])
+        with self.assertNumQueries(1):
+            Product._prefetchWindowStock(products.values())
+        self.assertEqual(products[self.window.pk]._windowStock, {1: (5, 0)})
+        self.assertIsNone(products[self.infinite.pk]._windowStock)
+        # Only read from the cached indexes
+        self.assertFalse(any(Product.availability.isDecoded(product) for product in products.values()))
+
+    def test_check_stock_bulk(self):
+        results = Product.checkStockBulk({self.window.pk: 5, self.infinite.pk: 100, self.model.pk: 4})
+        self.assertEqual([results[pk].available for pk in (self.window.pk, self.infinite.pk, self.model.pk)], [True, True, False])
@@ -0,0 +1,150 @@
+"""
+Request capture profiles for Logs.generateRequestInfo.
+
+Each profile (canlog.common.RequestCaptureProfile) whitelists what is captured from a request, and caps the length of
+each value and the number of items of each mapping. Every profile produces the same fixed-shape record; parts a profile
+does not capture are None.
+Secrets are never stored: secret headers and cookies (cfg.RequestCapture.SECRET_HEADERS, SECRET_COOKIES, e.g. the JWT
+cookies) are replaced by a keyed hash, so requests with the same token can still be correlated; query and form fields
+named like secrets (SECRET_FIELD_MARKERS, e.g. passwords) are redacted outright.
+"""
+
+from canlog import *
+from canlog import config as cfg
+from canlog import common as _common
+from django.http import HttpRequest
+import hashlib
+import hmac
+
+
+REDACTED: str = "<redacted>"
+TRUNCATION_MARK: str = "…"
+
+
+@dataclass(frozen=True)
+class CaptureProfile:
+    name: str
+    headers: tuple[str, ...]  # request.META keys captured
+    allHeaders: bool  # Capture every HTTP_* header too
+    query: bool  # Capture request.GET
+    form: bool  # Capture request.POST
+    cookies: bool  # Capture request.COOKIES
+    files: bool  # Capture the name, size and content type of request.FILES
+    maximumValueLength: int  # Longer values are truncated
+    maximumItems: int  # Items kept of each mapping (and values of each query or form field)
+
+
+_STANDARD_HEADERS: tuple[str, ...] = ("REMOTE_ADDR", "HTTP_USER_AGENT", "CONTENT_TYPE", "CONTENT_LENGTH", "HTTP_REFERER")
+
+PROFILES: dict[str, CaptureProfile] = {
+    _common.RequestCaptureProfile.Minimal: CaptureProfile(_common.RequestCaptureProfile.Minimal, headers=(), allHeaders=False, query=False,
+                                                          form=False, cookies=False, files=False, maximumValueLength=256, maximumItems=0),
+    _common.RequestCaptureProfile.Standard: CaptureProfile(_common.RequestCaptureProfile.Standard, headers=_STANDARD_HEADERS, allHeaders=False,
+                                                           query=True, form=False, cookies=False, files=False, maximumValueLength=256, maximumItems=16),
+    _common.RequestCaptureProfile.Forensic: CaptureProfile(_common.RequestCaptureProfile.Forensic, headers=_STANDARD_HEADERS + ("SERVER_NAME", "SERVER_PORT"),
+                                                           allHeaders=True, query=True, form=True, cookies=True, files=True, maximumValueLength=1024, maximumItems=64),
+}
+
+
+def secretHash(value: str) -> str:
+    """
+    Keyed hash (HMAC-SHA256 with the project secret key) of a secret, so equal secrets can be matched without storing them
+    """
+    digest = hmac.new(GLOBAL_SETTINGS.SECRET_KEY.encode(), value.encode("utf-8", "replace"), hashlib.sha256).hexdigest()
+    return f"hmac:{digest[:cfg.RequestCapture.HASH_LENGTH]}"
+
+
+def _isSecretField(name: str) -> bool:
+    name = name.casefold()
+    return any(marker in name for marker in cfg.RequestCapture.SECRET_FIELD_MARKERS)
+
+
+class _Capture:
+    def __init__(self, profile: CaptureProfile):
+        self.profile = profile
+        self.truncated = False
+
+    def value(self, value: Any) -> str | None:
+        if value is None:
+            return None
+        value = value if isinstance(value, str) else str(value)
+        if value.__len__() > self.profile.maximumValueLength:
+            self.truncated = True
+            return value[:self.profile.maximumValueLength] + TRUNCATION_MARK
+        return value
+
+    def items[T](self, items: Iterable[T]) -> list[T]:
+        kept = list()
+        for item in items:
+            if kept.__len__() >= self.profile.maximumItems:
+                self.truncated = True
+                break
+            kept.append(item)
+        return kept
+
+    def fields(self, data) -> dict[str, str | list[str]]:
+        """
+        Query or form fields (QueryDict). Fields with one value are stored as the value, others as a list.
+        """
+        captured = dict()
+        for name, values in self.items(data.lists()):
+            if _isSecretField(name):
+                captured[self.value(name)] = REDACTED
+                continue
+            values = [self.value(value) for value in self.items(values)]
+            captured[self.value(name)] = values[0] if values.__len__() == 1 else values
+        return captured
+
+    def headers(self, meta: dict) -> dict[str, str]:
+        names = list(self.profile.headers)
+        if self.profile.allHeaders:
+            names.extend(sorted(name for name in meta if name.startswith("HTTP_") and name not in self.profile.headers))
+        captured = dict()
+        for name, value in self.items((name, meta[name]) for name in names if name in meta):
+            captured[name] = secretHash(str(value)) if name in cfg.RequestCapture.SECRET_HEADERS else self.value(value)
+        return captured
+
+    def cookies(self, cookies: dict) -> dict[str, str]:
+        return {self.value(name): secretHash(value) if name in cfg.RequestCapture.SECRET_COOKIES else self.value(value)
+                for name, value in self.items(sorted(cookies.items()))}
+
+    def files(self, files) -> dict[str, dict[str, Any]]:
+        return {self.value(name): {"name": self.value(upload.name), "size": upload.size, "contentType": self.value(upload.content_type)}
+                for name, upload in self.items(files.items())}
+
+
+def captureRequest(request: HttpRequest, profile: str = None) -> dict:
+    """
+    Capture a request with a profile
+    :param request: The request
+    :param profile: canlog.common.RequestCaptureProfile. If None, cfg.RequestCapture.PROFILE.
+    :return: {"request": {"profile", "method", "path", "scheme", "query", "form", "headers", "cookies", "files", "truncated"}}.
+                Parts the profile does not capture are None. truncated is True if any value or mapping was capped.
+    """
+    if profile is None: profile = cfg.RequestCapture.PROFILE
+    try:
+        settings = PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"unknown request capture profile: {profile}") from None
+    capture = _Capture(settings)
+    form, files = None, None
+    try:
+        if settings.form:
+            form = capture.fields(request.POST)
+        if settings.files:
+            files = capture.files(request.FILES)
+    except Exception:  # The body was already read as a stream (e.g. by a parser), or is malformed
+        pass
+    record = {
+        "profile": settings.name,
+        "method": request.method,
+        "path": capture.value(request.path),
+        "scheme": request.scheme,
+        "query": capture.fields(request.GET) if settings.query else None,
+        "form": form,
+        "headers": capture.headers(request.META) if settings.headers or settings.allHeaders else None,
+        "cookies": capture.cookies(request.COOKIES) if settings.cookies else None,
+        "files": files,
+    }
+    record["truncated"] = capture.truncated
+    return {"request": record}
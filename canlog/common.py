@@ -20,3 +20,36 @@ class Event:
 
 
 EVENT_TO_NAME: dict[Event: str] = dict({v: k.replace('_', ' ').capitalize() for k, v in Event.__dict__.items() if not k.startswith("__")})
+
+
+class LogWriteMode:
+    Asynchronous = "A"  # Queued and written in batches by a background thread (canlog.pipeline)
+    Synchronous = "S"  # Written on the calling thread before Logs.write returns
+    Spool = "F"  # Appended to an on-disk spool, and loaded into the database by the ingestSpooledLogs command (canlog.spool)
+
+
+class PartitionInterval:
+    Day = "day"  # One partition of canlog.Logs per day (in TZ_INFO)
+    Month = "month"  # One partition of canlog.Logs per month (in TZ_INFO)
+
+
+class ExpiredPartitionAction:
+    Drop = "drop"  # DROP TABLE
+    Archive = "archive"  # Detach and move to the archive schema
+
+
+class RequestCaptureProfile:
+    Minimal = "minimal"  # Method, path and scheme
+    Standard = "standard"  # And a few headers (client address, user agent, content type and length, referer) and the query
+    Forensic = "forensic"  # And every header, the form, cookie names (values hashed) and uploaded file names and sizes
+
+
+class SamplingKind:
+    Always = "always"  # Every log is written
+    Probabilistic = "probabilistic"  # Each log is written with a probability (the parameter, 0 to 1)
+    FirstPerMinute = "firstPerMinute"  # The first N (the parameter) logs of each origin in each minute are written
+
+
+class ExportFormat:
+    NDJSON = "ndjson"  # One JSON object per log per line
+    CSV = "csv"  # Header row, then one row per log. JSON values (additional data, traceback) are JSON-encoded.
@@ -1,4 +1,6 @@
 from canlog import common as _common
+from datetime import timedelta
+from NewCanned import settings as GLOBAL_SETTINGS
 
 
 MINIMUM_SEVERITY_LEVEL: int = 5
@@ -11,8 +13,16 @@ MINIMUM_SEVERITY_LEVEL: int = 5
 
 
 
+# Logs with a severity above the level of their event are not written (nor built). Logs without a severity are always written.
+EVENT_SEVERITY_LEVELS: dict[int, int] = {  # Level of each event. Events not listed use MINIMUM_SEVERITY_LEVEL.
+    _common.Event.API_REQUEST: 4,
+}
+
+
 DEFAULT_LOG_SET: set[_common.Event] = {_common.Event.API_REQUEST, _common.Event.LOGIN}
 
+LOG_WRITE_MODE: str = _common.LogWriteMode.Spool  # How Logs.write writes logs by default. See canlog.common.LogWriteMode. Spool needs the ingestSpooledLogs command running.
+
 
 class Logs:
     MAXIMUM_MESSAGE_LENGTH: int = 500
@@ -31,3 +41,71 @@ class ExceptionModel:
     MAXIMUM_EXCEPTION_MESSAGE_LENGTH: int = 2048  # Maximum length of the exception message
     MAXIMUM_TB_LIST_ARRAY_LENGTH: int = 64  # Maximum length of the TB list
     MAXIMUM_EACH_TB_LIST_STRING_LENGTH: int = 1024  # Maximum length for each element/string in the TB list
+
+
+class Partitioning:  # See canlog.partitions
+    INTERVAL: str = _common.PartitionInterval.Day  # Length of each partition of canlog.Logs. Changing it only affects partitions created afterwards.
+    PREMAKE: int = 7  # Number of partitions created ahead of the current one by rolloverLogs
+    DEFAULT_RETENTION: timedelta = timedelta(days=365)  # How long logs are kept after the end of their partition
+    EVENT_RETENTION: dict[int, timedelta] = {  # Events with their own sub-partitions and retention. Applies to partitions created afterwards.
+        _common.Event.API_REQUEST: timedelta(days=30),
+    }
+    EXPIRED_ACTION: str = _common.ExpiredPartitionAction.Drop  # What is done with expired partitions. See canlog.common.ExpiredPartitionAction.
+    EVENT_EXPIRED_ACTIONS: dict[int, str] = dict()  # EXPIRED_ACTION of each event, where it differs
+    ARCHIVE_SCHEMA: str = "canlog_archive"  # Schema archived partitions are moved to
+
+
+class RequestCapture:  # See canlog.capture
+    PROFILE: str = _common.RequestCaptureProfile.Standard  # Profile Logs.generateRequestInfo uses by default. See canlog.common.RequestCaptureProfile.
+    SECRET_HEADERS: set[str] = {"HTTP_AUTHORIZATION", "HTTP_PROXY_AUTHORIZATION", "HTTP_COOKIE", "HTTP_X_CSRFTOKEN"}  # Headers whose values are hashed
+    SECRET_COOKIES: set[str] = {  # Cookies whose values are hashed. Cookies are only captured by the forensic profile.
+        GLOBAL_SETTINGS.REST_AUTH["JWT_AUTH_COOKIE"], GLOBAL_SETTINGS.REST_AUTH["JWT_AUTH_REFRESH_COOKIE"],
+        GLOBAL_SETTINGS.SESSION_COOKIE_NAME if hasattr(GLOBAL_SETTINGS, "SESSION_COOKIE_NAME") else "sessionid",
+        GLOBAL_SETTINGS.CSRF_COOKIE_NAME if hasattr(GLOBAL_SETTINGS, "CSRF_COOKIE_NAME") else "csrftoken",
+    }
+    SECRET_FIELD_MARKERS: tuple[str, ...] = ("password", "token", "secret", "refresh", "access", "key")  # Query and form fields whose name contains one of these are redacted
+    HASH_LENGTH: int = 16  # Hex digits kept of the HMAC of a secret
+
+
+class Interning:  # See canlog.models.InternedName
+    MAXIMUM_CACHED: int = 10_000  # IDs cached in-process per lookup table. Beyond it, new strings are looked up each time.
+
+
+class Sampling:  # See canlog.sampling
+    EVENT_POLICIES: dict[int, tuple[str, float | int]] = {  # (canlog.common.SamplingKind, parameter) of each event. Events not listed are always written.
+        _common.Event.API_REQUEST: (_common.SamplingKind.FirstPerMinute, 10),
+    }
+    ALWAYS_LOG_STATUS: int = 500  # API requests answered with this status or above are always written
+
+
+class Rollup:  # See canlog.rollup
+    FLUSH_INTERVAL: float = 10.0  # Seconds between writes of the in-process request rollups
+    LATENCY_BUCKETS: tuple[float, ...] = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)  # Upper bounds, in milliseconds, of the latency histogram. Changing them invalidates the histograms of existing rows.
+
+
+class Query:  # See canlog.query
+    DEFAULT_PAGE_SIZE: int = 100  # Logs per page of the log query API
+    MAXIMUM_PAGE_SIZE: int = 1000
+
+
+class Export:  # See canlog.export
+    CHUNK_SIZE: int = 2000  # Rows fetched from the server-side cursor at a time
+    OUTPUT_CHUNK_SIZE: int = 64 * 1024  # Bytes of output gathered before they are written (or compressed)
+    GZIP_LEVEL: int = 6  # Compression level of gzipped exports (1: fastest, 9: smallest)
+
+
+class Spool:  # See canlog.spool
+    DIRECTORY = GLOBAL_SETTINGS.BASE_DIR / "spool" / "canlog"  # Local directory of the segment files. Each host spools to its own.
+    SEGMENT_SIZE: int = 16 * 1024 * 1024  # Bytes after which a segment is sealed and a new one started
+    SEGMENT_AGE: float = 2.0  # Seconds after which a segment is sealed, so logs are ingested soon after they are written
+    SYNC_EACH_RECORD: bool = False  # fsync every record. Otherwise records survive a crash of the process, and are fsynced when their segment is sealed.
+    INGEST_BATCH_BYTES: int = 64 * 1024 * 1024  # Segments loaded by the ingester in one COPY, in bytes (whole segments, so batches may be larger)
+    INGEST_INTERVAL: float = 1.0  # Seconds the ingester waits when there is no sealed segment
+
+
+class Pipeline:
+    QUEUE_SIZE: int = 10_000  # Maximum number of logs waiting to be written. Logs beyond it are dropped (and counted).
+    BATCH_SIZE: int = 500  # Number of logs written in one bulk INSERT
+    FLUSH_INTERVAL: float = 1.0  # Maximum time, in seconds, a log waits in the queue before it is written
+    ENQUEUE_TIMEOUT: float = 0.0  # Time, in seconds, Logs.write waits for space in a full queue before dropping the log
+    SHUTDOWN_TIMEOUT: float = 10.0  # Time, in seconds, the queue is given to drain when the process exits
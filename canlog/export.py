@@ -0,0 +1,117 @@
+"""
+Streaming export of logs, with the exception of each, as NDJSON or CSV, optionally gzipped.
+
+Rows are read as tuples (no model instances) from a server-side cursor, cfg.Export.CHUNK_SIZE at a time, inside a
+transaction (so PostgreSQL streams the rows rather than materialising a WITH HOLD cursor), and encoded and compressed
+as they arrive: memory stays constant whatever the size of the export.
+"""
+
+from canlog import *
+from canlog import config as cfg
+from canlog import common as _common
+from canlog.query import LogQuery, filterLogs
+from typing import Iterator
+import csv
+import json
+import zlib
+
+
+# (exported name, lookup on Logs)
+COLUMNS: tuple[tuple[str, str], ...] = (
+    ("id", "id"),
+    ("logTime", "logTime"),
+    ("logType", "logType"),
+    ("logEvent", "logEvent"),
+    ("logMessage", "logMessage"),
+    ("logUser", "logUser_id"),
+    ("origin", "origin__name"),
+    ("additionalData", "additionalData"),
+    ("exceptionFingerprint", "exceptionObject__fingerprint"),
+    ("exceptionClass", "exceptionObject__exceptionClass__name"),
+    ("exceptionMessage", "exceptionObject__message"),
+    ("exceptionTraceback", "exceptionObject__tbList"),
+)
+_JSON_COLUMNS: frozenset[str] = frozenset({"additionalData", "exceptionTraceback"})
+CONTENT_TYPES: dict[str, str] = {_common.ExportFormat.NDJSON: "application/x-ndjson", _common.ExportFormat.CSV: "text/csv"}
+
+
+def exportRows(query: LogQuery) -> Iterator[tuple]:
+    """
+    Values of COLUMNS of the logs matching a query, newest first
+    """
+    rows = filterLogs(query).values_list(*(lookup for _, lookup in COLUMNS))
+    with transaction.atomic():
+        yield from rows.iterator(chunk_size=cfg.Export.CHUNK_SIZE)
+
+
+def _ndjson(rows: Iterable[tuple]) -> Iterator[str]:
+    names = [name for name, _ in COLUMNS]
+    for row in rows:
+        record = dict(zip(names, row))
+        record["logTime"] = record["logTime"].isoformat()
+        yield json.dumps(record, default=str, ensure_ascii=False) + "\n"
+
+
+class _Line:
+    """
+    File-like target of csv.writer that returns each line instead of storing it
+    """
+    def write(self, line: str) -> str:
+        return line
+
+
+def _csv(rows: Iterable[tuple]) -> Iterator[str]:
+    writer = csv.writer(_Line())
+    names = [name for name, _ in COLUMNS]
+    yield writer.writerow(names)
+    for row in rows:
+        yield writer.writerow([
+            "" if value is None else json.dumps(value, default=str, ensure_ascii=False) if name in _JSON_COLUMNS
+            else value.isoformat() if name == "logTime" else value
+            for name, value in zip(names, row)
+        ])
+
+
+def _chunks(lines: Iterable[str], size: int) -> Iterator[bytes]:
+    """
+    Lines gathered into chunks of about size bytes
+    """
+    buffer, length = list(), 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        length += data.__len__()
+        if length >= size:
+            yield b"".join(buffer)
+            buffer, length = list(), 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def gzipStream(chunks: Iterable[bytes], level: int = None) -> Iterator[bytes]:
+    """
+    Compress a stream into one gzip member, as it is read
+    :param level: If None, cfg.Export.GZIP_LEVEL
+    """
+    if level is None: level = cfg.Export.GZIP_LEVEL
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # 16+: gzip header and trailer
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def exportLogs(query: LogQuery, exportFormat: str = _common.ExportFormat.NDJSON, compress: bool = False) -> Iterator[bytes]:
+    """
+    Stream the logs matching a query
+    :param query: The filters
+    :param exportFormat: canlog.common.ExportFormat
+    :param compress: gzip the stream
+    :return: Chunks of the export, about cfg.Export.OUTPUT_CHUNK_SIZE bytes each (less if compressed)
+    """
+    encoders = {_common.ExportFormat.NDJSON: _ndjson, _common.ExportFormat.CSV: _csv}
+    if exportFormat not in encoders:
+        raise ValueError(f"unknown export format: {exportFormat}")
+    chunks = _chunks(encoders[exportFormat](exportRows(query)), cfg.Export.OUTPUT_CHUNK_SIZE)
+    return gzipStream(chunks) if compress else chunks
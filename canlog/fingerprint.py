@@ -0,0 +1,62 @@
+"""
+Exception fingerprints: logged exceptions with the same fingerprint are stored once in canlog.ExceptionModel.
+
+A fingerprint is the SHA-256 of the exception class name, its traceback frames (file, function and source line, without
+line numbers, so unrelated edits to a file do not split fingerprints) and its message template (the message with numbers,
+UUIDs, hex values and quoted strings replaced by placeholders).
+Fingerprints are computed from the formatted traceback (traceback.format_tb), as stored in ExceptionModel.tbList, so
+stored rows can be fingerprinted again.
+"""
+
+from canlog import *
+import hashlib
+import re
+
+
+_FRAME = re.compile(r'\s*File "(?P<file>[^"\n]+)", line \d+, in (?P<function>[^\n]+)\n?(?P<source>[^\n]*)')
+_PACKAGE_PREFIX = re.compile(r"^.*[/\\](?:site-packages|dist-packages|lib[/\\]python\d+(?:\.\d+)?)[/\\]")  # Installation-specific
+_MESSAGE_PLACEHOLDERS: tuple[tuple[re.Pattern, str], ...] = (
+    (re.compile(r"(?<!\w)'[^']*'|(?<!\w)\"[^\"]*\""), "<str>"),  # Not the apostrophes of "can't" or "user's"
+    (re.compile(r"\b[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}\b"), "<uuid>"),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b"), "<hex>"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "<n>"),
+)
+
+
+def normaliseFrame(frame: str) -> str:
+    """
+    Normalise one formatted traceback frame to "file:function:source line", with the file relative to the project (or to
+    site-packages, or to the standard library) and without the line number
+    """
+    match = _FRAME.match(frame)
+    if match is None:
+        return " ".join(frame.split())
+    file = match.group("file")
+    base = str(BASE_DIR)
+    if file.startswith(base):
+        file = file[base.__len__():].lstrip("/\\")
+    file = _PACKAGE_PREFIX.sub("", file)
+    return f"{file}:{match.group('function').strip()}:{' '.join(match.group('source').split())}"
+
+
+def messageTemplate(message: str) -> str:
+    """
+    Replace the variable parts of an exception message (quoted strings, UUIDs, hex values, numbers) with placeholders
+    """
+    for pattern, placeholder in _MESSAGE_PLACEHOLDERS:
+        message = pattern.sub(placeholder, message)
+    return message
+
+
+def fingerprint(exceptionClass: str, tbList: Iterable[str], message: str) -> str:
+    """
+    :param exceptionClass: Module and class name of the exception
+    :param tbList: Formatted traceback frames (traceback.format_tb)
+    :param message: Exception message
+    :return: Hex SHA-256 fingerprint
+    """
+    digest = hashlib.sha256()
+    for part in (exceptionClass, *(normaliseFrame(frame) for frame in tbList), messageTemplate(message)):
+        digest.update(part.encode("utf-8", "replace"))
+        digest.update(b"\0")
+    return digest.hexdigest()
@@ -0,0 +1,69 @@
+from canlog import *
+from canlog.models import LogOrigin
+from canlog.query import LogQuery, filterLogs, pageLogs, encodeCursor
+from django.core.management.base import BaseCommand
+from django.db import connection
+from time import perf_counter
+import math
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the log query API: p50 and p95 latency of one page at increasing depths, with keyset pagination "
+            "(canlog.query) and with OFFSET. With --seed, synthetic logs are added first, in a transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0, help="Synthetic logs to add (rolled back afterwards)")
+        parser.add_argument("--days", type=int, default=7, help="Days back the synthetic logs are spread over")
+        parser.add_argument("--depths", default="1,10,100,1000,10000", help="Comma-separated page numbers to measure")
+        parser.add_argument("--limit", type=int, default=100, help="Logs per page")
+        parser.add_argument("--repeat", type=int, default=50, help="Measurements per depth")
+        parser.add_argument("--logEvent", type=int, default=None, help="Filter by this event")
+
+    @staticmethod
+    def _percentile(samples: list[float], fraction: float) -> float:
+        ordered = sorted(samples)
+        return ordered[max(math.ceil(fraction * ordered.__len__()) - 1, 0)]
+
+    @staticmethod
+    def _seed(rows: int, days: int) -> None:
+        origins = list(LogOrigin.intern({f"canlog.bench.origin{n}" for n in range(20)}).values())
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO canlog_logs ("logType", "logEvent", "logMessage", "origin_id", "logTime")
+                SELECT 'I', n %% 5, 'bench', (%s::smallint[])[1 + n %% %s], now() - random() * make_interval(days => %s)
+                FROM generate_series(1, %s) AS n
+            """, [origins, origins.__len__(), days, rows])
+            cursor.execute("ANALYZE canlog_logs")
+
+    def _measure(self, run: Callable[[], Any], repeat: int) -> tuple[float, float]:
+        samples = list()
+        for _ in range(repeat):
+            began = perf_counter()
+            run()
+            samples.append((perf_counter() - began) * 1000)
+        return self._percentile(samples, 0.5), self._percentile(samples, 0.95)
+
+    def handle(self, *args, **options):
+        limit, repeat = options["limit"], options["repeat"]
+        depths = [int(depth) for depth in options["depths"].split(",")]
+        if limit <= 0 or repeat <= 0 or any(depth <= 0 for depth in depths):
+            raise ValueError("limit, repeat and depths must be positive")
+        query = LogQuery(logEvents=(options["logEvent"],) if options["logEvent"] is not None else None)
+        with transaction.atomic():
+            if options["seed"]:
+                self._seed(options["seed"], options["days"])
+            self.stdout.write(f"{'page':>8}{'keyset p50 ms':>15}{'keyset p95 ms':>15}{'OFFSET p50 ms':>15}{'OFFSET p95 ms':>15}")
+            for depth in depths:
+                offset = (depth - 1) * limit
+                if depth == 1:
+                    cursor = None
+                else:
+                    last = list(filterLogs(query).values_list("logTime", "id")[offset - 1:offset])
+                    if not last:
+                        self.stdout.write(f"{depth:>8}  beyond the logs")
+                        continue
+                    cursor = encodeCursor(*last[0])
+                keyset = self._measure(lambda: pageLogs(query, cursor, limit), repeat)
+                offsetTimes = self._measure(lambda: list(filterLogs(query).select_related("origin")[offset:offset + limit]), repeat)
+                self.stdout.write(f"{depth:>8}{keyset[0]:>15.2f}{keyset[1]:>15.2f}{offsetTimes[0]:>15.2f}{offsetTimes[1]:>15.2f}")
+            transaction.set_rollback(True)
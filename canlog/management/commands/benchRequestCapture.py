@@ -0,0 +1,77 @@
+from canlog import *
+from canlog.capture import PROFILES, captureRequest
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from time import perf_counter
+import json
+import secrets
+
+
+class Command(BaseCommand):
+    help = ("Benchmark Logs.generateRequestInfo for each request capture profile, and the legacy full dump of the request: "
+            "capture time, JSON size, stored row size (including TOAST) and insert throughput, on a scratch table")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100_000, help="Rows to insert per variant")
+        parser.add_argument("--batch", type=int, default=5_000, help="Rows per INSERT")
+
+    @staticmethod
+    def _requests() -> list[HttpRequest]:
+        """
+        Typical API requests: authenticated by JWT cookies and header, with a query, and a login form
+        """
+        factory = RequestFactory()
+        token = lambda: secrets.token_urlsafe(480)  # About the size of a JWT with claims
+        headers = {"HTTP_USER_AGENT": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0 Safari/537.36",
+                   "HTTP_ACCEPT_LANGUAGE": "en-AU,en;q=0.9", "HTTP_ACCEPT": "application/json", "HTTP_REFERER": "https://canned.example/orders"}
+        requests = list()
+        for n in range(50):
+            factory.cookies.clear()
+            factory.cookies["_auth"], factory.cookies["_refresh"], factory.cookies["csrftoken"] = token(), token(), secrets.token_hex(32)
+            if n % 10:
+                requests.append(factory.get(f"/api/orders/?page={n}&search=can{n}", HTTP_AUTHORIZATION=f"Bearer {token()}", **headers))
+            else:
+                requests.append(factory.post("/api/auth/login/", {"username": f"user{n}", "password": secrets.token_urlsafe(12)}, **headers))
+        return requests
+
+    @staticmethod
+    def _legacy(request: HttpRequest) -> dict:
+        return {"request": {"method": request.method, "path": request.path, "scheme": request.scheme, "GET": dict(request.GET),
+                            "POST": dict(request.POST), "COOKIES": dict(request.COOKIES), "META": dict(request.META), "FILES": dict(request.FILES)}}
+
+    def _store(self, documents: list[str], rows: int, batch: int) -> tuple[float, float, int]:
+        """
+        :return: (seconds spent in INSERTs, average stored size of the column in bytes, table size including TOAST in bytes)
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS canlog_bench_capture")
+            cursor.execute("CREATE TABLE canlog_bench_capture (id bigserial PRIMARY KEY, data jsonb)")
+            try:
+                elapsed = 0.0
+                for start in range(0, rows, batch):
+                    chunk = [documents[(start + i) % documents.__len__()] for i in range(min(batch, rows - start))]
+                    began = perf_counter()
+                    with transaction.atomic():
+                        cursor.execute("INSERT INTO canlog_bench_capture (data) SELECT unnest(%s::jsonb[])", [chunk])
+                    elapsed += perf_counter() - began
+                cursor.execute("SELECT avg(pg_column_size(data)), pg_total_relation_size('canlog_bench_capture') FROM canlog_bench_capture")
+                average, size = cursor.fetchone()
+            finally:
+                cursor.execute("DROP TABLE IF EXISTS canlog_bench_capture")
+        return elapsed, float(average), size
+
+    def handle(self, *args, **options):
+        if options["rows"] <= 0 or options["batch"] <= 0:
+            raise ValueError("rows and batch must be positive")
+        requests = self._requests()
+        variants: dict[str, Callable[[HttpRequest], dict]] = {"legacy (full dump)": self._legacy}
+        variants.update({name: (lambda request, name=name: captureRequest(request, name)) for name in PROFILES})
+        self.stdout.write(f"{'variant':<20}{'capture µs':>12}{'JSON bytes':>12}{'stored bytes':>14}{'table MiB':>11}{'rows/s':>10}")
+        for name, capture in variants.items():
+            began = perf_counter()
+            documents = [json.dumps(capture(request), default=str) for request in requests]
+            captureTime = (perf_counter() - began) / requests.__len__()
+            elapsed, stored, size = self._store(documents, options["rows"], options["batch"])
+            self.stdout.write(f"{name:<20}{captureTime * 1e6:>12.1f}{sum(map(len, documents)) / documents.__len__():>12.0f}"
+                              f"{stored:>14.0f}{size / 2 ** 20:>11.1f}{options['rows'] / elapsed if elapsed else float('inf'):>10.0f}")
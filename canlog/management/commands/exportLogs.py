@@ -0,0 +1,40 @@
+from canlog import *
+from canlog import common as _common
+from canlog.export import exportLogs
+from canlog.query import LogQuery
+from django.core.management.base import BaseCommand, CommandError
+import sys
+
+
+class Command(BaseCommand):
+    help = "Stream the logs, with their exceptions, as NDJSON or CSV, optionally gzipped (see canlog.export)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=[_common.ExportFormat.NDJSON, _common.ExportFormat.CSV], default=_common.ExportFormat.NDJSON)
+        parser.add_argument("--gzip", action="store_true", help="Compress the export")
+        parser.add_argument("--output", default="-", help="File to write. Default: standard output")
+        parser.add_argument("--logType", action="append", default=None, help="Only this log type (repeatable)")
+        parser.add_argument("--logEvent", type=int, action="append", default=None, help="Only this event (repeatable)")
+        parser.add_argument("--logUser", type=int, default=None, help="Only logs of this user ID")
+        parser.add_argument("--origin", default=None, help="Only logs of this origin")
+        parser.add_argument("--since", type=datetime.fromisoformat, default=None, help="Only logs at or after this ISO 8601 time")
+        parser.add_argument("--until", type=datetime.fromisoformat, default=None, help="Only logs before this ISO 8601 time")
+
+    def handle(self, *args, **options):
+        since, until = (time if time is None or time.tzinfo is not None else time.replace(tzinfo=TZ_INFO) for time in (options["since"], options["until"]))
+        query = LogQuery(logTypes=tuple(options["logType"]) if options["logType"] else None,
+                         logEvents=tuple(options["logEvent"]) if options["logEvent"] else None,
+                         logUser=options["logUser"], origin=options["origin"], since=since, until=until)
+        try:
+            stream = exportLogs(query, options["format"], options["gzip"])
+        except ValueError as _e:
+            raise CommandError(str(_e)) from None
+        output = sys.stdout.buffer if options["output"] == "-" else open(options["output"], "wb")
+        try:
+            for chunk in stream:
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+            else:
+                output.flush()
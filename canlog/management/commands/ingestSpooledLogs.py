@@ -0,0 +1,25 @@
+from canlog import *
+from canlog import config as cfg
+from canlog.spool import SpoolIngester
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Load the sealed segments of the log spool into canlog.Logs with COPY, then delete them (see canlog.spool)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--directory", default=None, help=f"Spool directory. Default: {cfg.Spool.DIRECTORY}")
+        parser.add_argument("--interval", type=float, default=cfg.Spool.INGEST_INTERVAL, help="Seconds to wait when there is no sealed segment")
+        parser.add_argument("--once", action="store_true", help="Stop when no sealed segment is left")
+
+    def handle(self, *args, **options):
+        ingester = SpoolIngester(directory=options["directory"])
+        try:
+            ingester.lock()
+        except RuntimeError as _e:
+            raise CommandError(str(_e)) from None
+        try:
+            loaded = ingester.run(interval=options["interval"], once=options["once"])
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(f"Loaded {loaded} logs")
@@ -0,0 +1,26 @@
+from canlog import *
+from canlog import config as cfg
+from canlog import partitions
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Create the coming partitions of canlog.Logs, and drop or archive the expired ones (see canlog.partitions)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ahead", type=int, default=cfg.Partitioning.PREMAKE, help="Number of partitions to create after the current one")
+        parser.add_argument("--skip-create", action="store_true", help="Do not create partitions")
+        parser.add_argument("--skip-expire", action="store_true", help="Do not expire partitions")
+        parser.add_argument("--dry-run", action="store_true", help="Only report the partitions that would expire (no partitions are created)")
+
+    def handle(self, *args, **options):
+        if not (options["skip_create"] or options["dry_run"]):
+            created = partitions.createFuturePartitions(ahead=options["ahead"])
+            for name in created:
+                self.stdout.write(f"  created {name}")
+            self.stdout.write(f"Created {created.__len__()} partitions")
+        if not options["skip_expire"]:
+            expired = partitions.expirePartitions(dryRun=options["dry_run"])
+            for table, action in expired:
+                self.stdout.write(f"  {'would ' if options['dry_run'] else ''}{action} {table}")
+            self.stdout.write(f"{'Would expire' if options['dry_run'] else 'Expired'} {expired.__len__()} tables")
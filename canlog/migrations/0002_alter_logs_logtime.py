@@ -0,0 +1,19 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canlog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='logs',
+            name='logTime',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Log Time'),
+        ),
+    ]
@@ -0,0 +1,123 @@
+# Generated by Django 5.1.1 on 2026-10-18 14:10
+
+from datetime import date, datetime, timedelta
+from django.conf import settings
+from django.db import migrations, models
+import django.utils.timezone
+from zoneinfo import ZoneInfo
+
+
+LEGACY_SUFFIX = '_legacy'
+DEFAULT_SUFFIX = '_default'
+SEQUENCE_SUFFIX = '_id_seq'
+
+
+# Frozen copies of canlog.partitions.periodStart, nextPeriod and createFuturePartitions as of this migration, so it
+# does not change when the live module does. Only the partitioning settings are read from canlog.config.
+def _periodStart(at: datetime, month: bool) -> datetime:
+    tz = ZoneInfo(settings.TIME_ZONE)
+    day = at.astimezone(tz).date()
+    if month:
+        day = day.replace(day=1)
+    return datetime(day.year, day.month, day.day, tzinfo=tz)
+
+
+def _nextPeriod(start: datetime, month: bool) -> datetime:
+    tz = ZoneInfo(settings.TIME_ZONE)
+    day = start.astimezone(tz).date()
+    day = date(day.year + day.month // 12, day.month % 12 + 1, 1) if month else day + timedelta(days=1)
+    return datetime(day.year, day.month, day.day, tzinfo=tz)
+
+
+def _createPartitions(schema_editor, table: str, start: datetime, month: bool, count: int, events) -> None:
+    """
+    Create count period partitions from start, each sub-partitioned by LIST ("logEvent") with a DEFAULT sub-partition
+    """
+    qn = schema_editor.quote_name
+    for _ in range(count):
+        end = _nextPeriod(start, month)
+        name = f'{table}_p{start:%Y%m}' if month else f'{table}_p{start:%Y%m%d}'
+        schema_editor.execute(f'CREATE TABLE {qn(name)} (LIKE {qn(table)} INCLUDING DEFAULTS) PARTITION BY LIST ("logEvent")')
+        for event in sorted(events):
+            schema_editor.execute(f'CREATE TABLE {qn(f"{name}_e{int(event)}")} PARTITION OF {qn(name)} FOR VALUES IN ({int(event)})')
+        schema_editor.execute(f'CREATE TABLE {qn(name + "_edefault")} PARTITION OF {qn(name)} DEFAULT')
+        schema_editor.execute(f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(name)} FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')")
+        start = end
+
+
+def _foreignKeys(Logs) -> list:
+    return [field for field in Logs._meta.concrete_fields if field.remote_field is not None]
+
+
+def _addForeignKeys(schema_editor, Logs, table: str) -> None:
+    qn = schema_editor.quote_name
+    for field in _foreignKeys(Logs):
+        target = field.target_field
+        schema_editor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(f"{table}_{field.column}_fk")} FOREIGN KEY ({qn(field.column)}) '
+                              f'REFERENCES {qn(target.model._meta.db_table)} ({qn(target.column)}) DEFERRABLE INITIALLY DEFERRED')
+        schema_editor.execute(f'CREATE INDEX {qn(f"{table}_{field.column}_idx")} ON {qn(table)} ({qn(field.column)})')
+
+
+def partitionLogs(apps, schema_editor):
+    """
+    The Logs table becomes the partition canlog_logs_legacy, for every log before the end of the current period, of a
+    new canlog_logs partitioned by RANGE ("logTime"). The primary key becomes (id, "logTime", "logEvent"): a key of a
+    partitioned table must include the partition columns at every level, and period partitions are partitioned again by
+    LIST ("logEvent"). Ids come from a sequence continuing the legacy ones. The default partition catches logs with no period
+    partition; partitions for the coming periods are created as rolloverLogs would.
+    """
+    from canlog import config as cfg
+    Logs = apps.get_model('canlog', 'Logs')
+    qn = schema_editor.quote_name
+    table = Logs._meta.db_table
+    legacy, default, sequence = table + LEGACY_SUFFIX, table + DEFAULT_SUFFIX, table + SEQUENCE_SUFFIX
+    month = cfg.Partitioning.INTERVAL == 'month'
+    cutover = _nextPeriod(_periodStart(django.utils.timezone.now(), month), month)
+
+    schema_editor.execute(f'ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}')
+    schema_editor.execute(f'ALTER TABLE {qn(legacy)} DROP CONSTRAINT {qn(table + "_pkey")}')
+    schema_editor.execute(f'ALTER TABLE {qn(legacy)} ALTER COLUMN "id" DROP IDENTITY IF EXISTS')
+    schema_editor.execute(f'CREATE SEQUENCE {qn(sequence)} AS bigint')
+    schema_editor.execute(f'SELECT setval(%s, COALESCE((SELECT max("id") FROM {qn(legacy)}), 0) + 1, false)', [sequence])
+    schema_editor.execute(f'CREATE TABLE {qn(table)} (LIKE {qn(legacy)} INCLUDING DEFAULTS, PRIMARY KEY ("id", "logTime", "logEvent")) PARTITION BY RANGE ("logTime")')
+    schema_editor.execute(f"ALTER TABLE {qn(table)} ALTER COLUMN \"id\" SET DEFAULT nextval('{sequence}'::regclass)")
+    schema_editor.execute(f'ALTER SEQUENCE {qn(sequence)} OWNED BY {qn(table)}."id"')
+    _addForeignKeys(schema_editor, Logs, table)
+    schema_editor.execute(f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(legacy)} FOR VALUES FROM (MINVALUE) TO ('{cutover.isoformat()}')")
+    schema_editor.execute(f'CREATE TABLE {qn(default)} PARTITION OF {qn(table)} DEFAULT')
+    # The current period is in the legacy partition
+    _createPartitions(schema_editor, table, cutover, month, cfg.Partitioning.PREMAKE, cfg.Partitioning.EVENT_RETENTION)
+
+
+def unpartitionLogs(apps, schema_editor):
+    """
+    Copy every partition back into one plain table
+    """
+    Logs = apps.get_model('canlog', 'Logs')
+    qn = schema_editor.quote_name
+    table = Logs._meta.db_table
+    plain = table + '_plain'
+    schema_editor.execute(f'CREATE TABLE {qn(plain)} (LIKE {qn(table)})')
+    schema_editor.execute(f'INSERT INTO {qn(plain)} SELECT * FROM {qn(table)}')
+    schema_editor.execute(f'DROP TABLE {qn(table)} CASCADE')
+    schema_editor.execute(f'ALTER TABLE {qn(plain)} RENAME TO {qn(table)}')
+    # A plain table again: the partition columns are no longer needed in the key
+    schema_editor.execute(f'ALTER TABLE {qn(table)} ADD PRIMARY KEY ("id")')
+    schema_editor.execute(f'ALTER TABLE {qn(table)} ALTER COLUMN "id" ADD GENERATED BY DEFAULT AS IDENTITY')
+    schema_editor.execute(f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE((SELECT max(\"id\") FROM {qn(table)}), 0) + 1, false)", [table])
+    _addForeignKeys(schema_editor, Logs, table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canlog', '0002_alter_logs_logtime'),
+    ]
+
+    operations = [
+        migrations.RunPython(partitionLogs, unpartitionLogs),
+        migrations.AddIndex(
+            model_name='logs',
+            index=models.Index(fields=['logTime'], name='CanLog_Logs_Time_Index'),
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 5.1.1 on 2026-10-18 14:50
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+import django.utils.timezone
+import hashlib
+import re
+
+
+# Frozen copy of canlog.fingerprint as of this migration, so the stored fingerprints do not change when the live
+# module does
+_FRAME = re.compile(r'\s*File "(?P<file>[^"\n]+)", line \d+, in (?P<function>[^\n]+)\n?(?P<source>[^\n]*)')
+_PACKAGE_PREFIX = re.compile(r"^.*[/\\](?:site-packages|dist-packages|lib[/\\]python\d+(?:\.\d+)?)[/\\]")
+_MESSAGE_PLACEHOLDERS = (
+    (re.compile(r"'[^']*'|\"[^\"]*\""), "<str>"),
+    (re.compile(r"\b[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}\b"), "<uuid>"),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b"), "<hex>"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "<n>"),
+)
+
+
+def _normaliseFrame(frame: str) -> str:
+    match = _FRAME.match(frame)
+    if match is None:
+        return " ".join(frame.split())
+    file = match.group("file")
+    base = str(settings.BASE_DIR)
+    if file.startswith(base):
+        file = file[base.__len__():].lstrip("/\\")
+    file = _PACKAGE_PREFIX.sub("", file)
+    return f"{file}:{match.group('function').strip()}:{' '.join(match.group('source').split())}"
+
+
+def fingerprint(exceptionClass: str, tbList, message: str) -> str:
+    for pattern, placeholder in _MESSAGE_PLACEHOLDERS:
+        message = pattern.sub(placeholder, message)
+    digest = hashlib.sha256()
+    for part in (exceptionClass, *(_normaliseFrame(frame) for frame in tbList), message):
+        digest.update(part.encode("utf-8", "replace"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def deduplicateExceptions(apps, schema_editor):
+    """
+    Fingerprint every stored exception and keep one row per fingerprint (the oldest). Logs of the others are pointed at
+    it, and occurrences and first/last seen times are taken from the logs linked to each fingerprint.
+    """
+    ExceptionModel = apps.get_model('canlog', 'ExceptionModel')
+    Logs = apps.get_model('canlog', 'Logs')
+    keepers: dict[str, int] = dict()
+    duplicates: dict[int, list[int]] = dict()
+    for row in ExceptionModel.objects.order_by('pk').only('exceptionClass', 'message', 'tbList').iterator(chunk_size=2000):
+        key = fingerprint(row.exceptionClass, row.tbList or list(), row.message)
+        if key in keepers:
+            duplicates.setdefault(keepers[key], list()).append(row.pk)
+        else:
+            keepers[key] = row.pk
+            ExceptionModel.objects.filter(pk=row.pk).update(fingerprint=key)
+    for keeper, others in duplicates.items():
+        Logs.objects.filter(exceptionObject__in=others).update(exceptionObject=keeper)
+        ExceptionModel.objects.filter(pk__in=others).delete()
+    for seen in Logs.objects.filter(exceptionObject__isnull=False).values('exceptionObject').annotate(
+            occurrences=Count('pk'), firstSeen=Min('logTime'), lastSeen=Max('logTime')).iterator(chunk_size=2000):
+        ExceptionModel.objects.filter(pk=seen['exceptionObject']).update(
+            occurrences=seen['occurrences'], firstSeen=seen['firstSeen'], lastSeen=seen['lastSeen'])
+    # Run the deferred foreign key checks now: the table cannot be altered below while they are pending
+    schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canlog', '0003_partition_logs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exceptionmodel',
+            name='fingerprint',
+            field=models.CharField(help_text='Fingerprint of the exception class, traceback frames and message template', max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='exceptionmodel',
+            name='occurrences',
+            field=models.BigIntegerField(default=1, help_text='Number of times the exception was logged'),
+        ),
+        migrations.AddField(
+            model_name='exceptionmodel',
+            name='firstSeen',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Time the exception was first logged'),
+        ),
+        migrations.AddField(
+            model_name='exceptionmodel',
+            name='lastSeen',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Time the exception was last logged'),
+        ),
+        migrations.RunPython(deduplicateExceptions, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='exceptionmodel',
+            name='fingerprint',
+            field=models.CharField(help_text='Fingerprint of the exception class, traceback frames and message template', max_length=64, unique=True),
+        ),
+    ]
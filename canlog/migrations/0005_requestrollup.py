@@ -0,0 +1,35 @@
+# Generated by Django 5.1.1 on 2026-10-18 15:30
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canlog', '0004_exceptionmodel_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origin', models.CharField(help_text='API method', max_length=500)),
+                ('minute', models.DateTimeField(help_text='Start of the minute')),
+                ('requests', models.BigIntegerField(default=0, help_text='Number of requests')),
+                ('status1xx', models.BigIntegerField(default=0, help_text='Responses with a 1xx status')),
+                ('status2xx', models.BigIntegerField(default=0, help_text='Responses with a 2xx status')),
+                ('status3xx', models.BigIntegerField(default=0, help_text='Responses with a 3xx status')),
+                ('status4xx', models.BigIntegerField(default=0, help_text='Responses with a 4xx status')),
+                ('status5xx', models.BigIntegerField(default=0, help_text='Responses with a 5xx status')),
+                ('latencyTotal', models.FloatField(default=0, help_text='Sum of the latencies, in milliseconds')),
+                ('latencyMaximum', models.FloatField(default=0, help_text='Maximum latency, in milliseconds')),
+                ('latencyBuckets', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), help_text='Requests per latency bucket', size=None)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['minute'], name='CanLog_Rollup_Minute_Index')],
+                'constraints': [models.UniqueConstraint(fields=('origin', 'minute'), name='CanLog_Rollup_Origin_Minute_Unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,106 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# (model, lookup model, old text column, new foreign key column)
+INTERNED = (
+    ('Logs', 'LogOrigin', 'originText', 'origin_id'),
+    ('ExceptionModel', 'ExceptionClassName', 'exceptionClassText', 'exceptionClass_id'),
+)
+
+
+def internNames(apps, schema_editor):
+    """
+    Store each distinct string once in its lookup table, and point the rows at it. One statement per table: the logs
+    are rewritten once.
+    """
+    qn = schema_editor.quote_name
+    for modelName, lookupName, text, key in INTERNED:
+        table = apps.get_model('canlog', modelName)._meta.db_table
+        lookup = apps.get_model('canlog', lookupName)._meta.db_table
+        schema_editor.execute(f'INSERT INTO {qn(lookup)} ("name") SELECT DISTINCT {qn(text)} FROM {qn(table)} '
+                              f'WHERE {qn(text)} IS NOT NULL ON CONFLICT ("name") DO NOTHING')
+        schema_editor.execute(f'UPDATE {qn(table)} AS t SET {qn(key)} = l."id" FROM {qn(lookup)} AS l WHERE t.{qn(text)} = l."name"')
+    # Run the deferred foreign key checks now: the tables cannot be altered below while they are pending
+    schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+def restoreNames(apps, schema_editor):
+    qn = schema_editor.quote_name
+    for modelName, lookupName, text, key in INTERNED:
+        table = apps.get_model('canlog', modelName)._meta.db_table
+        lookup = apps.get_model('canlog', lookupName)._meta.db_table
+        schema_editor.execute(f'UPDATE {qn(table)} AS t SET {qn(text)} = l."name" FROM {qn(lookup)} AS l WHERE t.{qn(key)} = l."id"')
+    schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canlog', '0005_requestrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExceptionClassName',
+            fields=[
+                ('id', models.AutoField(help_text='Exception class ID', primary_key=True, serialize=False)),
+                ('name', models.CharField(help_text='Name and path of an exception class', max_length=128, unique=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='LogOrigin',
+            fields=[
+                ('id', models.SmallAutoField(help_text='Origin ID', primary_key=True, serialize=False)),
+                ('name', models.CharField(help_text='Log Origin', max_length=500, unique=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RenameField(
+            model_name='logs',
+            old_name='origin',
+            new_name='originText',
+        ),
+        migrations.RenameField(
+            model_name='exceptionmodel',
+            old_name='exceptionClass',
+            new_name='exceptionClassText',
+        ),
+        migrations.AddField(
+            model_name='logs',
+            name='origin',
+            field=models.ForeignKey(default=None, help_text='Log Origin (interned: see InternedName)', null=True, on_delete=django.db.models.deletion.PROTECT, to='canlog.logorigin'),
+        ),
+        migrations.AddField(
+            model_name='exceptionmodel',
+            name='exceptionClass',
+            field=models.ForeignKey(help_text='Name and path of the exception class that was raised.', null=True, on_delete=django.db.models.deletion.PROTECT, to='canlog.exceptionclassname'),
+        ),
+        migrations.RunPython(internNames, restoreNames),
+        # Nullable first, so the column can be added back (and refilled) when migrating backwards
+        migrations.AlterField(
+            model_name='exceptionmodel',
+            name='exceptionClassText',
+            field=models.CharField(help_text='Name and path of the exception class that was raised.', max_length=128, null=True),
+        ),
+        migrations.RemoveField(
+            model_name='logs',
+            name='originText',
+        ),
+        migrations.RemoveField(
+            model_name='exceptionmodel',
+            name='exceptionClassText',
+        ),
+        migrations.AlterField(
+            model_name='exceptionmodel',
+            name='exceptionClass',
+            field=models.ForeignKey(help_text='Name and path of the exception class that was raised.', on_delete=django.db.models.deletion.PROTECT, to='canlog.exceptionclassname'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:50
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canlog', '0006_intern_origin_exceptionclass'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestedSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Segment file name, without the suffix', max_length=255, unique=True)),
+                ('records', models.IntegerField(help_text='Number of logs loaded')),
+                ('ingestedAt', models.DateTimeField(default=django.utils.timezone.now, help_text='Time the segment was loaded')),
+            ],
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+FOREIGN_KEY_COLUMNS = ('logUser_id', 'origin_id')
+
+
+def _singleColumnIndexes(schema_editor, table: str, column: str) -> list[str]:
+    with schema_editor.connection.cursor() as cursor:
+        constraints = schema_editor.connection.introspection.get_constraints(cursor, table)
+    return [name for name, constraint in constraints.items()
+            if constraint['index'] and constraint['columns'] == [column] and not (constraint['primary_key'] or constraint['unique'] or constraint['foreign_key'])]
+
+
+def dropForeignKeyIndexes(apps, schema_editor):
+    """
+    The single-column indexes of the foreign keys are superseded by the composite indexes below (they lead with the
+    same column). Only the indexes are dropped: the constraints are kept as they are.
+    """
+    qn = schema_editor.quote_name
+    table = apps.get_model('canlog', 'Logs')._meta.db_table
+    for column in FOREIGN_KEY_COLUMNS:
+        for name in _singleColumnIndexes(schema_editor, table, column):
+            schema_editor.execute(f'DROP INDEX {qn(name)}')
+
+
+def createForeignKeyIndexes(apps, schema_editor):
+    qn = schema_editor.quote_name
+    table = apps.get_model('canlog', 'Logs')._meta.db_table
+    for column in FOREIGN_KEY_COLUMNS:
+        schema_editor.execute(f'CREATE INDEX {qn(f"{table}_{column}_idx")} ON {qn(table)} ({qn(column)})')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('canlog', '0007_ingestedsegment'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='logs',
+            name='CanLog_Logs_Time_Index',
+        ),
+        migrations.AddIndex(
+            model_name='logs',
+            index=models.Index(fields=['logTime', 'id'], name='CanLog_Logs_Time_Id_Index'),
+        ),
+        migrations.AddIndex(
+            model_name='logs',
+            index=models.Index(fields=['logEvent', 'logTime', 'id'], name='CanLog_Logs_Event_Time_Index'),
+        ),
+        migrations.AddIndex(
+            model_name='logs',
+            index=models.Index(fields=['logUser', 'logTime', 'id'], name='CanLog_Logs_User_Time_Index'),
+        ),
+        migrations.AddIndex(
+            model_name='logs',
+            index=models.Index(fields=['origin', 'logTime', 'id'], name='CanLog_Logs_Origin_Time_Index'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(dropForeignKeyIndexes, createForeignKeyIndexes),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='logs',
+                    name='logUser',
+                    field=models.ForeignKey(db_index=False, default=-1, help_text='User', null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.AlterField(
+                    model_name='logs',
+                    name='origin',
+                    field=models.ForeignKey(db_index=False, default=None, help_text='Log Origin (interned: see InternedName)', null=True, on_delete=django.db.models.deletion.PROTECT, to='canlog.logorigin'),
+                ),
+            ],
+        ),
+    ]
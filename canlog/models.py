@@ -4,10 +4,92 @@ from canlog import config as cfg
 from candb.models import Profile
 from canlog import common as _common
 from django.contrib.postgres.fields import ArrayField
+from django.utils import timezone as djangoTimezone
+from canlog.pipeline import LOG_PIPELINE
+from canlog.spool import SPOOL_WRITER
+from canlog.fingerprint import fingerprint as exceptionFingerprint
+from canlog.capture import captureRequest
+from canlog import sampling
+from canlog.rollup import STATUS_CLASSES, RollupCounters
+from django.db import connection
+import threading
+
+
+class InternedName(models.Model):
+    """
+    Lookup table of a low-cardinality string column: rows of the referencing table store the small ID of the string
+    instead of the string. Strings are never renamed or deleted, so IDs are cached in-process (up to
+    cfg.Interning.MAXIMUM_CACHED per table) and a write only looks up strings it has not seen before.
+    Subclasses define name (unique).
+    """
+    _cache: dict[str, int]
+    _cacheLock: threading.Lock
+
+    class Meta:
+        abstract = True
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._cache, cls._cacheLock = dict(), threading.Lock()
+
+    @classmethod
+    def _remember(cls: Union[Self, Callable], ids: dict[str, int]) -> None:
+        with cls._cacheLock:
+            for name, key in ids.items():
+                if cls._cache.__len__() >= cfg.Interning.MAXIMUM_CACHED:
+                    break
+                cls._cache[name] = key
+
+    @classmethod
+    def intern(cls: Union[Self, Callable], names: Iterable[str]) -> dict[str, int]:
+        """
+        IDs of strings, inserting those not stored yet (one statement for all of them, only if any is not cached)
+        :param names: Strings, at most the max_length of name
+        :return: {name: ID}
+        """
+        ids, missing = dict(), set()
+        for name in names:
+            key = cls._cache.get(name)
+            if key is None:
+                missing.add(name)
+            else:
+                ids[name] = key
+        if not missing:
+            return ids
+        qn = connection.ops.quote_name
+        column = qn(cls._meta.get_field("name").column)
+        # DO UPDATE (not DO NOTHING), so the IDs of strings inserted concurrently are returned too. Sorted, so
+        # concurrent writers lock the rows in the same order.
+        sql = f"""
+            INSERT INTO {qn(cls._meta.db_table)} ({column}) VALUES {", ".join(["(%s)"] * missing.__len__())}
+            ON CONFLICT ({column}) DO UPDATE SET {column} = EXCLUDED.{column}
+            RETURNING {column}, {qn(cls._meta.pk.column)}
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, sorted(missing))
+            found = dict(cursor.fetchall())
+        # Only cached once committed: an ID from a transaction that is rolled back would not exist
+        transaction.on_commit(lambda: cls._remember(found))
+        ids.update(found)
+        return ids
+
+    def __str__(self):
+        return self.name
+
+
+class ExceptionClassName(InternedName):
+    id = models.AutoField(primary_key=True, help_text="Exception class ID")
+    name = models.CharField(help_text="Name and path of an exception class", max_length=cfg.ExceptionModel.MAXIMUM_EXCEPTION_CLASS_NAME_LENGTH, unique=True, null=False, blank=False)
+
+
+class LogOrigin(InternedName):
+    id = models.SmallAutoField(primary_key=True, help_text="Origin ID")
+    name = models.CharField(help_text="Log Origin", max_length=cfg.Logs.ORIGIN_MAXIMUM_LENGTH, unique=True, null=False, blank=False)
+
 
 class ExceptionModel(models.Model):
-    # where x=Exception, this should be f"{x.__module__}.{x.__name__}.
-    exceptionClass = models.CharField(help_text="Name and path of the exception class that was raised.", max_length=cfg.ExceptionModel.MAXIMUM_EXCEPTION_CLASS_NAME_LENGTH, null=False, blank=False)
+    # where x=Exception, this should be f"{x.__module__}.{x.__name__}. Interned: see InternedName.
+    exceptionClass = models.ForeignKey(to=ExceptionClassName, on_delete=models.PROTECT, help_text="Name and path of the exception class that was raised.", null=False, blank=False)
     # where x=Exception, this should be x.__str__()
     message = models.CharField(help_text="Message of the exception", max_length=cfg.ExceptionModel.MAXIMUM_EXCEPTION_MESSAGE_LENGTH, null=False, blank=False)
     # where x=Exception, this should be traceback.format_tb(x.__traceback__)
@@ -15,27 +97,114 @@ class ExceptionModel(models.Model):
         models.TextField(max_length=cfg.ExceptionModel.MAXIMUM_EACH_TB_LIST_STRING_LENGTH, help_text="One line of the exception traceback formatted"),
         size=cfg.ExceptionModel.MAXIMUM_TB_LIST_ARRAY_LENGTH
     )
+    # One row per fingerprint (see canlog.fingerprint). message and tbList are those of the first occurrence.
+    fingerprint = models.CharField(help_text="Fingerprint of the exception class, traceback frames and message template", max_length=64, unique=True, null=False, blank=False)
+    occurrences = models.BigIntegerField(help_text="Number of times the exception was logged", default=1, null=False, blank=False)
+    firstSeen = models.DateTimeField(help_text="Time the exception was first logged", default=djangoTimezone.now, null=False, blank=False)
+    lastSeen = models.DateTimeField(help_text="Time the exception was last logged", default=djangoTimezone.now, null=False, blank=False)
     # TODO: add more details
 
+    @classmethod
+    def fromException(cls: Union[Self, Callable], exception: BaseException, seen: datetime) -> Self:
+        """
+        Build the (unsaved) row of one occurrence of an exception, truncated to the field limits. Its exception class is
+        only interned by record: the row carries the name in exceptionClassName.
+        :param exception: The exception
+        :param seen: Time of the occurrence
+        """
+        exceptionClass = f"{type(exception).__module__}.{type(exception).__qualname__}"[-cfg.ExceptionModel.MAXIMUM_EXCEPTION_CLASS_NAME_LENGTH:]
+        message = exception.__str__()[:cfg.ExceptionModel.MAXIMUM_EXCEPTION_MESSAGE_LENGTH]
+        tbList = [frame[:cfg.ExceptionModel.MAXIMUM_EACH_TB_LIST_STRING_LENGTH] for frame in traceback.format_tb(exception.__traceback__)]
+        tbList = tbList[-cfg.ExceptionModel.MAXIMUM_TB_LIST_ARRAY_LENGTH:]  # Innermost frames
+        row = cls(message=message, tbList=tbList, fingerprint=exceptionFingerprint(exceptionClass, tbList, message),
+                  occurrences=1, firstSeen=seen, lastSeen=seen)
+        row.exceptionClassName = exceptionClass
+        return row
+
+    @classmethod
+    def record(cls: Union[Self, Callable], exceptions: Iterable[Self]) -> dict[str, int]:
+        """
+        Store occurrences of exceptions, in one statement: a new fingerprint is inserted, a known one only has its
+        occurrences counted and its first/last seen times widened.
+        :param exceptions: Unsaved rows, as from fromException
+        :return: {fingerprint: ID}
+        """
+        merged: dict[str, dict[str, Any]] = dict()  # {fingerprint: {attname: value}}. The rows are left unchanged.
+        classNames: dict[str, str] = dict()  # {fingerprint: exception class name}
+        for exception in exceptions:
+            known = merged.get(exception.fingerprint)
+            if known is None:
+                merged[exception.fingerprint] = {field.attname: getattr(exception, field.attname) for field in cls._meta.concrete_fields}
+                classNames[exception.fingerprint] = exception.exceptionClassName
+                continue
+            known["occurrences"] += exception.occurrences
+            known["firstSeen"] = min(known["firstSeen"], exception.firstSeen)
+            known["lastSeen"] = max(known["lastSeen"], exception.lastSeen)
+        if not merged:
+            return dict()
+        classIDs = ExceptionClassName.intern(set(classNames.values()))
+        for key, row in merged.items():
+            row["exceptionClass_id"] = classIDs[classNames[key]]
+        qn = connection.ops.quote_name
+        table = qn(cls._meta.db_table)
+        names = ("exceptionClass", "message", "tbList", "fingerprint", "occurrences", "firstSeen", "lastSeen")
+        fields = [cls._meta.get_field(name) for name in names]
+        columns = {name: qn(field.column) for name, field in zip(names, fields)}
+        values = ", ".join(["(" + ", ".join(["%s"] * names.__len__()) + ")"] * merged.__len__())
+        params = list()
+        # Sorted by fingerprint, so concurrent writers lock the rows in the same order
+        for key in sorted(merged):
+            params.extend(field.get_db_prep_save(merged[key][field.attname], connection) for field in fields)
+        sql = f"""
+            INSERT INTO {table} AS t ({", ".join(columns.values())}) VALUES {values}
+            ON CONFLICT ({columns["fingerprint"]}) DO UPDATE SET
+                {columns["occurrences"]} = t.{columns["occurrences"]} + EXCLUDED.{columns["occurrences"]},
+                {columns["firstSeen"]} = LEAST(t.{columns["firstSeen"]}, EXCLUDED.{columns["firstSeen"]}),
+                {columns["lastSeen"]} = GREATEST(t.{columns["lastSeen"]}, EXCLUDED.{columns["lastSeen"]})
+            RETURNING {columns["fingerprint"]}, {qn(cls._meta.pk.column)}
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return dict(cursor.fetchall())
+
 
 
 # Create your models here.
 class Logs(models.Model):
+    # The table is partitioned by logTime (see canlog.partitions): its primary key is (id, logTime, logEvent), and id comes from a sequence.
     id = models.BigAutoField(primary_key=True, help_text="Unique Log ID, same across databases", null=False, blank=False)
     logType = models.CharField(max_length=cfg.Logs.MAXIMUM_LENGTH_OF_LOGTYPE_CHOICES, help_text="Log Type", null=False, blank=False, choices=_common.LOG_TYPE_AS_DICT)
     logEvent = models.IntegerField(help_text="Log Event NUmber", null=False, blank=False)
     logMessage = models.TextField(help_text="Log Message", null=False, blank=False, max_length=cfg.Logs.MAXIMUM_MESSAGE_LENGTH)
-    logUser = models.ForeignKey(Profile, on_delete=models.SET_NULL, help_text="User", default=-1, null=True, blank=False)
-    origin = models.CharField(max_length=cfg.Logs.ORIGIN_MAXIMUM_LENGTH, help_text="Log Origin", null=True, blank=False, default=None)
+    logUser = models.ForeignKey(Profile, on_delete=models.SET_NULL, help_text="User", default=-1, null=True, blank=False, db_index=False)  # Indexed in Meta
+    origin = models.ForeignKey(to=LogOrigin, on_delete=models.PROTECT, help_text="Log Origin (interned: see InternedName)", null=True, blank=False, default=None, db_index=False)  # Indexed in Meta
     exceptionObject = models.ForeignKey(to=ExceptionModel, on_delete=models.CASCADE, help_text="Linked Exception Object", default=-1, null=True, blank=True)
     additionalData = models.JSONField(help_text="Additional Data", null=True, blank=False, default=None)
-    logTime = models.DateTimeField(auto_now_add=True, help_text="Log Time", null=False, blank=False)
+    logTime = models.DateTimeField(default=djangoTimezone.now, help_text="Log Time", null=False, blank=False)  # Set when the log is written, not when it is flushed
+
+    class Meta:
+        # Keyset pagination of canlog.query: (logTime, id), after the column of each filter
+        indexes = [
+            models.Index(fields=["logTime", "id"], name="CanLog_Logs_Time_Id_Index"),
+            models.Index(fields=["logEvent", "logTime", "id"], name="CanLog_Logs_Event_Time_Index"),
+            models.Index(fields=["logUser", "logTime", "id"], name="CanLog_Logs_User_Time_Index"),
+            models.Index(fields=["origin", "logTime", "id"], name="CanLog_Logs_Origin_Time_Index"),
+        ]
 
 
+    @staticmethod
+    def isEnabled(event: _common.Event, severity: int | None) -> bool:
+        """
+        Check if a log of an event and severity would be written. Cheap: check it before building anything for a log.
+        :param event: The event of the log
+        :param severity: The severity of the log. None is always enabled.
+        """
+        return severity is None or severity <= cfg.EVENT_SEVERITY_LEVELS.get(event, cfg.MINIMUM_SEVERITY_LEVEL)
+
     @classmethod
     def write(cls, logType: _common.LogType, logMessage: str | bool, event: _common.Event, logUser: Profile | None = None,
-              origin: str | bool = True, exceptionObject: BaseException = None, additionalData: dict = None,
-              customTime: datetime = None, severity: int = None) -> Self:
+              origin: str | bool = True, exceptionObject: BaseException = None, additionalData: dict | Callable[[], dict] = None,
+              customTime: datetime = None, severity: int = None, synchronous: bool = None, sample: bool = True) -> Self | None:
         """
         Write a log to the database
         :param logType: The type of log
@@ -44,42 +213,80 @@ class Logs(models.Model):
         :param logUser: The user who wrote the log
         :param origin: The origin of the log. When True, auto-generate. When False, None, or any Falsey value, no origin.
         :param exceptionObject: The exception object
-        :param additionalData: Additional data
+        :param additionalData: Additional data, or a function returning it (only called if the log is enabled)
         :param customTime: The time of the log
-        :param severity: The severity of the log. If None, no severity, just log.
-        :return: The log object created
+        :param severity: The severity of the log. If None, no severity, just log. See isEnabled.
+        :param synchronous: Write the log before returning. If None, as cfg.LOG_WRITE_MODE. Otherwise, the log is appended
+                            to the spool (canlog.spool) if cfg.LOG_WRITE_MODE is Spool, or else (or if the spool cannot
+                            be written) queued on canlog.pipeline.LOG_PIPELINE, and written in the background.
+        :param sample: Apply the sampling policy of the event (see canlog.sampling). Logs with an exception are never sampled out.
+        :return: The log object. Saved if written synchronously; unsaved (no id) if queued. None if the log is not enabled
+                    or was sampled out.
         """
-        if severity is not None and severity <= cfg.MINIMUM_SEVERITY_LEVEL:
+        if not cls.isEnabled(event, severity):
             return None
+        logTime = customTime if customTime else datetime.now(tz=TZ_INFO)
+        if sample and not exceptionObject and not sampling.sample(event, origin if isinstance(origin, str) else None, logTime):
+            return None
+        if callable(additionalData):
+            additionalData = additionalData()
         excObj = None
         if exceptionObject:
-            excObj = ExceptionModel.objects.create(
-                exceptionClass=f"{exceptionObject.__module__}.{exceptionObject.__name__}",
-                message=exceptionObject.__str__(),
-                tbList=list(traceback.format_tb(exceptionObject.__traceback__))
-            )
+            excObj = ExceptionModel.fromException(exceptionObject, logTime)
 
         msg = ""
         if logMessage == True:
             msg = f"{_common.EVENT_TO_NAME[event]} occurred"
         elif logMessage:
             msg = logMessage
-        return cls.objects.create(
-            id="LOG-" + uuid.uuid4().hex,
+        log = cls(
             logType=logType,
             logEvent=event,
             logMessage=msg,
             logUser=logUser,
-            origin=origin,
-            exceptionObject=excObj,
+            exceptionObject=None,
             additionalData=additionalData,
-            logTime=customTime if customTime else datetime.now()
+            logTime=logTime
         )
+        log.originName = str(origin)[:cfg.Logs.ORIGIN_MAXIMUM_LENGTH] if origin else None  # Interned when written: see insert
+        if synchronous is None:
+            synchronous = cfg.LOG_WRITE_MODE == _common.LogWriteMode.Synchronous
+        if not synchronous:
+            if cfg.LOG_WRITE_MODE == _common.LogWriteMode.Spool:
+                try:
+                    SPOOL_WRITER.append(log, excObj)
+                    return log
+                except OSError as _e:
+                    warnings.warn(f"canlog: log not spooled, queued instead: {_e!r}", RuntimeWarning)
+            LOG_PIPELINE.submit(log, excObj)
+            return log
+        cls.insert([(log, excObj)])
+        return log
+
+    @classmethod
+    def insert(cls: Union[Self, Callable], logs: list[tuple[Self, ExceptionModel | None]]) -> None:
+        """
+        Write logs built by write, in one transaction: their exceptions (see ExceptionModel.record) and origins (see
+        InternedName) are stored first, then the logs with one INSERT
+        :param logs: [(unsaved log, its unsaved exception or None)]
+        """
+        with transaction.atomic():
+            # A storm of one exception is one row update per batch (see ExceptionModel.record)
+            exceptionIDs = ExceptionModel.record([exception for _, exception in logs if exception is not None])
+            originIDs = LogOrigin.intern({log.originName for log, _ in logs if getattr(log, "originName", None)})
+            for log, exception in logs:
+                if exception is not None:
+                    log.exceptionObject_id = exceptionIDs[exception.fingerprint]
+                originName = getattr(log, "originName", None)
+                if originName:
+                    log.origin_id = originIDs[originName]
+            cls.objects.bulk_create([log for log, _ in logs])
 
     @classmethod
     def writeRequest(cls, request: HttpRequest, logType: _common.LogType, logMessage: str | bool, event: _common.Event, logUser: Profile | None = None,
               origin: str | bool = True, exceptionObject: BaseException = None, additionalData: dict = None,
-              customTime: datetime = None, severity: int = None) -> Self:
+              customTime: datetime = None, severity: int = None, synchronous: bool = None, captureProfile: str = None,
+              sample: bool = True) -> Self | None:
         """
         Write a log to the database with request information
         :param request: The request object
@@ -92,8 +299,13 @@ class Logs(models.Model):
         :param additionalData: Additional data
         :param customTime: The time of the log
         :param severity: The severity of the log. If None, no severity, just log.
-        :return: The log object created
+        :param synchronous: As in write
+        :param captureProfile: As in generateRequestInfo
+        :param sample: As in write
+        :return: As in write. The request information is only captured if the log is enabled and sampled.
         """
+        if not cls.isEnabled(event, severity):
+            return None
         return cls.write(
             logType=logType,
             logMessage=logMessage,
@@ -101,23 +313,83 @@ class Logs(models.Model):
             logUser=logUser,
             origin=origin,
             exceptionObject=exceptionObject,
-            additionalData={**cls.generateRequestInfo(request), **(additionalData if additionalData else {})},
+            additionalData=lambda: {**cls.generateRequestInfo(request, captureProfile), **(additionalData if additionalData else {})},
             customTime=customTime,
-            severity=severity
+            severity=severity,
+            synchronous=synchronous,
+            sample=sample
         )
 
 
     @staticmethod
-    def generateRequestInfo(request: HttpRequest) -> dict:
-        return {
-            "request": {
-                "method": request.method,
-                "path": request.path,
-                "scheme": request.scheme,
-                "GET": dict(request.GET),
-                "POST": dict(request.POST),
-                "COOKIES": dict(request.COOKIES),
-                "META": dict(request.META),
-                "FILES": dict(request.FILES),
-            }
-        }
+    def generateRequestInfo(request: HttpRequest, profile: str = None) -> dict:
+        """
+        Capture a request for additionalData: a small, fixed-shape record, with secrets hashed or redacted
+        :param request: The request object
+        :param profile: canlog.common.RequestCaptureProfile. If None, cfg.RequestCapture.PROFILE. See canlog.capture.
+        """
+        return captureRequest(request, profile)
+
+
+class RequestRollup(models.Model):
+    """
+    Exact counts of API requests per origin and minute, whatever the sampling of their logs (see canlog.rollup)
+    """
+    origin = models.CharField(max_length=cfg.Logs.ORIGIN_MAXIMUM_LENGTH, help_text="API method", null=False, blank=False)
+    minute = models.DateTimeField(help_text="Start of the minute", null=False, blank=False)
+    requests = models.BigIntegerField(help_text="Number of requests", default=0, null=False, blank=False)
+    status1xx = models.BigIntegerField(help_text="Responses with a 1xx status", default=0, null=False, blank=False)
+    status2xx = models.BigIntegerField(help_text="Responses with a 2xx status", default=0, null=False, blank=False)
+    status3xx = models.BigIntegerField(help_text="Responses with a 3xx status", default=0, null=False, blank=False)
+    status4xx = models.BigIntegerField(help_text="Responses with a 4xx status", default=0, null=False, blank=False)
+    status5xx = models.BigIntegerField(help_text="Responses with a 5xx status", default=0, null=False, blank=False)
+    latencyTotal = models.FloatField(help_text="Sum of the latencies, in milliseconds", default=0, null=False, blank=False)
+    latencyMaximum = models.FloatField(help_text="Maximum latency, in milliseconds", default=0, null=False, blank=False)
+    # Requests per bucket of cfg.Rollup.LATENCY_BUCKETS (at most the bound, in milliseconds), then above the last bound
+    latencyBuckets = ArrayField(models.BigIntegerField(), help_text="Requests per latency bucket", null=False, blank=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["origin", "minute"], name="CanLog_Rollup_Origin_Minute_Unique"),
+        ]
+        indexes = [
+            models.Index(fields=["minute"], name="CanLog_Rollup_Minute_Index"),
+        ]
+
+    @classmethod
+    def add(cls: Union[Self, Callable], rollups: dict[tuple[str, datetime], RollupCounters]) -> None:
+        """
+        Add in-process rollups to the stored ones, in one statement
+        :param rollups: {(origin, minute): counters}
+        """
+        if not rollups:
+            return
+        qn = connection.ops.quote_name
+        table = qn(cls._meta.db_table)
+        column = lambda name: qn(cls._meta.get_field(name).column)
+        summed = ("requests", *STATUS_CLASSES, "latencyTotal")
+        names = ("origin", "minute", *summed, "latencyMaximum", "latencyBuckets")
+        values = ", ".join(["(" + ", ".join(["%s"] * (names.__len__() - 1)) + ", %s::bigint[])"] * rollups.__len__())
+        params = list()
+        # Sorted, so concurrent processes lock the rows in the same order
+        for (origin, minute), counters in sorted(rollups.items()):
+            params.extend((origin, minute, counters.requests, *counters.statuses, counters.latencyTotal, counters.latencyMaximum, counters.latencyBuckets))
+        assignments = [f"{column(name)} = t.{column(name)} + EXCLUDED.{column(name)}" for name in summed]
+        assignments.append(f"{column('latencyMaximum')} = GREATEST(t.{column('latencyMaximum')}, EXCLUDED.{column('latencyMaximum')})")
+        assignments.append(f"{column('latencyBuckets')} = ARRAY(SELECT coalesce(a, 0) + coalesce(b, 0) FROM "
+                           f"unnest(t.{column('latencyBuckets')}, EXCLUDED.{column('latencyBuckets')}) WITH ORDINALITY AS u(a, b, n) ORDER BY n)")
+        sql = f"""
+            INSERT INTO {table} AS t ({", ".join(column(name) for name in names)}) VALUES {values}
+            ON CONFLICT ({column("origin")}, {column("minute")}) DO UPDATE SET {", ".join(assignments)}
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+
+class IngestedSegment(models.Model):
+    """
+    Spool segments loaded by the ingester but maybe not deleted yet (see canlog.spool), so none is loaded twice
+    """
+    name = models.CharField(help_text="Segment file name, without the suffix", max_length=255, unique=True, null=False, blank=False)
+    records = models.IntegerField(help_text="Number of logs loaded", null=False, blank=False)
+    ingestedAt = models.DateTimeField(help_text="Time the segment was loaded", default=djangoTimezone.now, null=False, blank=False)
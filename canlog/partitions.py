@@ -0,0 +1,235 @@
+"""
+Partitions of canlog.Logs.
+
+canlog_logs is partitioned by RANGE ("logTime"): one partition per period (cfg.Partitioning.INTERVAL, a day or a month
+in TZ_INFO). Each period is partitioned again by LIST ("logEvent"): one sub-partition for each event with its own
+retention (cfg.Partitioning.EVENT_RETENTION), and a DEFAULT sub-partition for every other event. A sub-partition expires
+once its retention has passed since the end of its period, and is then dropped (or detached and archived) as a whole,
+never DELETEd from. Queries on a range of logTime only scan the partitions of that range.
+The primary key is (id, "logTime", "logEvent"), as a key of a partitioned table must include the partition columns of
+every level.
+
+Two partitions are not periods:
+    canlog_logs_legacy: the table from before partitioning, holding every log before its upper bound. It expires once
+                        the longest retention has passed.
+    canlog_logs_default: logs with no period partition (e.g. rolloverLogs has not run). They are moved into the
+                        partition of their period when it is created.
+
+Partitions are created ahead, and expired, by the rolloverLogs management command. Run it at least daily.
+"""
+
+from canlog import *
+from canlog import config as cfg
+from canlog import common as _common
+from django.db import connection as defaultConnection
+from django.db.backends.base.base import BaseDatabaseWrapper
+import re
+
+
+LOGS_TABLE: str = "canlog_logs"
+LEGACY_PARTITION: str = f"{LOGS_TABLE}_legacy"
+DEFAULT_PARTITION: str = f"{LOGS_TABLE}_default"
+ID_SEQUENCE: str = f"{LOGS_TABLE}_id_seq"
+DEFAULT_SUBPARTITION_SUFFIX: str = "_edefault"
+
+_RANGE_BOUND = re.compile(r"FOR VALUES FROM \((.+)\) TO \((.+)\)")
+_LIST_BOUND = re.compile(r"FOR VALUES IN \((.+)\)")
+
+
+@dataclass
+class LogPartition:
+    name: str
+    start: datetime | None  # None for MINVALUE
+    end: datetime | None  # None for MAXVALUE, and for the default partition
+    subPartitions: dict[int | None, str]  # {event: table}. None is the DEFAULT sub-partition. Empty if not sub-partitioned.
+
+
+def periodStart(at: datetime, interval: str = None) -> datetime:
+    """
+    Start of the period (in TZ_INFO) containing a time
+    :param interval: canlog.common.PartitionInterval. If None, cfg.Partitioning.INTERVAL.
+    """
+    if interval is None: interval = cfg.Partitioning.INTERVAL
+    day = at.astimezone(TZ_INFO).date()
+    if interval == _common.PartitionInterval.Month:
+        day = day.replace(day=1)
+    elif interval != _common.PartitionInterval.Day:
+        raise ValueError(f"unknown partition interval: {interval}")
+    return datetime(day.year, day.month, day.day, tzinfo=TZ_INFO)
+
+
+def nextPeriod(start: datetime, interval: str = None) -> datetime:
+    """
+    Start of the period after the one starting at start
+    :param interval: As in periodStart
+    """
+    if interval is None: interval = cfg.Partitioning.INTERVAL
+    day = start.astimezone(TZ_INFO).date()
+    if interval == _common.PartitionInterval.Month:
+        day = date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    elif interval == _common.PartitionInterval.Day:
+        day += timedelta(days=1)
+    else:
+        raise ValueError(f"unknown partition interval: {interval}")
+    return datetime(day.year, day.month, day.day, tzinfo=TZ_INFO)
+
+
+def partitionName(start: datetime, interval: str = None) -> str:
+    if interval is None: interval = cfg.Partitioning.INTERVAL
+    return f"{LOGS_TABLE}_p{start.astimezone(TZ_INFO):%Y%m}" if interval == _common.PartitionInterval.Month else f"{LOGS_TABLE}_p{start.astimezone(TZ_INFO):%Y%m%d}"
+
+
+def retentionOf(event: int | None) -> timedelta:
+    """
+    :param event: None for the DEFAULT sub-partition
+    """
+    return cfg.Partitioning.EVENT_RETENTION.get(event, cfg.Partitioning.DEFAULT_RETENTION)
+
+
+def expiredActionOf(event: int | None) -> str:
+    """
+    :param event: None for the DEFAULT sub-partition
+    """
+    return cfg.Partitioning.EVENT_EXPIRED_ACTIONS.get(event, cfg.Partitioning.EXPIRED_ACTION)
+
+
+def _timeBound(value: str) -> datetime | None:
+    value = value.strip()
+    if value.upper() in ("MINVALUE", "MAXVALUE"):
+        return None
+    return datetime.fromisoformat(value.strip("'"))
+
+
+def _children(cursor, table: str) -> list[tuple[str, str, str]]:
+    """
+    (name, bound, relkind) of the partitions of a table
+    """
+    cursor.execute("SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.relkind FROM pg_inherits i "
+                   "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname", [table])
+    return cursor.fetchall()
+
+
+def listPartitions(conn: BaseDatabaseWrapper = None) -> list[LogPartition]:
+    """
+    Partitions of canlog_logs, with their sub-partitions
+    :param conn: Database connection. If None, the default connection.
+    """
+    if conn is None: conn = defaultConnection
+    partitions = list()
+    with conn.cursor() as cursor:
+        for name, bound, kind in _children(cursor, LOGS_TABLE):
+            match = _RANGE_BOUND.fullmatch(bound)
+            start, end = (_timeBound(match.group(1)), _timeBound(match.group(2))) if match else (None, None)
+            subPartitions = dict()
+            if kind == "p":
+                for subName, subBound, _ in _children(cursor, name):
+                    subMatch = _LIST_BOUND.fullmatch(subBound)
+                    subPartitions[int(subMatch.group(1)) if subMatch else None] = subName
+            partitions.append(LogPartition(name, start, end, subPartitions))
+    return partitions
+
+
+def createPartition(start: datetime, interval: str = None, conn: BaseDatabaseWrapper = None) -> str | None:
+    """
+    Create the partition of a period, with its sub-partitions, and move into it any of its logs in the default partition
+    :param start: Start of the period
+    :param interval: As in periodStart
+    :param conn: Database connection. If None, the default connection.
+    :return: Name of the partition created. None if it already exists.
+    """
+    if conn is None: conn = defaultConnection
+    if interval is None: interval = cfg.Partitioning.INTERVAL
+    if periodStart(start, interval) != start:
+        raise ValueError(f"{start.isoformat()} is not the start of a {interval}")
+    end = nextPeriod(start, interval)
+    name = partitionName(start, interval)
+    qn = conn.ops.quote_name
+    with transaction.atomic(using=conn.alias), conn.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [name])
+        if cursor.fetchone()[0]:
+            return None
+        cursor.execute(f'CREATE TABLE {qn(name)} (LIKE {qn(LOGS_TABLE)} INCLUDING DEFAULTS) PARTITION BY LIST ("logEvent")')
+        for event in sorted(cfg.Partitioning.EVENT_RETENTION):
+            cursor.execute(f'CREATE TABLE {qn(f"{name}_e{int(event)}")} PARTITION OF {qn(name)} FOR VALUES IN ({int(event)})')
+        cursor.execute(f'CREATE TABLE {qn(name + DEFAULT_SUBPARTITION_SUFFIX)} PARTITION OF {qn(name)} DEFAULT')
+        # Attaching fails while the default partition holds logs of the period
+        cursor.execute(f'WITH moved AS (DELETE FROM {qn(DEFAULT_PARTITION)} WHERE "logTime" >= %s AND "logTime" < %s RETURNING *) '
+                       f'INSERT INTO {qn(name)} SELECT * FROM moved', [start, end])
+        cursor.execute(f"ALTER TABLE {qn(LOGS_TABLE)} ATTACH PARTITION {qn(name)} FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')")
+    return name
+
+
+def createFuturePartitions(now: datetime = None, ahead: int = None, conn: BaseDatabaseWrapper = None) -> list[str]:
+    """
+    Create the partitions of the current period and of the next ones, where missing
+    :param now: If None, now
+    :param ahead: Number of periods after the current one. If None, cfg.Partitioning.PREMAKE.
+    :param conn: Database connection. If None, the default connection.
+    :return: Names of the partitions created
+    """
+    if now is None: now = datetime.now(tz=TZ_INFO)
+    if ahead is None: ahead = cfg.Partitioning.PREMAKE
+    if ahead < 0:
+        raise ValueError("ahead must be non-negative")
+    covered = [(p.start, p.end) for p in listPartitions(conn) if p.name != DEFAULT_PARTITION]
+    created = list()
+    start = periodStart(now)
+    for _ in range(ahead + 1):
+        end = nextPeriod(start)
+        overlaps = any((low is None or low < end) and (high is None or start < high) for low, high in covered)
+        if not overlaps:
+            name = createPartition(start, conn=conn)
+            if name is not None:
+                created.append(name)
+        start = end
+    return created
+
+
+def _expire(cursor, qn: Callable[[str], str], parent: str, table: str, action: str, dryRun: bool) -> None:
+    if dryRun:
+        return
+    if action == _common.ExpiredPartitionAction.Archive:
+        cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {qn(cfg.Partitioning.ARCHIVE_SCHEMA)}')
+        cursor.execute(f'ALTER TABLE {qn(parent)} DETACH PARTITION {qn(table)}')
+        cursor.execute(f'ALTER TABLE {qn(table)} SET SCHEMA {qn(cfg.Partitioning.ARCHIVE_SCHEMA)}')
+    elif action == _common.ExpiredPartitionAction.Drop:
+        cursor.execute(f'DROP TABLE {qn(table)}')
+    else:
+        raise ValueError(f"unknown expired partition action: {action}")
+
+
+def expirePartitions(now: datetime = None, dryRun: bool = False, conn: BaseDatabaseWrapper = None) -> list[tuple[str, str]]:
+    """
+    Drop or archive the (sub-)partitions whose retention has passed. A period partition left without sub-partitions is
+    dropped.
+    :param now: If None, now
+    :param dryRun: Only report what would be done
+    :param conn: Database connection. If None, the default connection.
+    :return: (table, action) of each expired table
+    """
+    if now is None: now = datetime.now(tz=TZ_INFO)
+    if conn is None: conn = defaultConnection
+    qn = conn.ops.quote_name
+    longest = max([cfg.Partitioning.DEFAULT_RETENTION, *cfg.Partitioning.EVENT_RETENTION.values()])
+    expired = list()
+    for partition in listPartitions(conn):
+        if partition.name == DEFAULT_PARTITION or partition.end is None:
+            continue
+        with transaction.atomic(using=conn.alias), conn.cursor() as cursor:
+            if not partition.subPartitions:  # The legacy partition, or a period partitioned before sub-partitioning
+                if partition.end + longest <= now:
+                    action = expiredActionOf(None)
+                    _expire(cursor, qn, LOGS_TABLE, partition.name, action, dryRun)
+                    expired.append((partition.name, action))
+                continue
+            remaining = partition.subPartitions.__len__()
+            for event, table in partition.subPartitions.items():
+                if partition.end + retentionOf(event) <= now:
+                    action = expiredActionOf(event)
+                    _expire(cursor, qn, partition.name, table, action, dryRun)
+                    expired.append((table, action))
+                    remaining -= 1
+            if not remaining:
+                _expire(cursor, qn, LOGS_TABLE, partition.name, _common.ExpiredPartitionAction.Drop, dryRun)
+                expired.append((partition.name, _common.ExpiredPartitionAction.Drop))
+    return expired
@@ -0,0 +1,231 @@
+"""
+In-process log pipeline: Logs.write queues logs (with their ExceptionModel, if any) and returns immediately, and a
+background thread writes them with bulk_create, whenever BATCH_SIZE logs are waiting or FLUSH_INTERVAL has passed.
+
+The queue is bounded (cfg.Pipeline.QUEUE_SIZE). When it is full, Logs.write waits up to ENQUEUE_TIMEOUT and then drops
+the log; dropped logs, and logs lost to a failed batch, are counted in LogPipeline.stats(). The queue is drained
+synchronously when the process exits.
+"""
+
+from canlog import *
+from canlog import config as cfg
+from django.db import close_old_connections, connection, models
+import atexit
+import os
+import queue
+import threading
+import time
+
+
+class _Flush:
+    """
+    Queue marker: write everything queued before it, then set done
+    """
+    __slots__ = ("done",)
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+_STOP = object()  # Queue marker: write everything queued before it, then stop the thread
+
+
+class LogPipeline:
+    """
+    Bounded queue of logs, written in batches by a daemon thread. The thread is started on the first submit (and again
+    in a forked child process).
+    """
+    def __init__(self, queueSize: int = None, batchSize: int = None, flushInterval: float = None, enqueueTimeout: float = None):
+        """
+        :param queueSize: If None, cfg.Pipeline.QUEUE_SIZE
+        :param batchSize: If None, cfg.Pipeline.BATCH_SIZE
+        :param flushInterval: Seconds. If None, cfg.Pipeline.FLUSH_INTERVAL
+        :param enqueueTimeout: Seconds. If None, cfg.Pipeline.ENQUEUE_TIMEOUT
+        """
+        self.queueSize = cfg.Pipeline.QUEUE_SIZE if queueSize is None else queueSize
+        self.batchSize = cfg.Pipeline.BATCH_SIZE if batchSize is None else batchSize
+        self.flushInterval = cfg.Pipeline.FLUSH_INTERVAL if flushInterval is None else flushInterval
+        self.enqueueTimeout = cfg.Pipeline.ENQUEUE_TIMEOUT if enqueueTimeout is None else enqueueTimeout
+        if self.queueSize < 1 or self.batchSize < 1:
+            raise ValueError("queueSize and batchSize must be at least 1")
+        self._lock = threading.Lock()
+        self._queue: queue.Queue | None = None
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        self._counters = {"submitted": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0}
+        self._periodic: list[tuple[Callable[[], None], float]] = list()
+
+    def addPeriodic(self, task: Callable[[], None], interval: float) -> None:
+        """
+        Run a task on the pipeline thread every interval seconds, and once more when the pipeline is closed (e.g. to
+        write in-process aggregates). Exceptions raised by the task are warned about and otherwise ignored.
+        Tasks must be added before the pipeline thread starts (e.g. when their module is imported).
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self._periodic.append((task, interval))
+
+    def _runPeriodic(self, task: Callable[[], None]) -> None:
+        try:
+            close_old_connections()
+            task()
+        except Exception as _e:
+            warnings.warn(f"canlog pipeline: periodic task {getattr(task, '__qualname__', task)} failed: {_e!r}", RuntimeWarning)
+
+    def start(self) -> None:
+        """
+        Start the pipeline thread, if it is not running (it is also started by submit)
+        """
+        self._ensureStarted()
+
+    def _count(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[counter] += amount
+
+    def stats(self) -> dict[str, int]:
+        """
+        :return: Counters since the process started: submitted, written, dropped (queue full), failed (lost to a failed
+                    batch), batches; and queued (waiting now)
+        """
+        with self._lock:
+            return {**self._counters, "queued": self._queue.qsize() if self._queue is not None else 0}
+
+    def _ensureStarted(self) -> queue.Queue:
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return self._queue
+        with self._lock:
+            if self._pid != os.getpid():  # First use, or a forked child: the parent's thread does not exist here
+                self._queue = queue.Queue(maxsize=self.queueSize)
+                self._thread = None
+                self._pid = os.getpid()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="canlog-pipeline", daemon=True)
+                self._thread.start()
+            return self._queue
+
+    def submit(self, log: models.Model, exception: models.Model | None = None) -> bool:
+        """
+        Queue a log to be written
+        :param log: Unsaved Logs instance
+        :param exception: Unsaved ExceptionModel instance linked to the log, if any
+        :return: If the log was queued. False if the queue was full and the log was dropped.
+        """
+        target = self._ensureStarted()
+        self._count("submitted")
+        try:
+            if self.enqueueTimeout > 0:
+                target.put((log, exception), timeout=self.enqueueTimeout)
+            else:
+                target.put_nowait((log, exception))
+        except queue.Full:
+            self._count("dropped")
+            return False
+        return True
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until every log queued before this call has been written (or has failed)
+        :param timeout: Seconds. If None, wait indefinitely.
+        :return: If the queue was flushed before the timeout
+        """
+        if self._queue is None or self._pid != os.getpid():
+            return True
+        marker = _Flush()
+        try:
+            self._ensureStarted().put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.done.wait(timeout)
+
+    def close(self, timeout: float = None) -> None:
+        """
+        Write everything queued and stop the thread. Logs still queued after the timeout are written on this thread.
+        :param timeout: Seconds. If None, cfg.Pipeline.SHUTDOWN_TIMEOUT
+        """
+        if timeout is None: timeout = cfg.Pipeline.SHUTDOWN_TIMEOUT
+        if self._thread is None or self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        else:
+            self._thread.join(max(deadline - time.monotonic(), 0))
+        remaining = list()
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, tuple):
+                remaining.append(item)
+            elif isinstance(item, _Flush):
+                item.done.set()
+        for start in range(0, remaining.__len__(), self.batchSize):
+            self._write(remaining[start:start + self.batchSize])
+        for task, _ in self._periodic:
+            self._runPeriodic(task)
+
+    def _run(self) -> None:
+        target = self._queue
+        batch: list[tuple[models.Model, models.Model | None]] = list()
+        deadline = None
+        periodicDeadlines = [time.monotonic() + interval for _, interval in self._periodic]
+        try:
+            while True:
+                now = time.monotonic()
+                for n, (task, interval) in enumerate(self._periodic):
+                    if periodicDeadlines[n] <= now:
+                        self._runPeriodic(task)
+                        periodicDeadlines[n] = time.monotonic() + interval
+                wake = min([d for d in (deadline, *periodicDeadlines) if d is not None], default=None)
+                timeout = None if wake is None else max(wake - time.monotonic(), 0)
+                try:
+                    item = target.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+                    if deadline is None or deadline > time.monotonic():
+                        continue  # Woken for a periodic task
+                if isinstance(item, tuple):
+                    batch.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flushInterval
+                    if batch.__len__() < self.batchSize:
+                        continue
+                if batch:
+                    self._write(batch)
+                    batch, deadline = list(), None
+                if isinstance(item, _Flush):
+                    item.done.set()
+                elif item is _STOP:
+                    return
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _insert(batch: list[tuple[models.Model, models.Model | None]]) -> None:
+        from canlog.models import Logs
+        Logs.insert(batch)
+
+    def _write(self, batch: list[tuple[models.Model, models.Model | None]]) -> None:
+        close_old_connections()
+        try:
+            self._insert(batch)
+        except Exception:
+            # One bad log (e.g. unserialisable additionalData) must not lose the whole batch: write them one by one
+            failed = 0
+            for item in batch:
+                try:
+                    self._insert([item])
+                except Exception as _e:
+                    failed += 1
+                    warnings.warn(f"canlog pipeline: log lost: {_e!r}", RuntimeWarning)
+            self._count("failed", failed)
+            self._count("written", batch.__len__() - failed)
+        else:
+            self._count("written", batch.__len__())
+        self._count("batches")
+
+LOG_PIPELINE = LogPipeline()
+atexit.register(LOG_PIPELINE.close)
@@ -0,0 +1,102 @@
+"""
+Filtered, keyset-paginated queries over canlog.Logs, newest first.
+
+Pages are ordered by (logTime, id) descending, and the next page is the logs strictly before the last log of the page
+(the cursor), so each page is one index range scan whatever its depth: no OFFSET, and no COUNT. Each filter has a
+composite index ending in (logTime, id) (see Logs.Meta.indexes); a time range also prunes the partitions of Logs.
+"""
+
+from canlog import *
+from canlog import config as cfg
+from canlog.models import Logs, LogOrigin
+from django.db import connection
+from django.db.models import BooleanField, QuerySet
+from django.db.models.expressions import RawSQL
+import base64
+
+
+@dataclass(frozen=True)
+class LogQuery:
+    """
+    Filters of a log query. None is no filter.
+    """
+    logTypes: tuple[str, ...] | None = None
+    logEvents: tuple[int, ...] | None = None
+    logUser: int | None = None
+    origin: str | None = None  # Exact origin
+    since: datetime | None = None  # Inclusive
+    until: datetime | None = None  # Exclusive
+
+
+@dataclass
+class LogPage:
+    logs: list[Logs]
+    next: str | None  # Cursor of the next page. None on the last page.
+
+
+def encodeCursor(logTime: datetime, logID: int) -> str:
+    return base64.urlsafe_b64encode(f"{logTime.isoformat()}|{logID}".encode()).decode().rstrip("=")
+
+
+def decodeCursor(cursor: str) -> tuple[datetime, int]:
+    """
+    :raise ValueError: The cursor is not one from encodeCursor
+    """
+    try:
+        logTime, logID = base64.urlsafe_b64decode(cursor + "=" * (-cursor.__len__() % 4)).decode().split("|")
+        logTime, logID = datetime.fromisoformat(logTime), int(logID)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("invalid cursor") from None
+    if logTime.tzinfo is None:
+        raise ValueError("invalid cursor")
+    return logTime, logID
+
+
+def filterLogs(query: LogQuery) -> QuerySet:
+    """
+    Logs matching a query, newest first
+    """
+    logs = Logs.objects.all()
+    if query.logTypes is not None:
+        logs = logs.filter(logType__in=query.logTypes)
+    if query.logEvents is not None:
+        logs = logs.filter(logEvent__in=query.logEvents)
+    if query.logUser is not None:
+        logs = logs.filter(logUser_id=query.logUser)
+    if query.origin is not None:
+        # Resolved first, so the filter is on the indexed origin_id rather than through a join
+        origin = LogOrigin.objects.filter(name=query.origin).values_list("pk", flat=True).first()
+        if origin is None:
+            return logs.none()
+        logs = logs.filter(origin_id=origin)
+    if query.since is not None:
+        logs = logs.filter(logTime__gte=query.since)
+    if query.until is not None:
+        logs = logs.filter(logTime__lt=query.until)
+    return logs.order_by("-logTime", "-id")
+
+
+def pageLogs(query: LogQuery, cursor: str = None, limit: int = None) -> LogPage:
+    """
+    One page of the logs matching a query
+    :param query: The filters
+    :param cursor: LogPage.next of the previous page. If None, the first page.
+    :param limit: Logs per page. If None, cfg.Query.DEFAULT_PAGE_SIZE. At most cfg.Query.MAXIMUM_PAGE_SIZE.
+    :raise ValueError: The cursor or limit is invalid
+    """
+    if limit is None: limit = cfg.Query.DEFAULT_PAGE_SIZE
+    if not 1 <= limit <= cfg.Query.MAXIMUM_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {cfg.Query.MAXIMUM_PAGE_SIZE}")
+    logs = filterLogs(query)
+    if cursor is not None:
+        logTime, logID = decodeCursor(cursor)
+        qn = connection.ops.quote_name
+        table = qn(Logs._meta.db_table)
+        # A row comparison, so PostgreSQL starts the index scan at the cursor (rather than filtering "a < x OR (a = x AND b < y)")
+        logs = logs.filter(RawSQL(f"({table}.{qn(Logs._meta.get_field('logTime').column)}, {table}.{qn(Logs._meta.pk.column)}) < (%s, %s)",
+                                  (logTime, logID), output_field=BooleanField()))
+    found = list(logs.select_related("origin")[:limit + 1])  # One more, to know if there is a next page
+    if found.__len__() <= limit:
+        return LogPage(found, None)
+    found = found[:limit]
+    return LogPage(found, encodeCursor(found[-1].logTime, found[-1].id))
@@ -0,0 +1,107 @@
+"""
+Exact per-minute rollups of API requests: request count, status classes and latency histogram per (origin, minute).
+They are aggregated in-process and added to canlog.RequestRollup by the log pipeline every cfg.Rollup.FLUSH_INTERVAL
+seconds (and when the process exits), one upsert for all of them, so every request is counted whatever the sampling of
+its log (canlog.sampling).
+"""
+
+from canlog import *
+from canlog import config as cfg
+from canlog.pipeline import LOG_PIPELINE
+from bisect import bisect_left
+import threading
+
+
+STATUS_CLASSES: tuple[str, ...] = ("status1xx", "status2xx", "status3xx", "status4xx", "status5xx")
+
+
+class RollupCounters:
+    """
+    Counters of one (origin, minute)
+    """
+    __slots__ = ("requests", "statuses", "latencyTotal", "latencyMaximum", "latencyBuckets")
+
+    def __init__(self, buckets: int):
+        self.requests = 0
+        self.statuses = [0] * STATUS_CLASSES.__len__()
+        self.latencyTotal = 0.0  # Milliseconds
+        self.latencyMaximum = 0.0  # Milliseconds
+        self.latencyBuckets = [0] * (buckets + 1)
+
+    def merge(self, other: Self) -> None:
+        self.requests += other.requests
+        self.statuses = [a + b for a, b in zip(self.statuses, other.statuses)]
+        self.latencyTotal += other.latencyTotal
+        self.latencyMaximum = max(self.latencyMaximum, other.latencyMaximum)
+        self.latencyBuckets = [a + b for a, b in zip(self.latencyBuckets, other.latencyBuckets)]
+
+
+class RequestRollups:
+    """
+    Thread-safe, in-process request rollups
+    """
+    def __init__(self, latencyBuckets: tuple[float, ...]):
+        self.latencyBuckets = tuple(sorted(latencyBuckets))
+        self._rollups: dict[tuple[str, datetime], RollupCounters] = dict()
+        self._lock = threading.Lock()
+
+    def record(self, origin: str, status: int, latency: float, at: datetime) -> None:
+        """
+        Count one request
+        :param origin: Origin of the request (the API method)
+        :param status: HTTP status of the response
+        :param latency: Seconds
+        :param at: Time of the request
+        """
+        milliseconds = latency * 1000
+        key = (origin, at.replace(second=0, microsecond=0))
+        statusClass = status // 100 - 1
+        with self._lock:
+            counters = self._rollups.get(key)
+            if counters is None:
+                counters = self._rollups[key] = RollupCounters(self.latencyBuckets.__len__())
+            counters.requests += 1
+            if 0 <= statusClass < STATUS_CLASSES.__len__():
+                counters.statuses[statusClass] += 1
+            counters.latencyTotal += milliseconds
+            counters.latencyMaximum = max(counters.latencyMaximum, milliseconds)
+            counters.latencyBuckets[bisect_left(self.latencyBuckets, milliseconds)] += 1
+        LOG_PIPELINE.start()
+
+    def drain(self) -> dict[tuple[str, datetime], RollupCounters]:
+        """
+        Take the rollups aggregated so far
+        """
+        with self._lock:
+            rollups, self._rollups = self._rollups, dict()
+        return rollups
+
+    def restore(self, rollups: dict[tuple[str, datetime], RollupCounters]) -> None:
+        """
+        Put back rollups that could not be written, merged with those aggregated since
+        """
+        with self._lock:
+            for key, counters in rollups.items():
+                current = self._rollups.get(key)
+                if current is None:
+                    self._rollups[key] = counters
+                else:
+                    current.merge(counters)
+
+    def flush(self) -> None:
+        """
+        Add the rollups aggregated so far to canlog.RequestRollup. If that fails, they are kept for the next flush.
+        """
+        from canlog.models import RequestRollup
+        rollups = self.drain()
+        if not rollups:
+            return
+        try:
+            RequestRollup.add(rollups)
+        except Exception:
+            self.restore(rollups)
+            raise
+
+
+REQUEST_ROLLUPS = RequestRollups(cfg.Rollup.LATENCY_BUCKETS)
+LOG_PIPELINE.addPeriodic(REQUEST_ROLLUPS.flush, cfg.Rollup.FLUSH_INTERVAL)
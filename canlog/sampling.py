@@ -0,0 +1,89 @@
+"""
+Sampling of logs, per event (cfg.Sampling.EVENT_POLICIES). Request volume stays visible in the exact per-minute rollups
+(canlog.rollup) whatever is sampled out.
+"""
+
+from canlog import *
+from canlog import config as cfg
+from canlog import common as _common
+import random
+import threading
+
+
+class SamplingPolicy:
+    """
+    Always sample
+    """
+    def sample(self, origin: str | None, at: datetime) -> bool:
+        """
+        :param origin: Origin of the log
+        :param at: Time of the log
+        :return: If the log is written
+        """
+        return True
+
+
+class ProbabilisticSampling(SamplingPolicy):
+    def __init__(self, rate: float):
+        if not 0 <= rate <= 1:
+            raise ValueError("rate must be between 0 and 1")
+        self.rate = rate
+
+    def sample(self, origin: str | None, at: datetime) -> bool:
+        return random.random() < self.rate
+
+
+class FirstPerMinuteSampling(SamplingPolicy):
+    def __init__(self, limit: int):
+        if limit < 0:
+            raise ValueError("limit must be non-negative")
+        self.limit = limit
+        self._minute: datetime | None = None
+        self._counts: dict[str | None, int] = dict()
+        self._lock = threading.Lock()
+
+    def sample(self, origin: str | None, at: datetime) -> bool:
+        minute = at.replace(second=0, microsecond=0)
+        with self._lock:
+            if minute != self._minute:
+                if self._minute is not None and minute < self._minute:
+                    return False  # A late log of a past minute, whose count is gone: assume it was full
+                self._minute, self._counts = minute, dict()
+            count = self._counts.get(origin, 0)
+            if count >= self.limit:
+                return False
+            self._counts[origin] = count + 1
+            return True
+
+
+_POLICY_CLASSES: dict[str, Callable[..., SamplingPolicy]] = {
+    _common.SamplingKind.Always: lambda parameter=None: SamplingPolicy(),
+    _common.SamplingKind.Probabilistic: ProbabilisticSampling,
+    _common.SamplingKind.FirstPerMinute: FirstPerMinuteSampling,
+}
+_POLICIES: dict[int, tuple[tuple[str, float | int], SamplingPolicy]] = dict()  # {event: (configuration, policy)}
+
+
+def policyOf(event: int) -> SamplingPolicy | None:
+    """
+    The sampling policy of an event, as configured in cfg.Sampling.EVENT_POLICIES. None if the event is not sampled.
+    """
+    configuration = cfg.Sampling.EVENT_POLICIES.get(event)
+    if configuration is None:
+        return None
+    cached = _POLICIES.get(event)
+    if cached is None or cached[0] != configuration:  # First use, or the configuration changed
+        kind, parameter = configuration
+        try:
+            cached = _POLICIES[event] = (configuration, _POLICY_CLASSES[kind](parameter))
+        except KeyError:
+            raise ValueError(f"unknown sampling kind: {kind}") from None
+    return cached[1]
+
+
+def sample(event: int, origin: str | None, at: datetime) -> bool:
+    """
+    Check if a log is written under the sampling policy of its event
+    """
+    policy = policyOf(event)
+    return policy is None or policy.sample(origin, at)
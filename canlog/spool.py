@@ -0,0 +1,389 @@
+"""
+Crash-safe local spool of logs: Logs.write (in LogWriteMode.Spool) appends each log to a segment file and returns, and
+the ingestSpooledLogs command loads sealed segments into the database with COPY, so logging neither blocks on nor is
+lost to a slow or failing-over database.
+
+A segment is the file MAGIC followed by records, each a header (payload length and CRC-32, little-endian uint32s) and
+a JSON payload. It is written as <host>-<pid>-<time>-<n>.open by one process, with one buffered write per record,
+flushed to the OS (so records survive a crash of the process; see cfg.Spool.SYNC_EACH_RECORD for crashes of the host).
+After cfg.Spool.SEGMENT_SIZE bytes or SEGMENT_AGE seconds it is fsynced and renamed to .seg (sealed).
+The ingester loads sealed segments in batches of about INGEST_BATCH_BYTES, one transaction each, recording
+their names in canlog.IngestedSegment in the same transaction; then it deletes them and fsyncs the directory. A segment
+found again after a crash between the two is recognised and deleted, not loaded twice. A torn last record (the writer
+crashed mid-write) ends its segment; .open segments of dead processes are sealed by the ingester.
+"""
+
+from canlog import *
+from canlog import config as cfg
+from canlog.pipeline import LOG_PIPELINE
+from django.db import connection, models, DataError, IntegrityError, InterfaceError, OperationalError
+from pathlib import Path
+from typing import Iterator
+import atexit
+import fcntl
+import io
+import json
+import os
+import socket
+import struct
+import threading
+import time
+import zlib
+
+
+MAGIC: bytes = b"CLSPOOL1"
+OPEN_SUFFIX: str = ".open"
+SEALED_SUFFIX: str = ".seg"
+BAD_SUFFIX: str = ".bad"  # Segments the ingester could not load, kept for inspection
+_HEADER = struct.Struct("<II")  # Payload length, CRC-32 of the payload
+_HOST: str = socket.gethostname().replace("/", "_")
+_BAD_SEGMENT_ERRORS = (DataError, IntegrityError, ValueError, KeyError, TypeError)  # Errors of the segment, not of the database
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def encodeLog(log: models.Model, exception: models.Model | None) -> bytes:
+    """
+    Spool payload of a log built by Logs.write (and its exception, as from ExceptionModel.fromException)
+    """
+    record = {
+        "logType": log.logType,
+        "logEvent": log.logEvent,
+        "logMessage": log.logMessage,
+        "logUser": log.logUser_id,
+        "origin": getattr(log, "originName", None),
+        "additionalData": log.additionalData,
+        "logTime": log.logTime.isoformat(),
+        "exception": None if exception is None else {
+            "exceptionClass": exception.exceptionClassName,
+            "message": exception.message,
+            "tbList": exception.tbList,
+            "fingerprint": exception.fingerprint,
+            "seen": exception.firstSeen.isoformat(),
+        },
+    }
+    return json.dumps(record, default=str, separators=(",", ":")).encode()
+
+
+def readSegment(path: Path) -> Iterator[dict]:
+    """
+    Records of a segment, in order. Reading stops at a torn or corrupt record.
+    :raise ValueError: The file is not a segment
+    """
+    with open(path, "rb") as file:
+        if file.read(MAGIC.__len__()) != MAGIC:
+            raise ValueError(f"not a spool segment: {path}")
+        while True:
+            header = file.read(_HEADER.size)
+            if header.__len__() < _HEADER.size:
+                return
+            length, crc = _HEADER.unpack(header)
+            payload = file.read(length)
+            if payload.__len__() < length or zlib.crc32(payload) != crc:
+                warnings.warn(f"canlog spool: torn record at byte {file.tell() - payload.__len__() - _HEADER.size} of {path}, rest of the segment skipped", RuntimeWarning)
+                return
+            yield json.loads(payload)
+
+
+def _fsyncDirectory(directory: Path) -> None:
+    descriptor = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+class SpoolWriter:
+    """
+    Appends logs to the current segment of this process. Thread-safe; a forked child starts its own segment.
+    """
+    def __init__(self, directory: Path = None, segmentSize: int = None, segmentAge: float = None, syncEachRecord: bool = None):
+        """
+        :param directory: If None, cfg.Spool.DIRECTORY
+        :param segmentSize: Bytes. If None, cfg.Spool.SEGMENT_SIZE
+        :param segmentAge: Seconds. If None, cfg.Spool.SEGMENT_AGE
+        :param syncEachRecord: If None, cfg.Spool.SYNC_EACH_RECORD
+        """
+        self.directory = Path(cfg.Spool.DIRECTORY if directory is None else directory)
+        self.segmentSize = cfg.Spool.SEGMENT_SIZE if segmentSize is None else segmentSize
+        self.segmentAge = cfg.Spool.SEGMENT_AGE if segmentAge is None else segmentAge
+        self.syncEachRecord = cfg.Spool.SYNC_EACH_RECORD if syncEachRecord is None else syncEachRecord
+        self._lock = threading.Lock()
+        self._file: io.BufferedWriter | None = None
+        self._path: Path | None = None
+        self._pid: int | None = None
+        self._opened = 0.0
+        self._size = 0
+        self._records = 0
+        self._sequence = 0
+        self._counters = {"appended": 0, "segments": 0}
+
+    def _open(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._sequence += 1
+        self._path = self.directory / f"{_HOST}-{os.getpid()}-{time.time_ns()}-{self._sequence}{OPEN_SUFFIX}"
+        self._file = open(self._path, "xb")
+        self._file.write(MAGIC)
+        self._file.flush()
+        self._opened, self._size, self._records = time.monotonic(), MAGIC.__len__(), 0
+        LOG_PIPELINE.start()  # Runs sealIfStale
+
+    def _seal(self) -> None:
+        file, path = self._file, self._path
+        self._file, self._path = None, None
+        try:
+            file.flush()
+            os.fsync(file.fileno())
+        finally:
+            file.close()
+        if self._records == 0:
+            path.unlink()
+            return
+        path.rename(path.with_suffix(SEALED_SUFFIX))
+        _fsyncDirectory(self.directory)
+        self._counters["segments"] += 1
+
+    def append(self, log: models.Model, exception: models.Model | None = None) -> None:
+        """
+        Append a log to the spool
+        :param log: Unsaved Logs instance, as built by Logs.write
+        :param exception: Unsaved ExceptionModel instance linked to the log, if any
+        :raise OSError: The log could not be written (e.g. the disk is full)
+        """
+        payload = encodeLog(log, exception)
+        record = _HEADER.pack(payload.__len__(), zlib.crc32(payload)) + payload
+        with self._lock:
+            if self._pid != os.getpid():  # First use, or forked: the parent's segment is not ours
+                self._file, self._path, self._pid = None, None, os.getpid()
+            if self._file is None:
+                self._open()
+            try:
+                self._file.write(record)
+                self._file.flush()
+                if self.syncEachRecord:
+                    os.fsync(self._file.fileno())
+            except OSError:
+                # The record may be partly written: end the segment there (reading stops at a torn record)
+                try:
+                    self._seal()
+                except OSError:
+                    self._file = None
+                raise
+            self._size += record.__len__()
+            self._records += 1
+            self._counters["appended"] += 1
+            if self._size >= self.segmentSize or time.monotonic() - self._opened >= self.segmentAge:
+                self._seal()
+
+    def seal(self) -> None:
+        """
+        Seal the current segment, if any
+        """
+        with self._lock:
+            if self._file is not None and self._pid == os.getpid():
+                self._seal()
+
+    def sealIfStale(self) -> None:
+        """
+        Seal the current segment if it is older than segmentAge, so logs written before a quiet period are ingested
+        """
+        with self._lock:
+            if self._file is not None and self._pid == os.getpid() and time.monotonic() - self._opened >= self.segmentAge:
+                self._seal()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {**self._counters, "openRecords": self._records if self._file is not None else 0}
+
+
+def _copyField(value: Any) -> str:
+    if value is None:
+        return "\\N"
+    return str(value).translate(_COPY_ESCAPES)
+
+
+def _copy(cursor, sql: str, data: str) -> None:
+    raw = cursor.cursor
+    if hasattr(raw, "copy"):  # psycopg 3
+        with raw.copy(sql) as copy:
+            copy.write(data)
+    else:  # psycopg2
+        raw.copy_expert(sql, io.StringIO(data))
+
+
+class SpoolIngester:
+    """
+    Loads sealed segments into canlog.Logs. One ingester per spool directory (enforced with a lock file).
+    """
+    def __init__(self, directory: Path = None, batchBytes: int = None):
+        """
+        :param directory: If None, cfg.Spool.DIRECTORY
+        :param batchBytes: If None, cfg.Spool.INGEST_BATCH_BYTES
+        """
+        self.directory = Path(cfg.Spool.DIRECTORY if directory is None else directory)
+        self.batchBytes = cfg.Spool.INGEST_BATCH_BYTES if batchBytes is None else batchBytes
+        self._lockFile = None
+
+    def lock(self) -> None:
+        """
+        :raise RuntimeError: Another ingester holds the spool directory
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lockFile = open(self.directory / ".ingester.lock", "a")
+        try:
+            fcntl.flock(self._lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lockFile.close()
+            self._lockFile = None
+            raise RuntimeError(f"another ingester is running on {self.directory}") from None
+
+    def recover(self) -> list[Path]:
+        """
+        Seal the open segments of processes of this host that no longer exist
+        :return: The segments sealed
+        """
+        sealed = list()
+        for path in self.directory.glob(f"*{OPEN_SUFFIX}"):
+            try:
+                host, pid, _, _ = path.stem.rsplit("-", 3)
+                pid = int(pid)
+            except ValueError:
+                continue
+            if host != _HOST or pid == os.getpid():
+                continue
+            try:
+                os.kill(pid, 0)
+                continue  # Alive
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                continue  # Alive, another user's
+            target = path.with_suffix(SEALED_SUFFIX)
+            path.rename(target)
+            sealed.append(target)
+        if sealed:
+            _fsyncDirectory(self.directory)
+        return sealed
+
+    def sealedSegments(self) -> list[Path]:
+        """
+        Sealed segments, oldest first
+        """
+        def age(path: Path) -> tuple[int, str]:
+            try:
+                return int(path.stem.rsplit("-", 2)[1]), path.name
+            except (ValueError, IndexError):
+                return 0, path.name
+        return sorted(self.directory.glob(f"*{SEALED_SUFFIX}"), key=age)
+
+    def _load(self, segments: list[Path]) -> int:
+        """
+        Load segments in one transaction: their exceptions (ExceptionModel.record) and origins (LogOrigin.intern), then
+        their logs with one COPY, and their names in IngestedSegment. Segments already ingested are skipped.
+        Users deleted since their logs were spooled are set to NULL, as their logs would have been (on_delete=SET_NULL).
+        :return: Number of logs loaded
+        """
+        from canlog.models import Logs, ExceptionModel, LogOrigin, IngestedSegment, Profile
+        names = [segment.stem for segment in segments]
+        with transaction.atomic():
+            done = set(IngestedSegment.objects.filter(name__in=names).values_list("name", flat=True))
+            loaded = [(segment, list(readSegment(segment))) for segment in segments if segment.stem not in done]
+            records = [record for _, segmentRecords in loaded for record in segmentRecords]
+            exceptions = list()
+            for record in records:
+                if record["exception"] is not None:
+                    found = record["exception"]
+                    seen = datetime.fromisoformat(found["seen"])
+                    exception = ExceptionModel(message=found["message"], tbList=found["tbList"], fingerprint=found["fingerprint"],
+                                               occurrences=1, firstSeen=seen, lastSeen=seen)
+                    exception.exceptionClassName = found["exceptionClass"]
+                    exceptions.append(exception)
+            exceptionIDs = ExceptionModel.record(exceptions)
+            originIDs = LogOrigin.intern({record["origin"] for record in records if record["origin"]})
+            users = {record["logUser"] for record in records if record["logUser"] is not None}
+            users = set(Profile.objects.filter(pk__in=users).values_list("pk", flat=True)) if users else set()
+            if records:
+                qn = connection.ops.quote_name
+                names = ("logType", "logEvent", "logMessage", "logUser", "origin", "exceptionObject", "additionalData", "logTime")
+                columns = ", ".join(qn(Logs._meta.get_field(name).column) for name in names)
+                data = "".join("\t".join(_copyField(value) for value in (
+                    record["logType"], record["logEvent"], record["logMessage"], record["logUser"] if record["logUser"] in users else None,
+                    originIDs[record["origin"]] if record["origin"] else None,
+                    exceptionIDs[record["exception"]["fingerprint"]] if record["exception"] is not None else None,
+                    None if record["additionalData"] is None else json.dumps(record["additionalData"]),
+                    record["logTime"],
+                )) + "\n" for record in records)
+                with connection.cursor() as cursor:
+                    _copy(cursor, f"COPY {qn(Logs._meta.db_table)} ({columns}) FROM STDIN", data)
+            IngestedSegment.objects.bulk_create([IngestedSegment(name=segment.stem, records=segmentRecords.__len__())
+                                                 for segment, segmentRecords in loaded])
+        return records.__len__()
+
+    def _discard(self, segments: list[Path]) -> None:
+        """
+        Delete ingested segments (durably), then forget their names
+        """
+        from canlog.models import IngestedSegment
+        for segment in segments:
+            segment.unlink(missing_ok=True)
+        _fsyncDirectory(self.directory)
+        IngestedSegment.objects.filter(name__in=[segment.stem for segment in segments]).delete()
+
+    def ingestOnce(self) -> int:
+        """
+        Load one batch of sealed segments
+        :return: Number of logs loaded. 0 if there was no sealed segment.
+        """
+        batch, size = list(), 0
+        for segment in self.sealedSegments():
+            batch.append(segment)
+            size += segment.stat().st_size
+            if size >= self.batchBytes:
+                break
+        if not batch:
+            return 0
+        try:
+            loaded = self._load(batch)
+        except _BAD_SEGMENT_ERRORS:
+            # One bad segment must not hold back the others: load them one by one, and set aside those that fail.
+            # Other errors (e.g. the database is unreachable) are raised: the segments are retried later.
+            loaded, good = 0, list()
+            for segment in batch:
+                try:
+                    loaded += self._load([segment])
+                    good.append(segment)
+                except _BAD_SEGMENT_ERRORS as _e:
+                    warnings.warn(f"canlog spool: segment {segment.name} set aside: {_e!r}", RuntimeWarning)
+                    segment.rename(segment.with_suffix(BAD_SUFFIX))
+            batch = good
+        self._discard(batch)
+        return loaded
+
+    def run(self, interval: float = None, once: bool = False) -> int:
+        """
+        Ingest until interrupted (or, if once, until no sealed segment is left)
+        :param interval: Seconds to wait when there is no sealed segment. If None, cfg.Spool.INGEST_INTERVAL
+        :return: Number of logs loaded
+        """
+        if interval is None: interval = cfg.Spool.INGEST_INTERVAL
+        if self._lockFile is None:
+            self.lock()
+        total = 0
+        while True:
+            self.recover()
+            try:
+                loaded = self.ingestOnce()
+            except (OperationalError, InterfaceError) as _e:
+                warnings.warn(f"canlog spool: database unavailable, retrying in {interval}s: {_e!r}", RuntimeWarning)
+                connection.close()
+                sleep(interval)
+                continue
+            total += loaded
+            if loaded == 0 and not self.sealedSegments():
+                if once:
+                    return total
+                sleep(interval)
+
+
+SPOOL_WRITER = SpoolWriter()
+LOG_PIPELINE.addPeriodic(SPOOL_WRITER.sealIfStale, cfg.Spool.SEGMENT_AGE)
+atexit.register(SPOOL_WRITER.seal)
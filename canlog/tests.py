@@ -1,3 +1,446 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 
 # Create your tests here.
+from canlog import *
+from canlog import common as _common
+from canlog import config as cfg
+from canlog import partitions, spool
+from canlog.capture import REDACTED, captureRequest, secretHash
+from canlog.fingerprint import fingerprint, messageTemplate, normaliseFrame
+from canlog.models import ExceptionModel, IngestedSegment, LogOrigin, Logs, RequestRollup
+from canlog.pipeline import LOG_PIPELINE, LogPipeline
+from canlog.rollup import RollupCounters
+from canlog.sampling import FirstPerMinuteSampling
+from django.db import connection
+from candb.models import Profile
+from django.test import RequestFactory
+from pathlib import Path
+from unittest import mock
+import json
+import tempfile
+import threading
+import time
+import zlib
+
+
+class FirstPerMinuteSamplingTests(SimpleTestCase):
+    def setUp(self):
+        self.minute = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+    def test_limit_per_origin_and_minute(self):
+        policy = FirstPerMinuteSampling(2)
+        self.assertEqual([policy.sample("a", self.minute + timedelta(seconds=n)) for n in range(3)], [True, True, False])
+        self.assertTrue(policy.sample("b", self.minute + timedelta(seconds=5)))
+        self.assertTrue(policy.sample("a", self.minute + timedelta(minutes=1)))
+
+    def test_late_log_of_past_minute_is_dropped(self):
+        policy = FirstPerMinuteSampling(2)
+        self.assertTrue(policy.sample("a", self.minute + timedelta(minutes=1)))
+        self.assertFalse(policy.sample("a", self.minute + timedelta(seconds=59)))
+
+    def test_zero_limit(self):
+        self.assertFalse(FirstPerMinuteSampling(0).sample("a", self.minute))
+        with self.assertRaises(ValueError):
+            FirstPerMinuteSampling(-1)
+
+
+class RequestRollupTests(TestCase):
+    @staticmethod
+    def _counters(requests: int, latency: float, bucket: int) -> RollupCounters:
+        counters = RollupCounters(2)
+        counters.requests = requests
+        counters.statuses[1] = requests
+        counters.latencyTotal = latency * requests
+        counters.latencyMaximum = latency
+        counters.latencyBuckets[bucket] = requests
+        return counters
+
+    def test_add_merges_with_stored_rollups(self):
+        minute = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+        RequestRollup.add({("origin", minute): self._counters(2, 5.0, 0)})
+        RequestRollup.add({("origin", minute): self._counters(3, 50.0, 2), ("other", minute): self._counters(1, 1.0, 0)})
+        rollup = RequestRollup.objects.get(origin="origin", minute=minute)
+        self.assertEqual((rollup.requests, rollup.status2xx, rollup.status5xx), (5, 5, 0))
+        self.assertEqual((rollup.latencyTotal, rollup.latencyMaximum), (160.0, 50.0))
+        self.assertEqual(rollup.latencyBuckets, [2, 0, 3])
+        self.assertEqual(RequestRollup.objects.get(origin="other", minute=minute).requests, 1)
+
+
+class _RecordingPipeline(LogPipeline):
+    """
+    Pipeline that records the batches it writes instead of inserting them. Batches holding a log in bad fail.
+    """
+    def __init__(self, *args, bad: Iterable[str] = (), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches: list[list[str]] = list()
+        self.bad = set(bad)
+        self.inserting = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def _insert(self, batch):
+        self.inserting.set()
+        self.release.wait(5)
+        if any(log in self.bad for log, _ in batch):
+            raise ValueError("bad log")
+        self.batches.append([log for log, _ in batch])
+
+
+class LogPipelineTests(SimpleTestCase):
+    def test_batches_by_size(self):
+        pipeline = _RecordingPipeline(batchSize=3, flushInterval=60)
+        for n in range(6):
+            pipeline.submit(f"log {n}")
+        self.assertTrue(pipeline.flush(5))
+        self.assertEqual(pipeline.batches, [["log 0", "log 1", "log 2"], ["log 3", "log 4", "log 5"]])
+        self.assertEqual({k: pipeline.stats()[k] for k in ("submitted", "written", "batches")}, {"submitted": 6, "written": 6, "batches": 2})
+        pipeline.close(5)
+
+    def test_batches_by_interval(self):
+        pipeline = _RecordingPipeline(batchSize=100, flushInterval=0.05)
+        pipeline.submit("log 0")
+        pipeline.submit("log 1")
+        deadline = time.monotonic() + 5
+        while not pipeline.batches and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(pipeline.batches, [["log 0", "log 1"]])
+        pipeline.close(5)
+
+    def test_drops_when_queue_full(self):
+        pipeline = _RecordingPipeline(queueSize=1, batchSize=1, enqueueTimeout=0)
+        pipeline.release.clear()
+        self.assertTrue(pipeline.submit("log 0"))
+        self.assertTrue(pipeline.inserting.wait(5))  # The thread holds log 0, so the queue is empty
+        self.assertTrue(pipeline.submit("log 1"))
+        self.assertFalse(pipeline.submit("log 2"))
+        self.assertEqual(pipeline.stats()["dropped"], 1)
+        pipeline.release.set()
+        pipeline.close(5)
+        self.assertEqual(pipeline.batches, [["log 0"], ["log 1"]])
+
+    def test_bad_batch_is_written_row_by_row(self):
+        pipeline = _RecordingPipeline(batchSize=3, bad=("bad",))
+        with self.assertWarns(RuntimeWarning):
+            for log in ("log 0", "bad", "log 2"):
+                pipeline.submit(log)
+            self.assertTrue(pipeline.flush(5))
+        self.assertEqual(pipeline.batches, [["log 0"], ["log 2"]])
+        self.assertEqual((pipeline.stats()["written"], pipeline.stats()["failed"]), (2, 1))
+        pipeline.close(5)
+
+    def test_close_drains_queue_and_runs_periodic_tasks(self):
+        pipeline = _RecordingPipeline(batchSize=100, flushInterval=60)
+        ran = list()
+        pipeline.addPeriodic(lambda: ran.append(True), 60)
+        for n in range(3):
+            pipeline.submit(f"log {n}")
+        pipeline.close(5)
+        self.assertEqual(pipeline.batches, [["log 0", "log 1", "log 2"]])
+        self.assertFalse(pipeline._thread.is_alive())
+        self.assertEqual(ran, [True])
+
+
+class IsEnabledTests(SimpleTestCase):
+    @mock.patch.object(cfg, "MINIMUM_SEVERITY_LEVEL", 5)
+    @mock.patch.object(cfg, "EVENT_SEVERITY_LEVELS", {_common.Event.API_REQUEST: 2})
+    def test_severity_levels(self):
+        self.assertTrue(Logs.isEnabled(_common.Event.API_REQUEST, 2))
+        self.assertFalse(Logs.isEnabled(_common.Event.API_REQUEST, 3))
+        self.assertTrue(Logs.isEnabled(_common.Event.API_REQUEST, None))
+        other = next(event for event in _common.EVENT_TO_NAME if event != _common.Event.API_REQUEST)
+        self.assertTrue(Logs.isEnabled(other, 5))
+        self.assertFalse(Logs.isEnabled(other, 6))
+
+    @mock.patch.object(cfg, "EVENT_SEVERITY_LEVELS", {_common.Event.API_REQUEST: 0})
+    def test_disabled_log_is_not_built(self):
+        additionalData = mock.Mock(return_value=dict())
+        self.assertIsNone(Logs.write(_common.LogType.Info, True, _common.Event.API_REQUEST, additionalData=additionalData, severity=1))
+        additionalData.assert_not_called()
+
+
+class CaptureRequestTests(SimpleTestCase):
+    TOKEN = "secret-jwt-token"
+
+    def _request(self):
+        factory = RequestFactory()
+        factory.cookies[GLOBAL_SETTINGS.REST_AUTH["JWT_AUTH_COOKIE"]] = self.TOKEN
+        return factory.post("/api/login/?next=/home&apiKey=query-secret", {"username": "someone", "password": "hunter2"},
+                            HTTP_AUTHORIZATION=f"Bearer {self.TOKEN}", HTTP_USER_AGENT="tests")
+
+    def test_secrets_are_redacted_or_hashed(self):
+        record = captureRequest(self._request(), _common.RequestCaptureProfile.Forensic)["request"]
+        dump = json.dumps(record)
+        for secret in (self.TOKEN, "hunter2", "query-secret"):
+            self.assertNotIn(secret, dump)
+        self.assertEqual(record["form"], {"username": "someone", "password": REDACTED})
+        self.assertEqual(record["query"], {"next": "/home", "apiKey": REDACTED})
+        self.assertEqual(record["headers"]["HTTP_AUTHORIZATION"], secretHash(f"Bearer {self.TOKEN}"))
+        self.assertIn(secretHash(self.TOKEN), record["cookies"].values())
+        self.assertEqual(record["headers"]["HTTP_USER_AGENT"], "tests")
+
+    def test_profiles_capture_only_their_parts(self):
+        record = captureRequest(self._request(), _common.RequestCaptureProfile.Standard)["request"]
+        self.assertIsNone(record["form"])
+        self.assertIsNone(record["cookies"])
+        self.assertNotIn("HTTP_AUTHORIZATION", record["headers"])
+        record = captureRequest(self._request(), _common.RequestCaptureProfile.Minimal)["request"]
+        self.assertEqual((record["query"], record["headers"]), (None, None))
+        with self.assertRaises(ValueError):
+            captureRequest(self._request(), "unknown")
+
+    def test_long_values_are_truncated(self):
+        request = RequestFactory().get("/api/", {"q": "x" * 1000})
+        record = captureRequest(request, _common.RequestCaptureProfile.Standard)["request"]
+        self.assertTrue(record["truncated"])
+        self.assertLess(record["query"]["q"].__len__(), 1000)
+
+
+class InternedNameTests(TestCase):
+    def setUp(self):
+        LogOrigin._cache.clear()
+
+    def test_intern_stores_each_name_once_and_caches_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ids = LogOrigin.intern(["a", "b", "a"])
+        self.assertEqual(set(ids), {"a", "b"})
+        self.assertEqual(dict(LogOrigin.objects.values_list("name", "id")), ids)
+        with self.assertNumQueries(0):
+            self.assertEqual(LogOrigin.intern(["a", "b"]), ids)
+        with self.assertNumQueries(1), self.captureOnCommitCallbacks(execute=True):
+            more = LogOrigin.intern(["a", "c"])
+        self.assertEqual(more["a"], ids["a"])
+        self.assertEqual(LogOrigin.objects.count(), 3)
+
+    def test_uncommitted_ids_are_not_cached(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            LogOrigin.intern(["a"])
+        self.assertNotIn("a", LogOrigin._cache)
+
+
+def _spooledLog(message: str, logUser: int = None) -> Logs:
+    log = Logs(logType=_common.LogType.Info, logEvent=_common.Event.API_REQUEST, logMessage=message,
+               logTime=datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc), additionalData={"n": 1})
+    log.logUser_id = logUser
+    log.originName = "tests"
+    return log
+
+
+class _SpoolTestMixin:
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        patcher = mock.patch.object(LOG_PIPELINE, "start")  # No pipeline thread: segments are sealed explicitly
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _segment(self, *logs: Logs) -> Path:
+        writer = spool.SpoolWriter(self.directory, segmentSize=1 << 20, segmentAge=3600, syncEachRecord=False)
+        for log in logs:
+            writer.append(log)
+        writer.seal()
+        (segment,) = self.directory.glob(f"*{spool.SEALED_SUFFIX}")
+        return segment
+
+
+class SpoolSegmentTests(_SpoolTestMixin, SimpleTestCase):
+    def test_segment_format(self):
+        path = self._segment(_spooledLog("first"), _spooledLog("second", logUser=7))
+        self.assertEqual(list(self.directory.glob(f"*{spool.OPEN_SUFFIX}")), list())
+        data = path.read_bytes()
+        self.assertTrue(data.startswith(spool.MAGIC))
+        length, crc = spool._HEADER.unpack_from(data, spool.MAGIC.__len__())
+        payload = data[spool.MAGIC.__len__() + spool._HEADER.size:][:length]
+        self.assertEqual(crc, zlib.crc32(payload))
+        self.assertEqual(json.loads(payload)["logMessage"], "first")
+        records = list(spool.readSegment(path))
+        self.assertEqual([(record["logMessage"], record["logUser"], record["origin"]) for record in records],
+                         [("first", None, "tests"), ("second", 7, "tests")])
+        self.assertEqual(records[0]["additionalData"], {"n": 1})
+
+    def test_not_a_segment(self):
+        path = self.directory / f"other{spool.SEALED_SUFFIX}"
+        path.write_bytes(b"something else")
+        with self.assertRaises(ValueError):
+            list(spool.readSegment(path))
+
+    def test_torn_tail_ends_segment(self):
+        path = self._segment(_spooledLog("first"), _spooledLog("second"))
+        data = path.read_bytes()
+        path.write_bytes(data[:-3])  # The writer crashed mid-record
+        with self.assertWarns(RuntimeWarning):
+            self.assertEqual([record["logMessage"] for record in spool.readSegment(path)], ["first"])
+        path.write_bytes(data[:-3] + b"xyz")  # Complete length, wrong CRC
+        with self.assertWarns(RuntimeWarning):
+            self.assertEqual([record["logMessage"] for record in spool.readSegment(path)], ["first"])
+
+
+class SpoolIngesterTests(_SpoolTestMixin, TestCase):
+    def test_ingest(self):
+        self._segment(_spooledLog("first"), _spooledLog("second"))
+        self.assertEqual(spool.SpoolIngester(self.directory).ingestOnce(), 2)
+        self.assertEqual(sorted(Logs.objects.values_list("logMessage", flat=True)), ["first", "second"])
+        self.assertEqual(Logs.objects.filter(origin__name="tests").count(), 2)
+        self.assertEqual(list(self.directory.glob(f"*{spool.SEALED_SUFFIX}")), list())
+        self.assertFalse(IngestedSegment.objects.exists())
+
+    def test_replay_after_crash_between_commit_and_delete(self):
+        segment = self._segment(_spooledLog("first"))
+        with mock.patch.object(spool.SpoolIngester, "_discard"):  # Crashed before deleting the segment
+            self.assertEqual(spool.SpoolIngester(self.directory).ingestOnce(), 1)
+        self.assertTrue(segment.exists())
+        self.assertTrue(IngestedSegment.objects.filter(name=segment.stem).exists())
+        self.assertEqual(spool.SpoolIngester(self.directory).ingestOnce(), 0)
+        self.assertFalse(segment.exists())
+        self.assertEqual(Logs.objects.count(), 1)
+        self.assertFalse(IngestedSegment.objects.exists())
+
+    def test_deleted_user_is_nulled(self):
+        profile = Profile.objects.create(username="spooled")
+        self._segment(_spooledLog("kept", logUser=profile.pk), _spooledLog("deleted", logUser=profile.pk + 1000))
+        self.assertEqual(spool.SpoolIngester(self.directory).ingestOnce(), 2)
+        self.assertEqual(dict(Logs.objects.values_list("logMessage", "logUser")), {"kept": profile.pk, "deleted": None})
+        self.assertEqual(list(self.directory.glob(f"*{spool.BAD_SUFFIX}")), list())
+
+
+class PartitionPeriodTests(SimpleTestCase):
+    DAY, MONTH = _common.PartitionInterval.Day, _common.PartitionInterval.Month
+
+    def test_period_start(self):
+        self.assertEqual(partitions.periodStart(datetime(2026, 3, 15, 18, tzinfo=TZ_INFO), self.DAY), datetime(2026, 3, 15, tzinfo=TZ_INFO))
+        self.assertEqual(partitions.periodStart(datetime(2026, 3, 15, 18, tzinfo=TZ_INFO), self.MONTH), datetime(2026, 3, 1, tzinfo=TZ_INFO))
+        # Already the next day in TZ_INFO
+        self.assertEqual(partitions.periodStart(datetime(2026, 2, 28, 20, tzinfo=timezone.utc), self.MONTH), datetime(2026, 3, 1, tzinfo=TZ_INFO))
+        with self.assertRaises(ValueError):
+            partitions.periodStart(datetime(2026, 1, 1, tzinfo=TZ_INFO), "week")
+
+    def test_next_period(self):
+        self.assertEqual(partitions.nextPeriod(datetime(2026, 1, 31, tzinfo=TZ_INFO), self.DAY), datetime(2026, 2, 1, tzinfo=TZ_INFO))
+        self.assertEqual(partitions.nextPeriod(datetime(2026, 1, 1, tzinfo=TZ_INFO), self.MONTH), datetime(2026, 2, 1, tzinfo=TZ_INFO))
+        self.assertEqual(partitions.nextPeriod(datetime(2026, 12, 1, tzinfo=TZ_INFO), self.MONTH), datetime(2027, 1, 1, tzinfo=TZ_INFO))
+        self.assertEqual(partitions.nextPeriod(datetime(2026, 12, 31, tzinfo=TZ_INFO), self.DAY), datetime(2027, 1, 1, tzinfo=TZ_INFO))
+
+    def test_daylight_saving_days(self):
+        # Australia/NSW: daylight saving starts on 4 October 2026 (a 23 hour day) and ends on 5 April 2026 (25 hours)
+        self.assertEqual(GLOBAL_SETTINGS.TIME_ZONE, "Australia/NSW")
+        for day, hours in ((datetime(2026, 10, 4, tzinfo=TZ_INFO), 23), (datetime(2026, 4, 5, tzinfo=TZ_INFO), 25)):
+            end = partitions.nextPeriod(day, self.DAY)
+            self.assertEqual((end.date(), end.hour), (day.date() + timedelta(days=1), 0))
+            self.assertEqual(end.astimezone(timezone.utc) - day.astimezone(timezone.utc), timedelta(hours=hours))
+            self.assertEqual(partitions.periodStart(end - timedelta(minutes=1), self.DAY), day)
+
+    def test_partition_name(self):
+        self.assertEqual(partitions.partitionName(datetime(2026, 3, 5, tzinfo=TZ_INFO), self.DAY), "canlog_logs_p20260305")
+        self.assertEqual(partitions.partitionName(datetime(2026, 3, 1, tzinfo=TZ_INFO), self.MONTH), "canlog_logs_p202603")
+        self.assertEqual(partitions.partitionName(datetime(2026, 3, 4, 13, tzinfo=timezone.utc), self.DAY), "canlog_logs_p20260305")
+
+    @mock.patch.object(cfg.Partitioning, "INTERVAL", _common.PartitionInterval.Day)
+    def test_create_future_partitions_skips_covered_periods(self):
+        day = lambda n: datetime(2026, 3, n, tzinfo=TZ_INFO)
+        existing = [
+            partitions.LogPartition(partitions.LEGACY_PARTITION, None, day(11), dict()),  # FROM (MINVALUE)
+            partitions.LogPartition(partitions.DEFAULT_PARTITION, None, None, dict()),
+            partitions.LogPartition("canlog_logs_p20260312", day(12), day(13), {None: "canlog_logs_p20260312_edefault"}),
+        ]
+        with mock.patch.object(partitions, "listPartitions", return_value=existing), \
+                mock.patch.object(partitions, "createPartition", side_effect=lambda start, conn=None: partitions.partitionName(start)) as create:
+            created = partitions.createFuturePartitions(now=datetime(2026, 3, 10, 12, tzinfo=TZ_INFO), ahead=3)
+        self.assertEqual([call.args[0] for call in create.call_args_list], [day(11), day(13)])
+        self.assertEqual(created, ["canlog_logs_p20260311", "canlog_logs_p20260313"])
+
+
+class PartitionTests(TestCase):
+    def test_create_partition(self):
+        start = datetime(2031, 1, 1, tzinfo=TZ_INFO)
+        waiting = Logs.objects.create(logType=_common.LogType.Info, logEvent=_common.Event.API_REQUEST, logMessage="waiting",
+                                      logUser=None, logTime=start + timedelta(hours=12))
+        name = partitions.createPartition(start, _common.PartitionInterval.Day)
+        self.assertEqual(name, "canlog_logs_p20310101")
+        self.assertIsNone(partitions.createPartition(start, _common.PartitionInterval.Day))
+        (partition,) = [p for p in partitions.listPartitions() if p.name == name]
+        self.assertEqual((partition.start, partition.end), (start, datetime(2031, 1, 2, tzinfo=TZ_INFO)))
+        self.assertEqual(set(partition.subPartitions), {*cfg.Partitioning.EVENT_RETENTION, None})
+        # The log waiting in the default partition was moved into its sub-partition
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT "id" FROM {qn(partition.subPartitions[_common.Event.API_REQUEST])}')
+            self.assertEqual(cursor.fetchall(), [(waiting.id,)])
+            cursor.execute(f'SELECT count(*) FROM {qn(partitions.DEFAULT_PARTITION)} WHERE "id" = %s', [waiting.id])
+            self.assertEqual(cursor.fetchone()[0], 0)
+        with self.assertRaises(ValueError):
+            partitions.createPartition(start + timedelta(hours=1), _common.PartitionInterval.Day)
+
+    @mock.patch.multiple(cfg.Partitioning, DEFAULT_RETENTION=timedelta(days=365), EVENT_RETENTION={_common.Event.API_REQUEST: timedelta(days=30)},
+                         EXPIRED_ACTION=_common.ExpiredPartitionAction.Drop,
+                         EVENT_EXPIRED_ACTIONS={_common.Event.API_REQUEST: _common.ExpiredPartitionAction.Archive})
+    def test_expire_partitions_dry_run(self):
+        now = datetime(2026, 6, 1, tzinfo=TZ_INFO)
+        subPartitions = lambda name: {_common.Event.API_REQUEST: f"{name}_e{_common.Event.API_REQUEST}", None: f"{name}_edefault"}
+        existing = [
+            partitions.LogPartition(partitions.LEGACY_PARTITION, None, now - timedelta(days=400), dict()),
+            partitions.LogPartition(partitions.DEFAULT_PARTITION, None, None, dict()),
+            partitions.LogPartition("old", now - timedelta(days=401), now - timedelta(days=400), subPartitions("old")),
+            partitions.LogPartition("recent", now - timedelta(days=41), now - timedelta(days=40), subPartitions("recent")),
+            partitions.LogPartition("current", now - timedelta(days=10), now - timedelta(days=9), subPartitions("current")),
+        ]
+        with mock.patch.object(partitions, "listPartitions", return_value=existing):
+            expired = partitions.expirePartitions(now=now, dryRun=True)  # Nothing is executed: none of these tables exist
+        Drop, Archive = _common.ExpiredPartitionAction.Drop, _common.ExpiredPartitionAction.Archive
+        self.assertEqual(expired, [
+            (partitions.LEGACY_PARTITION, Drop),  # Expires with the longest retention
+            (f"old_e{_common.Event.API_REQUEST}", Archive), ("old_edefault", Drop), ("old", Drop),  # No sub-partition left
+            (f"recent_e{_common.Event.API_REQUEST}", Archive),  # Only the event with a shorter retention
+        ])
+
+
+class FingerprintTests(SimpleTestCase):
+    FRAME = '  File "{base}/candb/models.py", line {line}, in checkStock\n    raise ValueError(message)\n'
+
+    def test_normalise_frame(self):
+        frame = self.FRAME.format(base=BASE_DIR, line=120)
+        self.assertEqual(normaliseFrame(frame), "candb/models.py:checkStock:raise ValueError(message)")
+        self.assertEqual(normaliseFrame('  File "/usr/lib/python3.12/site-packages/django/db/utils.py", line 91, in __exit__\n    raise dj_exc_value\n'),
+                         "django/db/utils.py:__exit__:raise dj_exc_value")
+        self.assertEqual(normaliseFrame("  not\n a frame "), "not a frame")
+
+    def test_message_template(self):
+        self.assertEqual(messageTemplate("product 42 has 3.5 left"), "product <n> has <n> left")
+        self.assertEqual(messageTemplate("no order 0b6f6a5e-5e1a-4c1e-9d7e-2a8c1f3b9d10 at 0x7f3a2c"), "no order <uuid> at <hex>")
+        self.assertEqual(messageTemplate("unknown field 'colour' or \"size\""),"unknown field <str> or <str>")
+        self.assertEqual(messageTemplate("can't find the user's basket 'main'"), "can't find the user's basket <str>")
+
+    def test_fingerprint(self):
+        frames = lambda line: [self.FRAME.format(base=BASE_DIR, line=line)]
+        same = fingerprint("builtins.ValueError", frames(120), "product 42 is out of stock")
+        # Only the line number and the variable parts of the message differ
+        self.assertEqual(fingerprint("builtins.ValueError", frames(135), "product 7 is out of stock"), same)
+        self.assertNotEqual(fingerprint("builtins.KeyError", frames(120), "product 42 is out of stock"), same)
+        self.assertNotEqual(fingerprint("builtins.ValueError", frames(120), "product 42 is discontinued"), same)
+        self.assertRegex(same, r"^[0-9a-f]{64}$")
+
+
+class ExceptionRecordTests(TestCase):
+    @staticmethod
+    def _occurrence(productID: int, seen: datetime) -> ExceptionModel:
+        try:
+            raise ValueError(f"product {productID} is out of stock")
+        except ValueError as exception:
+            return ExceptionModel.fromException(exception, seen)
+
+    def test_record_merges_occurrences(self):
+        start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        batch = [self._occurrence(n, start + timedelta(minutes=n)) for n in (5, 1, 9)]
+        self.assertEqual(batch[0].fingerprint, batch[2].fingerprint)
+        ids = ExceptionModel.record(batch)
+        self.assertEqual(list(ids), [batch[0].fingerprint])
+        row = ExceptionModel.objects.get()
+        self.assertEqual((row.id, row.occurrences), (ids[row.fingerprint], 3))
+        self.assertEqual((row.firstSeen, row.lastSeen), (start + timedelta(minutes=1), start + timedelta(minutes=9)))
+        self.assertEqual(row.message, "product 5 is out of stock")  # The first occurrence
+        self.assertEqual(row.exceptionClass.name, "builtins.ValueError")
+        # A later batch only counts and widens
+        self.assertEqual(ExceptionModel.record([self._occurrence(2, start - timedelta(hours=1)), self._occurrence(3, start + timedelta(hours=1))]), ids)
+        row.refresh_from_db()
+        self.assertEqual((row.occurrences, row.firstSeen, row.lastSeen), (5, start - timedelta(hours=1), start + timedelta(hours=1)))
+        self.assertEqual(ExceptionModel.record([]), dict())
@@ -1,6 +1,12 @@
 from capi import *
 from capi import serializers as modelSerializers
 from candb.models import Profile, Order, OrderLine, Product
+from candb.availabilityCalendar import buildAvailabilityCalendar
+from candb.retry import RETRY_METRICS
+from candb import config as candbConfig
+from canlog.query import LogQuery, pageLogs
+from canlog.export import exportLogs, CONTENT_TYPES as EXPORT_CONTENT_TYPES
+from canlog.common import ExportFormat
 from capi.security import apiMethod
 from capi.common import StandardResponse
 from rest_framework.authtoken.models import Token
@@ -8,6 +14,8 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import viewsets, generics, mixins
 from rest_framework.authentication import TokenAuthentication
+from django.http import Http404, StreamingHttpResponse
+import re
 
 
 class ProfileViewSet(viewsets.ModelViewSet):
@@ -31,9 +39,118 @@ class OrderViewSet(viewsets.GenericViewSet, generics.RetrieveUpdateDestroyAPIVie
     queryset = Order.objects.all().order_by('-orderTime')
     serializer_class = modelSerializers.OrderSerializer
 
+    def get_object(self: Self) -> Order:
+        # Orders are addressed as ORDER-<uuid> at the API boundary
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        try:
+            self.kwargs[lookup] = Order.parseID(self.kwargs[lookup])
+        except (TypeError, ValueError):
+            raise Http404
+        return super().get_object()
+
     permission_classes = [permissions.IsAuthenticated, ]
 
 
+class AvailabilityCalendarView(APIView):
+    """
+    API endpoint for the availability calendar of the whole catalog: which products are sellable in each slot.
+    Query parameters: days, slotMinutes, quantity.
+    """
+    permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+
+    def get(self: Self, request: HttpRequest) -> Response:
+        try:
+            horizon = timedelta(days=float(request.query_params.get("days", candbConfig.AvailabilityCalendar.DEFAULT_HORIZON / timedelta(days=1))))
+            slotLength = timedelta(minutes=float(request.query_params.get("slotMinutes", candbConfig.AvailabilityCalendar.DEFAULT_SLOT_LENGTH / timedelta(minutes=1))))
+            quantity = int(request.query_params.get("quantity", 1))
+            calendar = buildAvailabilityCalendar(horizon=horizon, slotLength=slotLength, quantityRequired=quantity)
+        except ValueError as _e:
+            return Response({"detail": _e.__str__()}, status=400)
+        return Response(calendar.asDict())
+
+
+class RetryMetricsView(APIView):
+    """
+    API endpoint for the conflict retry metrics of this process, per model (see candb.retry)
+    """
+    permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+
+    def get(self: Self, request: HttpRequest) -> Response:
+        return Response(RETRY_METRICS.snapshot())
+
+
+# A "+HH:MM" offset that was not percent-encoded arrives with the "+" decoded as a space
+_UNENCODED_OFFSET = re.compile(r"(.*[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?) (\d{2}:?\d{2})")
+
+
+def _time(value: str | None) -> datetime | None:
+    """
+    Parse an ISO 8601 time from a query parameter. Times without an offset are in TZ_INFO; "Z" is UTC, and an
+    unencoded "+HH:MM" offset (a trailing " HH:MM") is accepted too.
+    :raise ValueError: The time is invalid
+    """
+    if value is None:
+        return None
+    unencoded = _UNENCODED_OFFSET.fullmatch(value)
+    if unencoded is not None:
+        value = f"{unencoded.group(1)}+{unencoded.group(2)}"
+    time = datetime.fromisoformat(value)
+    return time if time.tzinfo is not None else time.replace(tzinfo=TZ_INFO)
+
+
+def _logQuery(params) -> LogQuery:
+    """
+    LogQuery of the query parameters logType and logEvent (comma-separated), logUser (user ID), origin, since and until
+    (ISO 8601 times)
+    :raise ValueError: A parameter is invalid
+    """
+    return LogQuery(
+        logTypes=tuple(params["logType"].split(",")) if "logType" in params else None,
+        logEvents=tuple(int(event) for event in params["logEvent"].split(",")) if "logEvent" in params else None,
+        logUser=int(params["logUser"]) if "logUser" in params else None,
+        origin=params.get("origin"),
+        since=_time(params.get("since")),
+        until=_time(params.get("until")),
+    )
+
+
+class LogsView(APIView):
+    """
+    API endpoint for staff to query the logs, newest first, with keyset pagination (see canlog.query).
+    Query parameters: the filters of _logQuery, limit, cursor (next of the previous page).
+    """
+    permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+
+    def get(self: Self, request: HttpRequest) -> Response:
+        params = request.query_params
+        try:
+            page = pageLogs(_logQuery(params), cursor=params.get("cursor"), limit=int(params["limit"]) if "limit" in params else None)
+        except ValueError as _e:
+            return Response({"detail": _e.__str__()}, status=400)
+        return Response({"results": modelSerializers.LogSerializer(page.logs, many=True).data, "next": page.next})
+
+
+class LogExportView(APIView):
+    """
+    API endpoint for staff to download the logs, with their exceptions, streamed (see canlog.export).
+    Query parameters: the filters of _logQuery, exportFormat (ndjson or csv), gzip (1 to compress). Not "format": REST
+    framework reads it as the renderer to use (URL_FORMAT_OVERRIDE), and answers 404 for csv and ndjson.
+    """
+    permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+
+    def get(self: Self, request: HttpRequest) -> HttpResponse:
+        params = request.query_params
+        exportFormat = params.get("exportFormat", ExportFormat.NDJSON)
+        compress = params.get("gzip") in ("1", "true")
+        try:
+            stream = exportLogs(_logQuery(params), exportFormat, compress)
+        except ValueError as _e:
+            return Response({"detail": _e.__str__()}, status=400)
+        response = StreamingHttpResponse(stream, content_type="application/gzip" if compress else EXPORT_CONTENT_TYPES[exportFormat])
+        response["Content-Disposition"] = f'attachment; filename="logs.{exportFormat}{".gz" if compress else ""}"'
+        return response
+
+
 # Create your views here.
 # class RouterBase:
 #     name = "RouterBase"
@@ -1,10 +1,14 @@
 from capi import *
 from capi.common import StandardResponse
 from canlog.models import Logs
+from canlog import config as canlogConfig
+from canlog.rollup import REQUEST_ROLLUPS
+from time import perf_counter
 
 
 def apiMethod(allowMethods: set[str], requireLogin: bool = True, expectPermissions: set[str] = None,
-              expectGroup: set[str] = None, logEvents: set[Event] = None, logMessage: str | bool = True) -> Callable:
+              expectGroup: set[str] = None, logEvents: set[Event] = None, logMessage: str | bool = True,
+              captureProfile: str = None) -> Callable:
     """
     Decorator for API methods to enforce security and logging.
 
@@ -12,20 +16,56 @@ def apiMethod(allowMethods: set[str], requireLogin: bool = True, expectPermissio
     :param requireLogin: If the user must login to access the API. If True, the user must be logged in. If False, the user must not be logged in.
     :param expectPermissions: The permission(s) the user must have to access the API. Not used if requireLogin is False.
     :param expectGroup: The group(s) the user must be in to access the API. Not used if requireLogin is False.
-    :param logEvents: The events that must occur to write a log
+    :param logEvents: The events that must occur to write a log. If None, canlog.config.DEFAULT_LOG_SET.
     :param logMessage: The message to log. Use True for auto.
+    :param captureProfile: What is captured of the request in the log. If None, canlog.config.RequestCapture.PROFILE.
     :return: The decorator
     """
 
+    if logEvents is None:
+        logEvents = canlogConfig.DEFAULT_LOG_SET
+    logRequests = Event.API_REQUEST in logEvents
+    requestSeverity = 4
+
     def decorator(func: Callable) -> Callable:
+        origin = f"{func.__module__}.{func.__name__}"
+
         @wraps(func)
         def wrapper(request: HttpRequest, *args: Any, **kwargs: Any) -> Any:
-            nonlocal logMessage
-            if Event.API_REQUEST in logEvents:
-                Logs.writeRequest(request=request, logType=LogType.Info, logMessage=logMessage,  # where logMessage is True, autohandled by Logs.writeRequest
-                                  logUser=request.user if not (
-                                              request.user.is_anonymous or not request.user.is_authenticated) else None,
-                                  event=Event.API_REQUEST, origin=f"{func.__module__}.{func.__name__}", severity=4)
+            if not logRequests:
+                return handle(request, *args, **kwargs)
+            startTime = datetime.now(tz=TZ_INFO)
+            started = perf_counter()
+            status, exception = 500, None
+            try:
+                response = handle(request, *args, **kwargs)
+                status = getattr(response, "status_code", 200)
+                return response
+            except Exception as _e:
+                exception = _e
+                raise
+            finally:
+                latency = perf_counter() - started
+                # Every request is counted in the rollups; its log is sampled (see canlog.sampling), unless it failed.
+                # Logging never changes the result of the API method.
+                try:
+                    REQUEST_ROLLUPS.record(origin, status, latency, startTime)
+                except Exception as _e:
+                    warnings.warn(f"capi: request not counted in the rollups: {_e!r}", RuntimeWarning)
+                try:
+                    if Logs.isEnabled(Event.API_REQUEST, requestSeverity):
+                        Logs.writeRequest(request=request, logType=LogType.Error if status >= 500 else LogType.Info,
+                                          logMessage=logMessage,  # where logMessage is True, autohandled by Logs.writeRequest
+                                          logUser=request.user if not (
+                                                      request.user.is_anonymous or not request.user.is_authenticated) else None,
+                                          event=Event.API_REQUEST, origin=origin, exceptionObject=exception,
+                                          additionalData={"status": status, "latencyMs": round(latency * 1000, 3)},
+                                          customTime=startTime, severity=requestSeverity, captureProfile=captureProfile,
+                                          sample=status < canlogConfig.Sampling.ALWAYS_LOG_STATUS)
+                except Exception as _e:
+                    warnings.warn(f"capi: request not logged: {_e!r}", RuntimeWarning)
+
+        def handle(request: HttpRequest, *args: Any, **kwargs: Any) -> Any:
             if request.method not in allowMethods:
                 return StandardResponse.MethodNotAllowed(expected_methods=allowMethods)
             if requireLogin:
@@ -1,5 +1,26 @@
 from . import *
 from candb.models import Profile, Order, OrderLine, Product
+from candb.common import formatPrefixedID, parsePrefixedID
+from canlog.models import Logs
+
+
+class PrefixedIDField(rest_serializers.Field):
+    """
+    UUID primary key shown with its model's prefix (e.g., ORDER-<uuid>). The prefix is only used at the API boundary.
+    """
+    def __init__(self, prefix: str, **kwargs):
+        self.prefix = prefix
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return formatPrefixedID(self.prefix, value)
+
+    def to_internal_value(self, data):
+        try:
+            return parsePrefixedID(self.prefix, data)
+        except (TypeError, ValueError):
+            raise rest_serializers.ValidationError(f"must be an ID of the form {self.prefix}<uuid>")
+
 
 class ProfileSerializer(rest_serializers.HyperlinkedModelSerializer):
     class Meta:
@@ -7,6 +28,16 @@ class ProfileSerializer(rest_serializers.HyperlinkedModelSerializer):
         fields = ['username', 'first_name', 'last_name']
 
 class OrderSerializer(rest_serializers.ModelSerializer):
+    id = PrefixedIDField(Order.ID_PREFIX, read_only=True)
+
     class Meta:
         model = Order
         fields = ['id', 'orderTime', 'totalCost', 'notes', 'user']
+
+
+class LogSerializer(rest_serializers.ModelSerializer):
+    origin = rest_serializers.SlugRelatedField(slug_field="name", read_only=True)
+
+    class Meta:
+        model = Logs
+        fields = ['id', 'logTime', 'logType', 'logEvent', 'logMessage', 'logUser', 'origin', 'exceptionObject', 'additionalData']
@@ -1,3 +1,107 @@
 from django.test import TestCase
 
 # Create your tests here.
+from capi import *
+from candb.models import Profile
+from canlog.common import Event, LogType
+from canlog.models import Logs
+from rest_framework.test import APIClient
+import csv
+import gzip
+import io
+import json
+
+
+class LogsViewTests(TestCase):
+    URL = "/api/v1/logs/"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = Profile.objects.create(username="logs-staff", is_staff=True)
+        cls.user = Profile.objects.create(username="logs-user")
+        start = datetime(2026, 1, 1, 0, 0, tzinfo=timezone.utc)
+        Logs.objects.bulk_create([Logs(logType=LogType.Error if n % 2 else LogType.Info, logEvent=Event.API_REQUEST,
+                                       logMessage=f"log {n}", logUser=cls.user if n < 2 else None, logTime=start + timedelta(hours=n))
+                                  for n in range(5)])
+        cls.start = start
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def _messages(self, response) -> list[str]:
+        self.assertEqual(response.status_code, 200, response.content)
+        return [log["logMessage"] for log in response.json()["results"]]
+
+    def test_staff_only(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(self.URL).status_code, 403)
+
+    def test_filters(self):
+        self.assertEqual(self._messages(self.client.get(self.URL)), ["log 4", "log 3", "log 2", "log 1", "log 0"])
+        self.assertEqual(self._messages(self.client.get(self.URL, {"logType": LogType.Error})), ["log 3", "log 1"])
+        self.assertEqual(self._messages(self.client.get(self.URL, {"logUser": self.user.pk})), ["log 1", "log 0"])
+        self.assertEqual(self._messages(self.client.get(self.URL, {"since": "2026-01-01T01:00:00Z", "until": "2026-01-01T03:00:00Z"})),
+                         ["log 2", "log 1"])
+
+    def test_unencoded_offset(self):
+        # "+" is not percent-encoded here, so it arrives as a space
+        self.assertEqual(self._messages(self.client.get(f"{self.URL}?since=2026-01-01T13:00:00+10:00")), ["log 4", "log 3"])
+
+    def test_cursor_round_trip(self):
+        messages, cursor = list(), None
+        for _ in range(3):
+            response = self.client.get(self.URL, {"limit": 2, **({"cursor": cursor} if cursor else dict())})
+            messages.extend(self._messages(response))
+            cursor = response.json()["next"]
+            if cursor is None:
+                break
+        self.assertIsNone(cursor)
+        self.assertEqual(messages, ["log 4", "log 3", "log 2", "log 1", "log 0"])
+
+    def test_invalid_parameters(self):
+        for params in ({"cursor": "not-a-cursor"}, {"limit": 0}, {"since": "yesterday"}, {"logEvent": "x"}):
+            self.assertEqual(self.client.get(self.URL, params).status_code, 400, params)
+
+
+class LogExportViewTests(TestCase):
+    URL = "/api/v1/logs/export/"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = Profile.objects.create(username="export-staff", is_staff=True)
+        start = datetime(2026, 1, 1, 0, 0, tzinfo=timezone.utc)
+        Logs.objects.bulk_create([Logs(logType=LogType.Info, logEvent=Event.API_REQUEST, logMessage=f"log {n}\twith, \"quotes\"",
+                                       logUser=None, logTime=start + timedelta(hours=n), additionalData={"n": n}) for n in range(3)])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def _export(self, exportFormat: str, compress: bool) -> tuple[str, str]:
+        params = {"exportFormat": exportFormat, **({"gzip": "1"} if compress else dict())}
+        response = self.client.get(self.URL, params)
+        self.assertEqual(response.status_code, 200)
+        body = b"".join(response.streaming_content)
+        return response["Content-Type"], (gzip.decompress(body) if compress else body).decode()
+
+    def test_ndjson(self):
+        for compress in (False, True):
+            with self.subTest(compress=compress):
+                contentType, text = self._export("ndjson", compress)
+                self.assertEqual(contentType, "application/gzip" if compress else "application/x-ndjson")
+                records = [json.loads(line) for line in text.splitlines()]
+                self.assertEqual([record["additionalData"] for record in records], [{"n": 2}, {"n": 1}, {"n": 0}])
+                self.assertEqual(records[0]["logMessage"], 'log 2\twith, "quotes"')
+
+    def test_csv(self):
+        for compress in (False, True):
+            with self.subTest(compress=compress):
+                contentType, text = self._export("csv", compress)
+                self.assertEqual(contentType, "application/gzip" if compress else "text/csv")
+                rows = list(csv.DictReader(io.StringIO(text)))
+                self.assertEqual([json.loads(row["additionalData"]) for row in rows], [{"n": 2}, {"n": 1}, {"n": 0}])
+                self.assertEqual(rows[0]["logMessage"], 'log 2\twith, "quotes"')
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get(self.URL, {"exportFormat": "xml"}).status_code, 400)
@@ -10,6 +10,10 @@ ROUTER.register(r'orders', apis.OrderViewSet)
 # Additionally, we include login URLs for the browsable API.
 urlpatterns = [
     path("auth/", include("dj_rest_auth.urls")),
+    path("availability/calendar/", apis.AvailabilityCalendarView.as_view()),
+    path("metrics/retries/", apis.RetryMetricsView.as_view()),
+    path("logs/", apis.LogsView.as_view()),
+    path("logs/export/", apis.LogExportView.as_view()),
     path('', include(ROUTER.urls)),
 ]
 # urlpatterns = [